@@ -1,22 +1,12 @@
-from accounts.models import OrganizationMembership
-from accounts.services import normalize_role
+from accounts.services import request_membership
 
 
 def current_membership(request):
-    if not request.user.is_authenticated:
+    current = request_membership(request)
+    if current.membership is None:
         return {}
-
-    membership = (
-        OrganizationMembership.objects.select_related("organization")
-        .filter(user=request.user)
-        .first()
-    )
-    if not membership:
-        return {}
-
-    role = normalize_role(membership.role)
     return {
-        "active_membership": membership,
-        "active_organization": membership.organization,
-        "active_role": role,
+        "active_membership": current.membership,
+        "active_organization": current.organization,
+        "active_role": current.role,
     }
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.services import rebuild_organization_closure
+
+
+class Command(BaseCommand):
+    help = "Rebuild the organization ancestry table from Organization.parent."
+
+    def handle(self, *args, **options):
+        written = rebuild_organization_closure()
+        self.stdout.write(f"Wrote {written} closure rows.")
@@ -0,0 +1,10 @@
+from .services import RequestMembership
+
+
+class MembershipMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.membership = RequestMembership(request)
+        return self.get_response(request)
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FILL_CLOSURE_SQL = """
+    WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM accounts_organization
+        UNION ALL
+        SELECT tree.ancestor_id, organization.id, tree.depth + 1
+        FROM tree JOIN accounts_organization organization ON organization.parent_id = tree.descendant_id
+    )
+    INSERT INTO accounts_organizationclosure (ancestor_id, descendant_id, depth)
+    SELECT ancestor_id, descendant_id, depth FROM tree
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_organizationmembership_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='accounts.organization')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='accounts.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='accounts_closure_unique_pair')],
+            },
+        ),
+        migrations.RunSQL(FILL_CLOSURE_SQL, migrations.RunSQL.noop),
+    ]
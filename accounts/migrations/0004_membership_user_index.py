@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_organization_closure'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='organizationmembership',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='organizationmembership',
+            index=models.Index(fields=['user', 'id'], name='accounts_membership_user'),
+        ),
+    ]
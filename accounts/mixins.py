@@ -1,7 +1,7 @@
 from django.contrib.auth.mixins import AccessMixin
 from django.core.exceptions import PermissionDenied
 
-from accounts.services import get_active_membership, normalize_role
+from accounts.services import request_membership
 
 
 class OrganizationScopedMixin(AccessMixin):
@@ -11,8 +11,11 @@ class OrganizationScopedMixin(AccessMixin):
     def setup_membership(self, request):
         if not request.user.is_authenticated:
             return self.handle_no_permission()
-        self.membership = get_active_membership(request.user)
-        self.organization = self.membership.organization
+        current = request_membership(request)
+        if current.membership is None:
+            raise PermissionDenied("User has no organization membership.")
+        self.membership = current.membership
+        self.organization = current.organization
         return None
 
     def dispatch(self, request, *args, **kwargs):
@@ -28,13 +31,14 @@ class OrganizationScopedMixin(AccessMixin):
 
 class RoleRequiredMixin(OrganizationScopedMixin):
     required_roles = set()
+    # Members of a subcontractor organization pass whatever their role.
+    allow_subcontractors = False
 
     def dispatch(self, request, *args, **kwargs):
         response = self.setup_membership(request)
         if response is not None:
             return response
-        if self.required_roles:
-            role = normalize_role(self.membership.role)
-            if role not in self.required_roles:
+        if self.required_roles and not (self.allow_subcontractors and self.organization.is_subcontractor):
+            if request_membership(request).role not in self.required_roles:
                 raise PermissionDenied("User role is not allowed for this action.")
         return self.dispatch_with_membership(request, *args, **kwargs)
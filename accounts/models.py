@@ -2,6 +2,7 @@ from datetime import timedelta
 import uuid
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 
@@ -27,6 +28,31 @@ class Organization(models.Model):
     def is_subcontractor(self) -> bool:
         return self.parent_id is not None
 
+    def clean(self):
+        if self.pk and self.parent_id and OrganizationClosure.objects.filter(
+            ancestor_id=self.pk, descendant_id=self.parent_id
+        ).exists():
+            raise ValidationError({"parent": "An organization cannot be placed under its own subcontractor."})
+
+
+class OrganizationClosure(models.Model):
+    # One row per (ancestor, descendant) pair, including every organization
+    # with itself at depth 0, so "an organization and all its subcontractors"
+    # is one indexed join. Maintained by accounts.signals.
+    ancestor = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="descendant_links", db_index=False
+    )
+    descendant = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="ancestor_links")
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="accounts_closure_unique_pair")
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
+
 
 class OrganizationRole(models.TextChoices):
     CEO = "CEO", "CEO"
@@ -40,13 +66,18 @@ class OrganizationRole(models.TextChoices):
 
 
 class OrganizationMembership(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="memberships")
+    # Covered by the (user, id) index: the per-request lookup takes the
+    # user's first membership by primary key.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="memberships", db_index=False
+    )
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="memberships")
     role = models.CharField(max_length=40, choices=OrganizationRole.choices)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ("user", "organization")
+        indexes = [models.Index(fields=["user", "id"], name="accounts_membership_user")]
 
     def __str__(self) -> str:
         return f"{self.user} -> {self.organization} ({self.role})"
@@ -1,18 +1,96 @@
+import time
+from typing import Optional
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import PermissionDenied
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-from .models import OrganizationMembership, OrganizationRole
+from .models import Organization, OrganizationClosure, OrganizationMembership, OrganizationRole
 
 User = get_user_model()
 
+MEMBERSHIP_CACHE_PREFIX = "accounts:membership"
+MISSING = object()
+
 
 def get_active_membership(user) -> OrganizationMembership:
-    membership = OrganizationMembership.objects.select_related("organization").filter(user=user).first()
+    membership = load_membership(user)
     if not membership:
         raise PermissionDenied("User has no organization membership.")
     return membership
 
 
+def membership_cache():
+    # None unless settings.MEMBERSHIP_CACHE names a cache shared by every
+    # process; a version bump in a per-process cache would leave the other
+    # workers serving revoked access.
+    return caches[settings.MEMBERSHIP_CACHE] if settings.MEMBERSHIP_CACHE else None
+
+
+def load_membership(user) -> Optional[OrganizationMembership]:
+    # Cached per user under a version that bump_membership_version replaces,
+    # so membership and organization changes apply on the next request. The
+    # version is a timestamp, so an evicted version key never comes back with
+    # a value that matches older entries.
+    memberships = OrganizationMembership.objects.select_related("organization").filter(user=user)
+    cache = membership_cache()
+    if cache is None:
+        return memberships.first()
+    version = cache.get_or_set(f"{MEMBERSHIP_CACHE_PREFIX}:version:{user.pk}", time.time_ns, timeout=None)
+    key = f"{MEMBERSHIP_CACHE_PREFIX}:{user.pk}:{version}"
+    membership = cache.get(key, MISSING)
+    if membership is MISSING:
+        membership = memberships.first()
+        cache.set(key, membership, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return membership
+
+
+def bump_membership_version(*user_ids: int) -> None:
+    # Bumped once the change commits: a request reading the old rows before
+    # then caches them under the version that is about to be replaced.
+    cache = membership_cache()
+    if cache is None:
+        return
+
+    def bump():
+        version = time.time_ns()
+        cache.set_many({f"{MEMBERSHIP_CACHE_PREFIX}:version:{user_id}": version for user_id in user_ids}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+class RequestMembership:
+    # Membership, organization and normalized role of the request's user,
+    # loaded on first use and shared by the mixins and the context processor.
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def membership(self) -> Optional[OrganizationMembership]:
+        user = self.request.user
+        return load_membership(user) if user.is_authenticated else None
+
+    @property
+    def organization(self):
+        return self.membership.organization if self.membership else None
+
+    @property
+    def role(self) -> Optional[str]:
+        return normalize_role(self.membership.role) if self.membership else None
+
+
+def request_membership(request) -> RequestMembership:
+    # MembershipMiddleware attaches one per request; requests built without
+    # the middleware (e.g. RequestFactory) get one on first use.
+    if not hasattr(request, "membership"):
+        request.membership = RequestMembership(request)
+    return request.membership
+
+
 def get_construction_manager_queryset(organization):
     roles = [
         OrganizationRole.CONSTRUCTION_MANAGER,
@@ -31,3 +109,94 @@ ROLE_NORMALIZATION = {
 
 def normalize_role(role: str) -> str:
     return ROLE_NORMALIZATION.get(role, role)
+
+
+REBUILD_CLOSURE_SQL = """
+    WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM accounts_organization
+        UNION ALL
+        SELECT tree.ancestor_id, organization.id, tree.depth + 1
+        FROM tree JOIN accounts_organization organization ON organization.parent_id = tree.descendant_id
+    )
+    INSERT INTO accounts_organizationclosure (ancestor_id, descendant_id, depth)
+    SELECT ancestor_id, descendant_id, depth FROM tree
+"""
+
+
+def in_hierarchy(organization: Organization, field: str = "organization") -> Q:
+    # Filter for rows whose ``field`` is the organization or one of its
+    # subcontractors at any depth, e.g.
+    # Order.objects.filter(in_hierarchy(org, "construction__organization")).
+    return Q(**{f"{field}__ancestor_links__ancestor": organization})
+
+
+def add_to_hierarchy(organization: Organization) -> None:
+    # A new organization links to itself and to every ancestor of its parent.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO accounts_organizationclosure (ancestor_id, descendant_id, depth)
+            SELECT %(pk)s, %(pk)s, 0
+            UNION ALL
+            SELECT ancestor_id, %(pk)s, depth + 1 FROM accounts_organizationclosure WHERE descendant_id = %(parent)s
+            """,
+            {"pk": organization.pk, "parent": organization.parent_id},
+        )
+
+
+def check_hierarchy_move(organization: Organization) -> None:
+    # Runs before the organization row is saved, so a rejected move leaves
+    # both the parent and the closure table as they were.
+    if organization.pk and organization.parent_id and OrganizationClosure.objects.filter(
+        ancestor_id=organization.pk, descendant_id=organization.parent_id
+    ).exists():
+        raise ValidationError("An organization cannot be placed under its own subcontractor.")
+
+
+def move_in_hierarchy(organization: Organization) -> None:
+    # Detaches the organization's subtree from its old ancestors and links it
+    # under every ancestor of the new parent; rows inside the subtree stay.
+    params = {"pk": organization.pk, "parent": organization.parent_id}
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM accounts_organizationclosure link
+            USING accounts_organizationclosure subtree
+            WHERE subtree.ancestor_id = %(pk)s
+              AND link.descendant_id = subtree.descendant_id
+              AND link.depth > subtree.depth
+            """,
+            params,
+        )
+        cursor.execute(
+            """
+            INSERT INTO accounts_organizationclosure (ancestor_id, descendant_id, depth)
+            SELECT above.ancestor_id, subtree.descendant_id, above.depth + subtree.depth + 1
+            FROM accounts_organizationclosure above
+            JOIN accounts_organizationclosure subtree ON subtree.ancestor_id = %(pk)s
+            WHERE above.descendant_id = %(parent)s
+            """,
+            params,
+        )
+
+
+def sync_hierarchy(organization: Organization, created: bool) -> None:
+    if created:
+        add_to_hierarchy(organization)
+        return
+    parent_id = (
+        OrganizationClosure.objects.filter(descendant_id=organization.pk, depth=1)
+        .values_list("ancestor_id", flat=True)
+        .first()
+    )
+    if parent_id != organization.parent_id:
+        move_in_hierarchy(organization)
+
+
+def rebuild_organization_closure() -> int:
+    # Recomputes the table from Organization.parent, e.g. after a bulk
+    # update() that bypassed the signals.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM accounts_organizationclosure")
+        cursor.execute(REBUILD_CLOSURE_SQL)
+        return cursor.rowcount
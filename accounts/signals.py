@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Organization, OrganizationMembership
+from .services import bump_membership_version, check_hierarchy_move, membership_cache, sync_hierarchy
+
+# Cached memberships are keyed by a per-user version; any change a page could
+# show replaces it. Queryset update() bypasses these and must bump by hand.
+
+
+@receiver([post_save, post_delete], sender=OrganizationMembership)
+def invalidate_membership(sender, instance, **kwargs):
+    bump_membership_version(instance.user_id)
+
+
+@receiver(post_save, sender=Organization)
+def invalidate_organization_members(sender, instance, **kwargs):
+    if membership_cache() is not None:
+        bump_membership_version(*instance.memberships.values_list("user_id", flat=True))
+
+
+@receiver(pre_save, sender=Organization)
+def reject_hierarchy_cycle(sender, instance, raw=False, **kwargs):
+    if not raw:
+        check_hierarchy_move(instance)
+
+
+@receiver(post_save, sender=Organization)
+def maintain_hierarchy(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        sync_hierarchy(instance, created)
@@ -1,8 +1,11 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from accounts.models import Organization
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from accounts.services import MEMBERSHIP_CACHE_PREFIX, load_membership, membership_cache
 
 User = get_user_model()
 
@@ -22,3 +25,89 @@ def test_organization_scoped_requires_membership(client):
     client.login(username="user@example.com", password="StrongPass123!")
     response = client.get(reverse("construction:construction-list"))
     assert response.status_code == 403
+
+
+def membership_queries(queries):
+    return [query for query in queries if 'FROM "accounts_organizationmembership"' in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_membership_is_resolved_once_and_cached_until_changed(client, settings, django_capture_on_commit_callbacks):
+    # The local-memory test cache stands in for the shared one.
+    settings.MEMBERSHIP_CACHE = "default"
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="user@example.com", password="StrongPass123!")
+    membership = OrganizationMembership.objects.create(
+        user=user, organization=organization, role=OrganizationRole.CEO
+    )
+    client.login(username="user@example.com", password="StrongPass123!")
+
+    with CaptureQueriesContext(connection) as first:
+        response = client.get(reverse("construction:construction-list"))
+    assert response.status_code == 200
+    assert response.context["active_organization"] == organization
+    assert len(membership_queries(first)) == 1
+
+    with CaptureQueriesContext(connection) as second:
+        client.get(reverse("construction:construction-list"))
+    assert membership_queries(second) == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        membership.role = OrganizationRole.SUB_CONSTRUCTION_MANAGER
+        membership.save()
+    response = client.get(reverse("construction:construction-list"))
+    assert response.context["active_role"] == OrganizationRole.CONSTRUCTION_MANAGER
+
+    with django_capture_on_commit_callbacks(execute=True):
+        organization.name = "Alpha Build s.r.o."
+        organization.save()
+    response = client.get(reverse("construction:construction-list"))
+    assert response.context["active_organization"].name == "Alpha Build s.r.o."
+
+    with django_capture_on_commit_callbacks(execute=True):
+        membership.delete()
+    assert client.get(reverse("construction:construction-list")).status_code == 403
+
+
+@pytest.mark.django_db(transaction=True)
+def test_membership_change_replaces_the_cache_after_commit(settings):
+    settings.MEMBERSHIP_CACHE = "default"
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="user@example.com", password="StrongPass123!")
+    membership = OrganizationMembership.objects.create(
+        user=user, organization=organization, role=OrganizationRole.CEO
+    )
+    assert load_membership(user) == membership
+    cache = membership_cache()
+    version_key = f"{MEMBERSHIP_CACHE_PREFIX}:version:{user.pk}"
+    version = cache.get(version_key)
+
+    with transaction.atomic():
+        membership.delete()
+        # A concurrent request still reads the committed membership and may
+        # cache it under the current version.
+        assert cache.get(version_key) == version
+        cache.set(f"{MEMBERSHIP_CACHE_PREFIX}:{user.pk}:{version}", membership)
+
+    assert cache.get(version_key) != version
+    assert load_membership(user) is None
+
+
+@pytest.mark.django_db
+def test_membership_is_not_cached_without_a_shared_cache(client, settings):
+    settings.MEMBERSHIP_CACHE = None
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="user@example.com", password="StrongPass123!")
+    membership = OrganizationMembership.objects.create(
+        user=user, organization=organization, role=OrganizationRole.CEO
+    )
+    client.login(username="user@example.com", password="StrongPass123!")
+
+    for _ in range(2):
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse("construction:construction-list"))
+        assert len(membership_queries(queries)) == 1
+
+    # Changed directly in the database, bypassing any invalidation.
+    OrganizationMembership.objects.filter(pk=membership.pk).delete()
+    assert client.get(reverse("construction:construction-list")).status_code == 403
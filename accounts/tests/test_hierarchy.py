@@ -0,0 +1,96 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Organization, OrganizationClosure, OrganizationMembership, OrganizationRole
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+
+def closure(organizations):
+    ids = [organization.pk for organization in organizations]
+    names = dict(Organization.objects.filter(pk__in=ids).values_list("pk", "name"))
+    return {
+        (names[ancestor], names[descendant], depth)
+        for ancestor, descendant, depth in OrganizationClosure.objects.filter(descendant__in=ids).values_list(
+            "ancestor_id", "descendant_id", "depth"
+        )
+    }
+
+
+@pytest.mark.django_db
+def test_closure_follows_creation_and_reparenting():
+    main = Organization.objects.create(name="Main")
+    other = Organization.objects.create(name="Other")
+    sub = Organization.objects.create(name="Sub", parent=main)
+    subsub = Organization.objects.create(name="SubSub", parent=sub)
+    organizations = [main, other, sub, subsub]
+
+    assert closure(organizations) == {
+        ("Main", "Main", 0),
+        ("Other", "Other", 0),
+        ("Sub", "Sub", 0),
+        ("SubSub", "SubSub", 0),
+        ("Main", "Sub", 1),
+        ("Sub", "SubSub", 1),
+        ("Main", "SubSub", 2),
+    }
+
+    sub.parent = other
+    sub.save()
+    assert ("Other", "SubSub", 2) in closure(organizations)
+    assert not {row for row in closure(organizations) if row[0] == "Main" and row[1] != "Main"}
+
+    other.parent = subsub
+    with pytest.raises(ValidationError):
+        other.full_clean()
+
+    expected = closure(organizations)
+    call_command("rebuild_organization_closure")
+    assert closure(organizations) == expected
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rejected_move_leaves_the_parent_and_closure_unchanged():
+    main = Organization.objects.create(name="Main")
+    sub = Organization.objects.create(name="Sub", parent=main)
+    expected = closure([main, sub])
+
+    main.parent = sub
+    with pytest.raises(ValidationError):
+        main.save()
+
+    main.refresh_from_db()
+    assert main.parent_id is None
+    assert closure([main, sub]) == expected
+
+
+@pytest.mark.django_db
+def test_lists_include_subcontractors_with_one_join(client):
+    main = Organization.objects.create(name="Main")
+    sub = Organization.objects.create(name="Sub", parent=main)
+    outside = Organization.objects.create(name="Outside")
+    user = User.objects.create_user(username="ceo@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(user=user, organization=main, role=OrganizationRole.CEO)
+    client.login(username="ceo@example.com", password="StrongPass123!")
+    for organization in (main, sub, outside):
+        construction = Construction.objects.create(organization=organization, name=f"Site {organization.name}")
+        order = Order.objects.create(construction=construction, name=f"Order {organization.name}")
+        order.budgets.create(name=f"Budget {organization.name}")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse("budgets:budget-list"))
+    assert {budget.name for budget in response.context["budgets"]} == {"Budget Main", "Budget Sub"}
+    budget_query = next(query["sql"] for query in queries if 'FROM "budgets_budget"' in query["sql"])
+    assert budget_query.count('JOIN "accounts_organizationclosure"') == 1
+
+    response = client.get(reverse("construction:order-list"))
+    assert {order.name for order in response.context["orders"]} == {"Order Main", "Order Sub"}
+
+    sub_budget = response.context["orders"][1].budgets.get()
+    assert client.get(reverse("budgets:budget-detail", args=[sub_budget.pk])).status_code == 200
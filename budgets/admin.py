@@ -1,6 +1,17 @@
 from django.contrib import admin
 
-from .models import Budget, BudgetHeader, BudgetItem, BudgetItemAmount, BudgetPeriod
+from .models import (
+    Budget,
+    BudgetHeader,
+    BudgetItem,
+    BudgetItemAmount,
+    BudgetItemLedger,
+    BudgetPeriod,
+    BudgetPeriodInvoice,
+    BudgetPeriodSummary,
+    ImportJob,
+    ParsedWorkbook,
+)
 
 
 @admin.register(Budget)
@@ -11,13 +22,13 @@ class BudgetAdmin(admin.ModelAdmin):
 
 @admin.register(BudgetHeader)
 class BudgetHeaderAdmin(admin.ModelAdmin):
-    list_display = ("title", "budget", "parent")
+    list_display = ("title", "budget", "path", "total_price", "workbook_total")
     search_fields = ("title", "budget__name")
 
 
 @admin.register(BudgetItem)
 class BudgetItemAdmin(admin.ModelAdmin):
-    list_display = ("code", "description", "header", "price_for_unit")
+    list_display = ("code", "description", "header", "quantity", "price_for_unit", "total_price")
     search_fields = ("code", "description")
 
 
@@ -30,3 +41,35 @@ class BudgetPeriodAdmin(admin.ModelAdmin):
 @admin.register(BudgetItemAmount)
 class BudgetItemAmountAdmin(admin.ModelAdmin):
     list_display = ("budget_item", "period", "amount")
+
+
+@admin.register(BudgetItemLedger)
+class BudgetItemLedgerAdmin(admin.ModelAdmin):
+    list_display = ("budget_item", "period", "amount", "previous_amount", "updated_at")
+    readonly_fields = ("budget_item", "period", "amount", "previous_period", "previous_amount")
+
+
+@admin.register(BudgetPeriodSummary)
+class BudgetPeriodSummaryAdmin(admin.ModelAdmin):
+    list_display = ("period", "budget", "total", "delta", "closed_at")
+    readonly_fields = [field.name for field in BudgetPeriodSummary._meta.fields]
+
+
+@admin.register(BudgetPeriodInvoice)
+class BudgetPeriodInvoiceAdmin(admin.ModelAdmin):
+    list_display = ("period", "order", "gross", "retention", "payable", "due_date", "computed_at")
+    readonly_fields = [field.name for field in BudgetPeriodInvoice._meta.fields]
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("budget", "status", "rows_processed", "items_created", "created_at", "finished_at")
+    list_filter = ("status",)
+    readonly_fields = ("rows_processed", "headers_created", "items_created", "error")
+
+
+@admin.register(ParsedWorkbook)
+class ParsedWorkbookAdmin(admin.ModelAdmin):
+    list_display = ("sha256", "parser_version", "rows", "headers", "items", "created_at")
+    search_fields = ("sha256",)
+    exclude = ("payload",)
@@ -0,0 +1,50 @@
+from core.backfills import register_backfill
+
+# Re-derive the denormalized organization key top-down from the budget's
+# construction. Only rows that disagree are written, so a run over a
+# consistent table is read-only.
+
+register_backfill(
+    "budgets.budget_organization",
+    "budgets.Budget",
+    """
+    UPDATE {table} AS t SET organization_id = c.organization_id
+    FROM construction_order AS o JOIN construction_construction AS c ON c.id = o.construction_id
+    WHERE o.id = t.order_id AND t.id > %(start)s AND t.id <= %(end)s
+      AND t.organization_id IS DISTINCT FROM c.organization_id
+    """,
+    "Budget.organization from its order's construction.",
+)
+register_backfill(
+    "budgets.header_organization",
+    "budgets.BudgetHeader",
+    """
+    UPDATE {table} AS t SET organization_id = b.organization_id
+    FROM budgets_budget AS b
+    WHERE b.id = t.budget_id AND t.id > %(start)s AND t.id <= %(end)s
+      AND t.organization_id IS DISTINCT FROM b.organization_id
+    """,
+    "BudgetHeader.organization from its budget.",
+)
+register_backfill(
+    "budgets.item_organization",
+    "budgets.BudgetItem",
+    """
+    UPDATE {table} AS t SET organization_id = h.organization_id
+    FROM budgets_budgetheader AS h
+    WHERE h.id = t.header_id AND t.id > %(start)s AND t.id <= %(end)s
+      AND t.organization_id IS DISTINCT FROM h.organization_id
+    """,
+    "BudgetItem.organization from its header.",
+)
+register_backfill(
+    "budgets.amount_organization",
+    "budgets.BudgetItemAmount",
+    """
+    UPDATE {table} AS t SET organization_id = i.organization_id
+    FROM budgets_budgetitem AS i
+    WHERE i.id = t.budget_item_id AND t.id > %(start)s AND t.id <= %(end)s
+      AND t.organization_id IS DISTINCT FROM i.organization_id
+    """,
+    "BudgetItemAmount.organization from its item.",
+)
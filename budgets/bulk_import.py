@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import csv
+import logging
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from construction.models import Order
+
+from .importers import (
+    PARSER_VERSION,
+    ExcelImportError,
+    ParseCacheRecorder,
+    import_cached_workbook,
+    import_workbook,
+    inspect_workbook,
+    iter_budget_records,
+    open_budget_sheet,
+)
+from .models import Budget, ParsedWorkbook
+from .services import enqueue_import
+from .storage import hash_file, store_budget_workbook
+
+logger = logging.getLogger(__name__)
+
+WORKBOOK_SUFFIXES = {".xlsx", ".xlsm"}
+
+
+@dataclass
+class ParseResult:
+    name: str
+    path: str
+    sha256: str = ""
+    # None when the records were too large for the parse cache; the parent
+    # then parses the file itself.
+    payload: Optional[bytes] = b""
+    rows: int = 0
+    headers: int = 0
+    items: int = 0
+    seconds: float = 0.0
+    error: str = ""
+
+
+@dataclass
+class FileSummary:
+    name: str
+    order: Optional[int] = None
+    budget: Optional[int] = None
+    rows: int = 0
+    headers: int = 0
+    items: int = 0
+    parse_seconds: float = 0.0
+    persist_seconds: float = 0.0
+    error: str = ""
+
+    @property
+    def rows_per_second(self) -> Optional[int]:
+        seconds = self.parse_seconds + self.persist_seconds
+        return round(self.rows / seconds) if seconds and not self.error else None
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "order": self.order,
+            "budget": self.budget,
+            "rows": self.rows,
+            "headers": self.headers,
+            "items": self.items,
+            "parse_seconds": round(self.parse_seconds, 4),
+            "persist_seconds": round(self.persist_seconds, 4),
+            "rows_per_second": self.rows_per_second,
+            "error": self.error,
+        }
+
+
+@dataclass
+class BulkImportReport:
+    files: List[FileSummary] = field(default_factory=list)
+    seconds: float = 0.0
+    workers: int = 1
+
+    def as_dict(self) -> dict:
+        rows = sum(summary.rows for summary in self.files if not summary.error)
+        return {
+            "workers": self.workers,
+            "seconds": round(self.seconds, 4),
+            "files": [summary.as_dict() for summary in self.files],
+            "imported": sum(1 for summary in self.files if not summary.error),
+            "failed": sum(1 for summary in self.files if summary.error),
+            "rows": rows,
+            "rows_per_second": round(rows / self.seconds) if self.seconds else None,
+        }
+
+
+def collect_workbooks(source: Path, extract_to: Path) -> List[Path]:
+    # Accepts a directory or a zip archive. Archive members are flattened to
+    # their base names. The archive is checked before anything is extracted:
+    # it may only hold workbooks (plus folders and hidden system files, which
+    # are skipped), at most BULK_IMPORT_MAX_FILES of them and
+    # BULK_IMPORT_MAX_BYTES uncompressed in total.
+    if source.is_dir():
+        return sorted(path for path in source.iterdir() if is_workbook_name(path.name))
+    if not zipfile.is_zipfile(source):
+        raise ExcelImportError(f"{source.name} is neither a directory nor a zip archive.")
+    paths = []
+    with zipfile.ZipFile(source) as archive:
+        members = [member for member in archive.infolist() if not is_skipped_member(member)]
+        for member in members:
+            if not is_workbook_name(Path(member.filename).name):
+                raise ExcelImportError(f"The archive contains {member.filename}, which is not an .xlsx workbook.")
+        if len(members) > settings.BULK_IMPORT_MAX_FILES:
+            raise ExcelImportError(
+                f"The archive holds {len(members)} workbooks; at most {settings.BULK_IMPORT_MAX_FILES} are allowed."
+            )
+        if sum(member.file_size for member in members) > settings.BULK_IMPORT_MAX_BYTES:
+            raise ExcelImportError(
+                f"The archive unpacks to more than {settings.BULK_IMPORT_MAX_BYTES} bytes."
+            )
+        for member in members:
+            target = extract_to / Path(member.filename).name
+            if target.exists():
+                target = extract_to / f"{target.stem}-{len(paths)}{target.suffix}"
+            # ZipExtFile stops at the member's declared size, so the check
+            # above also bounds what is written here.
+            with archive.open(member) as handle, target.open("wb") as output:
+                while chunk := handle.read(1024 * 1024):
+                    output.write(chunk)
+            paths.append(target)
+    return sorted(paths)
+
+
+def is_skipped_member(member: zipfile.ZipInfo) -> bool:
+    name = Path(member.filename).name
+    return member.is_dir() or member.filename.startswith("__MACOSX/") or name.startswith((".", "~$"))
+
+
+def is_workbook_name(name: str) -> bool:
+    return not name.startswith((".", "~$")) and Path(name).suffix.lower() in WORKBOOK_SUFFIXES
+
+
+def load_order_mapping(path: Path) -> Dict[str, int]:
+    # CSV rows of ``file name,order id``; a header row is skipped.
+    mapping = {}
+    with path.open(newline="", encoding="utf-8") as handle:
+        for row in csv.reader(handle):
+            if len(row) < 2 or not row[1].strip().isdigit():
+                continue
+            mapping[row[0].strip()] = int(row[1])
+    return mapping
+
+
+class OrderResolver:
+    # Maps a workbook to an order: explicit mapping first, then an order whose
+    # name matches the file name (within the given orders), then the default.
+    def __init__(
+        self,
+        orders,
+        mapping: Optional[Dict[str, int]] = None,
+        default: Optional[Order] = None,
+    ):
+        self.orders = {order.pk: order for order in orders}
+        self.by_name = {order.name.casefold(): order for order in self.orders.values()}
+        self.mapping = mapping or {}
+        self.default = default
+
+    def resolve(self, name: str) -> Order:
+        stem = Path(name).stem
+        for key in (name, stem):
+            if key in self.mapping:
+                order = self.orders.get(self.mapping[key])
+                if order is None:
+                    raise ExcelImportError(f"Order {self.mapping[key]} is not available for {name}.")
+                return order
+        order = self.by_name.get(stem.casefold(), self.default)
+        if order is None:
+            raise ExcelImportError(f"No order matches {name}.")
+        return order
+
+
+def parse_workbook(path: str, fast_reader: bool = True) -> ParseResult:
+    # Runs in a worker process: parsing only, no database access. The records
+    # come back in the parse-cache format, so the parent persists them with
+    # the same replay path as a cached import.
+    result = ParseResult(name=Path(path).name, path=path)
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as handle:
+            result.sha256 = hash_file(File(handle))
+        recorder = ParseCacheRecorder()
+        with open_budget_sheet(path, fast_reader=fast_reader) as (rows, column_map):
+            for record in iter_budget_records(recorder.count_rows(rows), column_map):
+                recorder.add(record)
+        result.payload = recorder.payload()
+        result.rows = recorder.rows
+        result.headers = recorder.headers
+        result.items = recorder.items
+    except ExcelImportError as exc:
+        result.error = str(exc)
+    except Exception as exc:
+        # Same outcome as a failure in a pool worker: the file is reported,
+        # the rest of the batch goes on.
+        logger.exception("Parsing %s failed", result.name)
+        result.error = str(exc)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def iter_parse_results(paths: List[Path], workers: int, fast_reader: bool = True) -> Iterator[ParseResult]:
+    if workers <= 1:
+        for path in paths:
+            yield parse_workbook(str(path), fast_reader)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures: Dict[Future, Path] = {
+            executor.submit(parse_workbook, str(path), fast_reader): path for path in paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                yield future.result()
+            except Exception as exc:
+                logger.exception("Parsing %s failed", path.name)
+                yield ParseResult(name=path.name, path=str(path), error=str(exc))
+
+
+def persist_parse_result(result: ParseResult, order: Order) -> Budget:
+    # One transaction per budget: the budget, its parse cache entry and the
+    # tree are committed together, so a failed file leaves no partial budget.
+    with transaction.atomic():
+        budget = Budget(order=order, name=Path(result.name).stem)
+        with open(result.path, "rb") as handle:
+            store_budget_workbook(budget, File(handle, name=result.name), sha256=result.sha256)
+        budget.save()
+        if result.payload is None:
+            import_workbook(budget, result.path)
+            return budget
+        cached = ParsedWorkbook(
+            sha256=result.sha256,
+            parser_version=PARSER_VERSION,
+            payload=result.payload,
+            rows=result.rows,
+            headers=result.headers,
+            items=result.items,
+        )
+        ParsedWorkbook.objects.bulk_create([cached], ignore_conflicts=True)
+        import_cached_workbook(budget, cached)
+    return budget
+
+
+def import_budget_workbooks(
+    paths: List[Path],
+    resolver: OrderResolver,
+    workers: int = 1,
+    fast_reader: bool = True,
+    on_file: Optional[Callable[[FileSummary], None]] = None,
+) -> BulkImportReport:
+    report = BulkImportReport(workers=workers)
+    started = time.perf_counter()
+    orders: Dict[str, Order] = {}
+    pending: List[Path] = []
+    for path in paths:
+        try:
+            orders[path.name] = resolver.resolve(path.name)
+            pending.append(path)
+        except ExcelImportError as exc:
+            report.files.append(FileSummary(name=path.name, error=str(exc)))
+
+    for result in iter_parse_results(pending, workers, fast_reader):
+        order = orders[result.name]
+        summary = FileSummary(
+            name=result.name,
+            order=order.pk,
+            rows=result.rows,
+            headers=result.headers,
+            items=result.items,
+            parse_seconds=result.seconds,
+            error=result.error,
+        )
+        if not result.error:
+            persist_started = time.perf_counter()
+            try:
+                summary.budget = persist_parse_result(result, order).pk
+            except ExcelImportError as exc:
+                summary.error = str(exc)
+            summary.persist_seconds = time.perf_counter() - persist_started
+        report.files.append(summary)
+        if on_file is not None:
+            on_file(summary)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def queue_budget_workbooks(paths: List[Path], resolver: OrderResolver) -> List[FileSummary]:
+    # Upload path: every workbook becomes a budget with a queued ImportJob, so
+    # parsing is spread over the import workers instead of the web process.
+    summaries = []
+    for path in paths:
+        summary = FileSummary(name=path.name)
+        try:
+            order = resolver.resolve(path.name)
+            summary.order = order.pk
+            with path.open("rb") as handle:
+                workbook = File(handle, name=path.name)
+                sha256 = hash_file(workbook)
+                if not ParsedWorkbook.objects.filter(sha256=sha256, parser_version=PARSER_VERSION).exists():
+                    inspect_workbook(workbook)
+                    workbook.seek(0)
+                with transaction.atomic():
+                    budget = Budget(order=order, name=path.stem)
+                    store_budget_workbook(budget, workbook, sha256=sha256)
+                    budget.save()
+                    enqueue_import(budget)
+            summary.budget = budget.pk
+        except ExcelImportError as exc:
+            summary.error = str(exc)
+        summaries.append(summary)
+    return summaries
@@ -1,9 +1,29 @@
+import re
+
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
-from .models import Budget
+from .importers import PARSER_VERSION, ExcelImportError, inspect_workbook
+from .models import Budget, BudgetPeriod, ParsedWorkbook
+from .reports import ORDER_MOVERS, ORDER_PATH
+from .storage import PREVIEW_DIR, hash_file, store_budget_workbook
 from construction.models import Order
 
 
+def validate_workbook(excel_file) -> str:
+    sha256 = hash_file(excel_file)
+    # A workbook that was already parsed successfully needs no re-check.
+    if ParsedWorkbook.objects.filter(sha256=sha256, parser_version=PARSER_VERSION).exists():
+        return sha256
+    try:
+        inspect_workbook(excel_file)
+    except ExcelImportError as exc:
+        raise forms.ValidationError(str(exc)) from exc
+    finally:
+        excel_file.seek(0)
+    return sha256
+
+
 class BudgetForm(forms.ModelForm):
     class Meta:
         model = Budget
@@ -11,7 +31,92 @@ class BudgetForm(forms.ModelForm):
 
     def __init__(self, *args, organization=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.excel_sha256 = None
         if organization:
             self.fields["order"].queryset = Order.objects.filter(
                 construction__organization=organization
             )
+
+    def clean_excel_file(self):
+        excel_file = self.cleaned_data.get("excel_file")
+        if isinstance(excel_file, UploadedFile):
+            self.excel_sha256 = validate_workbook(excel_file)
+        return excel_file
+
+    def save(self, commit=True):
+        budget = super().save(commit=False)
+        excel_file = self.cleaned_data.get("excel_file")
+        if isinstance(excel_file, UploadedFile):
+            store_budget_workbook(budget, excel_file, sha256=self.excel_sha256)
+        if commit:
+            budget.save()
+            self._save_m2m()
+        return budget
+
+
+class BudgetReimportForm(forms.Form):
+    excel_file = forms.FileField()
+
+    def clean_excel_file(self):
+        excel_file = self.cleaned_data["excel_file"]
+        self.excel_sha256 = validate_workbook(excel_file)
+        return excel_file
+
+
+class BudgetReimportConfirmForm(forms.Form):
+    workbook = forms.CharField(widget=forms.HiddenInput)
+    sha256 = forms.RegexField(regex=r"^[0-9a-f]{64}$", widget=forms.HiddenInput)
+    force = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        sha256 = cleaned_data.get("sha256")
+        workbook = cleaned_data.get("workbook", "")
+        if sha256 and not re.fullmatch(rf"{PREVIEW_DIR}/{sha256}-[0-9a-f]{{32}}\.[a-z0-9]+", workbook):
+            raise forms.ValidationError("Unknown workbook.")
+        return cleaned_data
+
+
+class BudgetBulkImportForm(forms.Form):
+    order = forms.ModelChoiceField(queryset=Order.objects.none())
+    archive = forms.FileField()
+
+    def __init__(self, *args, organization=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if organization:
+            self.fields["order"].queryset = Order.objects.filter(construction__organization=organization)
+
+
+class BudgetPeriodAmountsForm(forms.Form):
+    # ``amounts`` maps budget item ids to amounts, e.g. {"12": "150.00"}.
+    amounts = forms.JSONField()
+
+    def clean_amounts(self):
+        amounts = self.cleaned_data["amounts"]
+        if not isinstance(amounts, dict) or not amounts:
+            raise forms.ValidationError("Provide an object mapping budget item ids to amounts.")
+        return amounts
+
+
+class BudgetPeriodComparisonForm(forms.Form):
+    base = forms.ModelChoiceField(queryset=BudgetPeriod.objects.none(), required=False)
+    target = forms.ModelChoiceField(queryset=BudgetPeriod.objects.none())
+    order = forms.ChoiceField(
+        choices=[(ORDER_PATH, "Podle rozpočtu"), (ORDER_MOVERS, "Největší změny")], required=False
+    )
+    changed_only = forms.BooleanField(required=False)
+    page = forms.IntegerField(min_value=1, required=False)
+
+    def __init__(self, *args, budget=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if budget is not None:
+            periods = BudgetPeriod.objects.filter(budget=budget).select_related("budget").order_by("-pk")
+            self.fields["base"].queryset = periods
+            self.fields["target"].queryset = periods
+
+    def clean(self):
+        cleaned_data = super().clean()
+        base, target = cleaned_data.get("base"), cleaned_data.get("target")
+        if base and target and base.pk >= target.pk:
+            raise forms.ValidationError("The base period must precede the compared period.")
+        return cleaned_data
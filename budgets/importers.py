@@ -1,12 +1,43 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from decimal import Decimal, InvalidOperation
-from typing import Dict, Iterable, Optional
+import json
+import logging
+import re
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 
-from openpyxl import load_workbook
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
 
-from .models import Budget, BudgetHeader, BudgetItem
+from .models import (
+    Budget,
+    BudgetHeader,
+    BudgetItem,
+    BudgetItemMeasurement,
+    ParsedWorkbook,
+    header_path_segment,
+)
+from .storage import ensure_workbook_hash
+from .xlsx import open_sheet_reader
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+# Bump whenever the records produced by iter_budget_records change, so cached
+# parses from older code are ignored.
+PARSER_VERSION = 4
+CENT = Decimal("0.01")
+MEASUREMENT_PLACES = Decimal("0.000001")
+MEASUREMENT_LIMIT = Decimal(10) ** 12
+# Measurement formulas such as ``2*3,5`` or ``(12,5+4)*2``, optionally after a
+# ``label:`` and followed by a quoted note or ``= result``.
+MEASUREMENT_FORMULA = re.compile(r'^(?:[^:"=]*:)?([-+*/×()\d.,]+)(?:=[-\d.,]*)?(?:"[^"]*")?$')
+MEASUREMENT_TOKEN = re.compile(r"\d+(?:[.,]\d+)?|[-+*/×()]")
 
 
 class ExcelImportError(Exception):
@@ -29,67 +60,746 @@ class ColumnMap:
     description_idx: int
     unit_idx: Optional[int]
     unit_price_idx: Optional[int]
+    quantity_idx: Optional[int] = None
+    total_idx: Optional[int] = None
+    vat_rate_idx: Optional[int] = None
+    vat_idx: Optional[int] = None
+    total_with_vat_idx: Optional[int] = None
+
+    @property
+    def indexes(self) -> set[int]:
+        return {getattr(self, name.name) for name in fields(self)} - {None}
+
+
+@dataclass(eq=False)
+class ParsedHeader:
+    level: int
+    title: str
+    parent: Optional[ParsedHeader] = None
+    instance: Optional[BudgetHeader] = None
+    workbook_total: Optional[Decimal] = None
+    total_price: Decimal = Decimal("0.00")
+    vat: Decimal = Decimal("0.00")
+    total_with_vat: Decimal = Decimal("0.00")
+    path: str = ""
+    child_count: int = 0
+
+
+@dataclass(eq=False)
+class ParsedItem:
+    header: ParsedHeader
+    code: str
+    description: str
+    measure_unit: str
+    price_for_unit: Decimal
+    quantity: Decimal = Decimal("0")
+    total_price: Decimal = Decimal("0.00")
+    vat_rate: Optional[Decimal] = None
+    vat: Decimal = Decimal("0.00")
+    total_with_vat: Decimal = Decimal("0.00")
+    instance: Optional[BudgetItem] = None
+
+
+@dataclass(eq=False)
+class ParsedMeasurement:
+    item: ParsedItem
+    position: int
+    kind: str
+    text: str
+    value: Optional[Decimal]
+
+
+@dataclass
+class ParsedBudget:
+    headers: List[ParsedHeader] = field(default_factory=list)
+    items: List[ParsedItem] = field(default_factory=list)
+    measurements: List[ParsedMeasurement] = field(default_factory=list)
+
+
+class HeaderPaths:
+    # Numbers headers in emission order: each gets its parent's path plus its
+    # position among the parent's children (see BudgetHeader.path).
+    def __init__(self):
+        self.roots = 0
+
+    def assign(self, header: ParsedHeader) -> None:
+        parent = header.parent
+        try:
+            if parent is None:
+                header.path = header_path_segment(self.roots)
+                self.roots += 1
+            else:
+                header.path = parent.path + header_path_segment(parent.child_count)
+                parent.child_count += 1
+        except ValueError as exc:
+            raise ExcelImportError(str(exc)) from exc
+
+
+@dataclass
+class StageStats:
+    queries: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class ImportStats:
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    _active: Optional[str] = field(default=None, init=False, repr=False)
+    _queries: int = field(default=0, init=False, repr=False)
+    _mark_queries: int = field(default=0, init=False, repr=False)
+    _mark_time: float = field(default=0.0, init=False, repr=False)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        # Stages may nest (persistence runs inside the streaming parse loop);
+        # time and queries are charged only to the innermost active stage.
+        parent = self._active
+        if parent is not None:
+            self._charge(parent)
+        else:
+            self._mark()
+        self._active = name
+        try:
+            if parent is None:
+                with connection.execute_wrapper(self._count_query):
+                    yield
+            else:
+                yield
+        finally:
+            self._charge(name)
+            self._active = parent
+
+    def _count_query(self, execute, sql, params, many, context):
+        self._queries += 1
+        return execute(sql, params, many, context)
+
+    def _mark(self) -> None:
+        self._mark_time = time.perf_counter()
+        self._mark_queries = self._queries
+
+    def _charge(self, name: str) -> None:
+        stats = self.stages.setdefault(name, StageStats())
+        stats.seconds += time.perf_counter() - self._mark_time
+        stats.queries += self._queries - self._mark_queries
+        self._mark()
+
+    @property
+    def total_queries(self) -> int:
+        return sum(stats.queries for stats in self.stages.values())
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(stats.seconds for stats in self.stages.values())
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"queries": stats.queries, "seconds": round(stats.seconds, 4)}
+            for name, stats in self.stages.items()
+        }
+
+
+class BudgetWriter:
+    # Buffers parsed records and writes them in batches. Only records that are
+    # not yet persisted are kept, so memory stays bounded by ``batch_size``.
+    def __init__(
+        self,
+        budget: Budget,
+        stats: Optional[ImportStats] = None,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        on_flush: Optional[Callable[[BudgetWriter], None]] = None,
+    ):
+        self.budget = budget
+        self.stats = stats if stats is not None else ImportStats()
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.pending_headers: List[ParsedHeader] = []
+        self.pending_items: List[ParsedItem] = []
+        self.pending_measurements: List[ParsedMeasurement] = []
+        # Every header stays referenced until finish() writes its rollups.
+        self.headers: List[ParsedHeader] = []
+        self.rows_processed = 0
+        self.headers_created = 0
+        self.items_created = 0
+        self.measurements_created = 0
+        self.total_mismatches: List[BudgetHeader] = []
+
+    def add(self, record: ParsedHeader | ParsedItem | ParsedMeasurement) -> None:
+        if isinstance(record, ParsedHeader):
+            self.pending_headers.append(record)
+            self.headers.append(record)
+        elif isinstance(record, ParsedMeasurement):
+            self.pending_measurements.append(record)
+        else:
+            self.pending_items.append(record)
+            header = record.header
+            header.total_price += record.total_price
+            header.vat += record.vat
+            header.total_with_vat += record.total_with_vat
+        if max(len(self.pending_headers), len(self.pending_items), len(self.pending_measurements)) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        # A batch commits together with its progress report, so an on_flush
+        # that raises keeps the batch out of the database.
+        with transaction.atomic(savepoint=False):
+            if self.pending_headers:
+                with self.stats.stage("persist_headers"):
+                    self._flush_headers()
+            if self.pending_items:
+                with self.stats.stage("persist_items"):
+                    self._flush_items()
+            if self.pending_measurements:
+                with self.stats.stage("persist_measurements"):
+                    self._flush_measurements()
+            if self.on_flush is not None:
+                self.on_flush(self)
+
+    def finish(self) -> None:
+        self.flush()
+        if self.headers:
+            with self.stats.stage("rollup"):
+                self._write_rollups()
+
+    def count_rows(self, rows: Iterable[Iterable[object]]) -> Iterator[Iterable[object]]:
+        for row in rows:
+            self.rows_processed += 1
+            yield row
+
+    def _write_rollups(self) -> None:
+        # Children always come after their parent, so walking the headers
+        # backwards adds every subtree into its parent exactly once.
+        for header in reversed(self.headers):
+            if header.parent is not None:
+                header.parent.total_price += header.total_price
+                header.parent.vat += header.vat
+                header.parent.total_with_vat += header.total_with_vat
+        instances = []
+        for header in self.headers:
+            instance = header.instance
+            instance.total_price = header.total_price
+            instance.vat = header.vat
+            instance.total_with_vat = header.total_with_vat
+            instances.append(instance)
+        BudgetHeader.objects.bulk_update(
+            instances, ["total_price", "vat", "total_with_vat"], batch_size=self.batch_size
+        )
+        self.total_mismatches = [
+            instance for instance in instances if not instance.total_matches_workbook
+        ]
+        for instance in self.total_mismatches:
+            logger.warning(
+                "Budget %s header %r: items sum to %s, workbook total is %s",
+                self.budget.pk,
+                instance.title,
+                instance.total_price,
+                instance.workbook_total,
+            )
+
+    def _flush_headers(self) -> None:
+        # Parents always sit on a lower level than their children, so inserting
+        # one level at a time guarantees every parent already has a primary key.
+        levels: Dict[int, List[ParsedHeader]] = {}
+        for header in self.pending_headers:
+            levels.setdefault(header.level, []).append(header)
+        for level in sorted(levels):
+            pending = levels[level]
+            instances = BudgetHeader.objects.bulk_create(
+                [
+                    BudgetHeader(
+                        budget=self.budget,
+                        organization_id=self.budget.organization_id,
+                        parent=header.parent.instance if header.parent else None,
+                        title=header.title,
+                        path=header.path,
+                        workbook_total=header.workbook_total,
+                    )
+                    for header in pending
+                ],
+                batch_size=self.batch_size,
+            )
+            for header, instance in zip(pending, instances):
+                header.instance = instance
+        self.headers_created += len(self.pending_headers)
+        self.pending_headers = []
+
+    def _flush_items(self) -> None:
+        instances = BudgetItem.objects.bulk_create(
+            [
+                BudgetItem(
+                    header=item.header.instance,
+                    organization_id=self.budget.organization_id,
+                    code=item.code,
+                    description=item.description,
+                    measure_unit=item.measure_unit,
+                    price_for_unit=to_cents(item.price_for_unit),
+                    quantity=item.quantity,
+                    total_price=item.total_price,
+                    vat_rate=item.vat_rate,
+                    vat=item.vat,
+                    total_with_vat=item.total_with_vat,
+                )
+                for item in self.pending_items
+            ],
+            batch_size=self.batch_size,
+        )
+        for item, instance in zip(self.pending_items, instances):
+            item.instance = instance
+        self.items_created += len(self.pending_items)
+        self.pending_items = []
+
+    def _flush_measurements(self) -> None:
+        BudgetItemMeasurement.objects.bulk_create(
+            [
+                BudgetItemMeasurement(
+                    budget_item=measurement.item.instance,
+                    position=measurement.position,
+                    kind=measurement.kind,
+                    text=measurement.text,
+                    value=measurement.value,
+                )
+                for measurement in self.pending_measurements
+            ],
+            batch_size=self.batch_size,
+        )
+        self.measurements_created += len(self.pending_measurements)
+        self.pending_measurements = []
+
+
+def rollup_header_totals(
+    budget: Budget,
+    workbook_totals: Optional[Dict[int, Optional[Decimal]]] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> List[BudgetHeader]:
+    # Recomputes the rollups of an existing tree from per-header item sums
+    # (two queries) and writes only the headers whose values changed.
+    workbook_totals = workbook_totals or {}
+    headers = {header.pk: header for header in BudgetHeader.objects.filter(budget=budget).order_by("path")}
+    sums = (
+        BudgetItem.objects.filter(header__budget=budget)
+        .values("header_id")
+        .annotate(total_price=Sum("total_price"), vat=Sum("vat"), total_with_vat=Sum("total_with_vat"))
+    )
+    totals = {pk: [Decimal("0.00")] * 3 for pk in headers}
+    for row in sums:
+        totals[row["header_id"]] = [row["total_price"], row["vat"], row["total_with_vat"]]
+
+    # In path order every descendant follows its ancestor, so walking backwards
+    # adds each subtree into its parent exactly once.
+    for pk in reversed(headers):
+        parent_id = headers[pk].parent_id
+        if parent_id is not None:
+            totals[parent_id] = [parent + child for parent, child in zip(totals[parent_id], totals[pk])]
+
+    changed = []
+    for pk, (total_price, vat, total_with_vat) in totals.items():
+        header = headers[pk]
+        workbook_total = workbook_totals.get(pk, header.workbook_total)
+        values = (total_price, vat, total_with_vat, workbook_total)
+        if values != (header.total_price, header.vat, header.total_with_vat, header.workbook_total):
+            header.total_price, header.vat, header.total_with_vat, header.workbook_total = values
+            changed.append(header)
+    BudgetHeader.objects.bulk_update(
+        changed, ["total_price", "vat", "total_with_vat", "workbook_total"], batch_size=batch_size
+    )
+    return changed
+
+
+class ParseCacheRecorder:
+    # Serializes records as zlib-compressed JSON lines while they stream past.
+    # Headers are numbered in emission order and referenced by that number.
+    # Once the compressed records pass max_bytes they are dropped and only
+    # counted, so a large workbook does not grow the import's memory.
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = settings.PARSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.overflowed = False
+        self._compressor = zlib.compressobj()
+        self._chunks: List[bytes] = []
+        self._size = 0
+        # Keyed by id(); a parent or item header is always still alive when it
+        # is looked up, so a reused id can only belong to the newest header.
+        self._header_index: Dict[int, int] = {}
+        self.rows = 0
+        self.headers = 0
+        self.items = 0
+
+    def add(self, record: ParsedHeader | ParsedItem | ParsedMeasurement) -> None:
+        if self.overflowed:
+            self.headers += isinstance(record, ParsedHeader)
+            self.items += isinstance(record, ParsedItem)
+            return
+        if isinstance(record, ParsedMeasurement):
+            # Measurement lines always follow their item, so they refer to the
+            # last item written.
+            line = ["m", record.position, record.kind, record.text, encode_decimal(record.value)]
+        elif isinstance(record, ParsedHeader):
+            parent = self._header_index[id(record.parent)] if record.parent else None
+            self._header_index[id(record)] = self.headers
+            self.headers += 1
+            line = ["h", record.level, record.title, parent, encode_decimal(record.workbook_total)]
+        else:
+            self.items += 1
+            line = [
+                "i",
+                self._header_index[id(record.header)],
+                record.code,
+                record.description,
+                record.measure_unit,
+                str(record.price_for_unit),
+                str(record.quantity),
+                str(record.total_price),
+                encode_decimal(record.vat_rate),
+                str(record.vat),
+                str(record.total_with_vat),
+            ]
+        encoded = json.dumps(line, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+        chunk = self._compressor.compress(encoded)
+        self._size += len(chunk)
+        if self._size > self.max_bytes:
+            self.overflowed = True
+            self._chunks = []
+            self._header_index = {}
+            return
+        self._chunks.append(chunk)
+
+    def count_rows(self, rows: Iterable[Iterable[object]]) -> Iterator[Iterable[object]]:
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def payload(self) -> Optional[bytes]:
+        # None when the records did not fit in max_bytes.
+        if self._compressor is not None and not self.overflowed:
+            chunk = self._compressor.flush()
+            self._compressor = None
+            self._size += len(chunk)
+            self._chunks.append(chunk)
+            self.overflowed = self._size > self.max_bytes
+        return None if self.overflowed else b"".join(self._chunks)
+
+
+def iter_cached_records(payload: bytes) -> Iterator[ParsedHeader | ParsedItem | ParsedMeasurement]:
+    headers: List[ParsedHeader] = []
+    paths = HeaderPaths()
+    item = None
+    for line in iter_payload_lines(payload):
+        kind, *values = json.loads(line)
+        if kind == "h":
+            level, title, parent, workbook_total = values
+            header = ParsedHeader(
+                level,
+                title,
+                headers[parent] if parent is not None else None,
+                workbook_total=decode_decimal(workbook_total),
+            )
+            paths.assign(header)
+            headers.append(header)
+            yield header
+        elif kind == "i":
+            header_index, code, description, measure_unit, *amounts = values
+            price_for_unit, quantity, total_price, vat_rate, vat, total_with_vat = map(decode_decimal, amounts)
+            item = ParsedItem(
+                headers[header_index],
+                code,
+                description,
+                measure_unit,
+                price_for_unit,
+                quantity=quantity,
+                total_price=total_price,
+                vat_rate=vat_rate,
+                vat=vat,
+                total_with_vat=total_with_vat,
+            )
+            yield item
+        else:
+            position, measurement_kind, text, value = values
+            yield ParsedMeasurement(item, position, measurement_kind, text, decode_decimal(value))
+
+
+def encode_decimal(value: Optional[Decimal]) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+def decode_decimal(value: Optional[str]) -> Optional[Decimal]:
+    return Decimal(value) if value is not None else None
 
 
-def import_budget_from_excel(budget: Budget) -> int:
+def iter_payload_lines(payload: bytes, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj()
+    buffer = b""
+    for offset in range(0, len(payload), chunk_size):
+        buffer += decompressor.decompress(payload[offset : offset + chunk_size])
+        *lines, buffer = buffer.split(b"\n")
+        yield from lines
+    buffer += decompressor.flush()
+    yield from (line for line in buffer.split(b"\n") if line)
+
+
+def import_budget_from_excel(
+    budget: Budget,
+    stats: Optional[ImportStats] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_flush: Optional[Callable[[BudgetWriter], None]] = None,
+    fast_reader: bool = True,
+) -> int:
     if not budget.excel_file:
         raise ExcelImportError("Budget has no Excel file to import.")
 
-    workbook = load_workbook(budget.excel_file.path, data_only=True)
-    if "Zakázka" not in workbook.sheetnames:
-        raise ExcelImportError("Excel sheet 'Zakázka' not found.")
+    # Identical workbooks are parsed once; later imports replay the cached
+    # records straight into the writer without opening the workbook.
+    stats = stats if stats is not None else ImportStats()
+    with stats.stage("cache"):
+        sha256 = ensure_workbook_hash(budget)
+        cached = ParsedWorkbook.objects.filter(sha256=sha256, parser_version=PARSER_VERSION).first()
+    if cached is not None:
+        return import_cached_workbook(budget, cached, stats=stats, batch_size=batch_size, on_flush=on_flush)
+
+    # Read through the storage backend: the worker does not share the web
+    # pods' filesystem unless MEDIA_ROOT is a shared volume.
+    recorder = ParseCacheRecorder()
+    with budget.excel_file.open("rb") as workbook:
+        created = import_workbook(
+            budget,
+            workbook,
+            stats=stats,
+            batch_size=batch_size,
+            on_flush=on_flush,
+            fast_reader=fast_reader,
+            recorder=recorder,
+        )
+    with stats.stage("cache"):
+        store_parse_cache(sha256, recorder)
+    return created
+
+
+def store_parse_cache(sha256: str, recorder: ParseCacheRecorder) -> None:
+    payload = recorder.payload()
+    if payload is None:
+        return
+    ParsedWorkbook.objects.bulk_create(
+        [
+            ParsedWorkbook(
+                sha256=sha256,
+                parser_version=PARSER_VERSION,
+                payload=payload,
+                rows=recorder.rows,
+                headers=recorder.headers,
+                items=recorder.items,
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def iter_workbook_records(
+    file, sha256: str, fast_reader: bool = True
+) -> Iterator[ParsedHeader | ParsedItem | ParsedMeasurement]:
+    # Records for a stored workbook, replayed from the parse cache when
+    # possible. A full parse fills the cache once the sheet is exhausted.
+    cached = ParsedWorkbook.objects.filter(sha256=sha256, parser_version=PARSER_VERSION).first()
+    if cached is not None:
+        yield from iter_cached_records(bytes(cached.payload))
+        return
+
+    recorder = ParseCacheRecorder()
+    with open_budget_sheet(file, fast_reader=fast_reader) as (rows, column_map):
+        for record in iter_budget_records(recorder.count_rows(rows), column_map):
+            recorder.add(record)
+            yield record
+    store_parse_cache(sha256, recorder)
+
+
+def import_workbook(
+    budget: Budget,
+    file,
+    stats: Optional[ImportStats] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_flush: Optional[Callable[[BudgetWriter], None]] = None,
+    fast_reader: bool = True,
+    recorder: Optional[ParseCacheRecorder] = None,
+) -> int:
+    stats = stats if stats is not None else ImportStats()
+    with open_budget_sheet(file, stats, fast_reader=fast_reader) as (rows, column_map):
+        writer = BudgetWriter(budget, stats=stats, batch_size=batch_size, on_flush=on_flush)
+        with stats.stage("parse"):
+            for record in iter_budget_records(writer.count_rows(rows), column_map):
+                if recorder is not None:
+                    recorder.add(record)
+                writer.add(record)
+            writer.finish()
+    if recorder is not None:
+        recorder.rows = writer.rows_processed
+
+    log_import(budget, writer, stats)
+    return writer.items_created
+
+
+def import_cached_workbook(
+    budget: Budget,
+    cached: ParsedWorkbook,
+    stats: Optional[ImportStats] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_flush: Optional[Callable[[BudgetWriter], None]] = None,
+) -> int:
+    stats = stats if stats is not None else ImportStats()
+    writer = BudgetWriter(budget, stats=stats, batch_size=batch_size, on_flush=on_flush)
+    writer.rows_processed = cached.rows
+    with stats.stage("replay"):
+        for record in iter_cached_records(bytes(cached.payload)):
+            writer.add(record)
+        writer.finish()
 
-    sheet = workbook["Zakázka"]
-    header_row, column_map = find_header_row(sheet.iter_rows(values_only=True))
+    log_import(budget, writer, stats)
+    return writer.items_created
 
-    header_stack: Dict[int, BudgetHeader] = {}
-    created_items = 0
-    for row in sheet.iter_rows(min_row=header_row + 1, values_only=True):
+
+def log_import(budget: Budget, writer: BudgetWriter, stats: ImportStats) -> None:
+    logger.info(
+        "Imported budget %s: %d headers, %d items, %d queries in %.2fs %s",
+        budget.pk,
+        writer.headers_created,
+        writer.items_created,
+        stats.total_queries,
+        stats.total_seconds,
+        stats.as_dict(),
+    )
+
+
+@contextmanager
+def open_budget_sheet(
+    file, stats: Optional[ImportStats] = None, fast_reader: bool = True
+) -> Iterator[tuple[Iterator[Iterable[object]], ColumnMap]]:
+    # Both readers stream the sheet instead of building the full DOM, and a
+    # single row iterator is shared by header detection and row parsing. Once
+    # the header row is known only the mapped columns are decoded.
+    stats = stats if stats is not None else ImportStats()
+    with stats.stage("load"):
+        try:
+            reader = open_sheet_reader(file, fast=fast_reader)
+        except Exception as exc:
+            raise ExcelImportError("File is not a readable Excel workbook.") from exc
+    try:
+        if "Zakázka" not in reader.sheetnames:
+            raise ExcelImportError("Excel sheet 'Zakázka' not found.")
+        rows = reader.iter_rows("Zakázka")
+        with stats.stage("header"):
+            _header_row, column_map = find_header_row(rows)
+        reader.select_columns(column_map.indexes)
+        yield rows, column_map
+    finally:
+        reader.close()
+
+
+def inspect_workbook(file) -> ColumnMap:
+    # Cheap structural check used before queueing an import: it only streams
+    # rows up to the header row.
+    try:
+        reader = open_sheet_reader(file)
+    except Exception as exc:
+        raise ExcelImportError("File is not a readable Excel workbook.") from exc
+    try:
+        if "Zakázka" not in reader.sheetnames:
+            raise ExcelImportError("Excel sheet 'Zakázka' not found.")
+        _header_row, column_map = find_header_row(reader.iter_rows("Zakázka"))
+        return column_map
+    finally:
+        reader.close()
+
+
+def parse_budget_rows(rows: Iterable[Iterable[object]], column_map: ColumnMap) -> ParsedBudget:
+    parsed = ParsedBudget()
+    for record in iter_budget_records(rows, column_map):
+        if isinstance(record, ParsedHeader):
+            parsed.headers.append(record)
+        elif isinstance(record, ParsedMeasurement):
+            parsed.measurements.append(record)
+        else:
+            parsed.items.append(record)
+    return parsed
+
+
+def iter_budget_records(
+    rows: Iterable[Iterable[object]], column_map: ColumnMap
+) -> Iterator[ParsedHeader | ParsedItem | ParsedMeasurement]:
+    header_stack: Dict[int, ParsedHeader] = {}
+    paths = HeaderPaths()
+    item: Optional[ParsedItem] = None
+    position = 0
+    for row in rows:
         row_type = get_cell_text(row, column_map.type_idx)
         if not row_type:
-            if is_measurement_line(row, column_map):
-                continue
+            # Untyped rows between an item and the next header/item row hold
+            # its measurement details (Výkaz výměr, Ztratné and their lines).
+            if item is not None:
+                measurement = parse_measurement_line(row, column_map, item, position)
+                if measurement is not None:
+                    position += 1
+                    yield measurement
             continue
 
+        item = None
+        position = 0
+
         if row_type in HEADER_TYPES:
             title = get_cell_text(row, column_map.description_idx)
             if not title:
                 continue
             level = HEADER_TYPES[row_type]
+            workbook_total = parse_optional_decimal(get_cell(row, column_map.total_idx))
             parent = None
             for candidate_level in sorted(header_stack.keys(), reverse=True):
                 if candidate_level < level:
                     parent = header_stack[candidate_level]
                     break
-            header = BudgetHeader.objects.create(budget=budget, parent=parent, title=title)
+            header = ParsedHeader(
+                level=level,
+                title=title,
+                parent=parent,
+                workbook_total=to_cents(workbook_total) if workbook_total is not None else None,
+            )
+            paths.assign(header)
             header_stack[level] = header
             for deeper_level in [key for key in header_stack.keys() if key > level]:
                 header_stack.pop(deeper_level, None)
+            yield header
             continue
 
         if row_type == "SUB":
             if not header_stack:
                 raise ExcelImportError("SUB row encountered before any header row.")
             header = header_stack[max(header_stack.keys())]
-            code = get_cell_text(row, column_map.code_idx)
             description = get_cell_text(row, column_map.description_idx)
             if not description:
                 continue
-            measure_unit = get_cell_text(row, column_map.unit_idx)
             unit_price_value = None
             if column_map.unit_price_idx is not None and column_map.unit_price_idx < len(row):
                 unit_price_value = row[column_map.unit_price_idx]
-            unit_price = parse_decimal(unit_price_value)
-            BudgetItem.objects.create(
+            price_for_unit = parse_decimal(unit_price_value)
+            item = ParsedItem(
                 header=header,
-                code=code,
+                code=get_cell_text(row, column_map.code_idx),
                 description=description,
-                measure_unit=measure_unit,
-                price_for_unit=unit_price,
+                measure_unit=get_cell_text(row, column_map.unit_idx),
+                price_for_unit=price_for_unit,
+                **parse_item_amounts(row, column_map, price_for_unit),
             )
-            created_items += 1
+            yield item
 
-    return created_items
+
+def persist_parsed_budget(
+    budget: Budget,
+    parsed: ParsedBudget,
+    stats: Optional[ImportStats] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> BudgetWriter:
+    writer = BudgetWriter(budget, stats=stats, batch_size=batch_size)
+    for header in parsed.headers:
+        writer.add(header)
+    for item in parsed.items:
+        writer.add(item)
+    for measurement in parsed.measurements:
+        writer.add(measurement)
+    writer.finish()
+    return writer
 
 
 def find_header_row(rows: Iterable[Iterable[object]]) -> tuple[int, ColumnMap]:
@@ -102,6 +812,11 @@ def find_header_row(rows: Iterable[Iterable[object]]) -> tuple[int, ColumnMap]:
                 description_idx=header_map["Popis"],
                 unit_idx=header_map.get("MJ"),
                 unit_price_idx=header_map.get("Jedn. Cena"),
+                quantity_idx=header_map.get("Výměra"),
+                total_idx=header_map.get("Cena"),
+                vat_rate_idx=header_map.get("Sazba DPH"),
+                vat_idx=header_map.get("DPH"),
+                total_with_vat_idx=header_map.get("Cena s DPH"),
             )
     raise ExcelImportError("Header row with 'Typ' and 'Popis' not found.")
 
@@ -118,6 +833,35 @@ def normalize_headers(row: Iterable[object]) -> Dict[str, int]:
     return header_map
 
 
+def parse_item_amounts(row: Iterable[object], column_map: ColumnMap, price_for_unit: Decimal) -> Dict[str, object]:
+    # Empty total cells are derived from the other columns, so workbooks
+    # without Cena/DPH columns still get consistent totals.
+    quantity = parse_decimal(get_cell(row, column_map.quantity_idx))
+    total_price = parse_optional_decimal(get_cell(row, column_map.total_idx))
+    if total_price is None:
+        total_price = quantity * price_for_unit
+    vat_rate = parse_optional_decimal(get_cell(row, column_map.vat_rate_idx))
+    vat = parse_optional_decimal(get_cell(row, column_map.vat_idx))
+    if vat is None:
+        vat = total_price * vat_rate / 100 if vat_rate is not None else Decimal("0")
+    total_with_vat = parse_optional_decimal(get_cell(row, column_map.total_with_vat_idx))
+    if total_with_vat is None:
+        total_with_vat = total_price + vat
+    return {
+        "quantity": quantity.quantize(MEASUREMENT_PLACES),
+        "total_price": to_cents(total_price),
+        "vat_rate": to_cents(vat_rate) if vat_rate is not None else None,
+        "vat": to_cents(vat),
+        "total_with_vat": to_cents(total_with_vat),
+    }
+
+
+def get_cell(row: Iterable[object], idx: Optional[int]) -> object:
+    if idx is None or idx >= len(row):
+        return None
+    return row[idx]
+
+
 def get_cell_text(row: Iterable[object], idx: Optional[int]) -> str:
     if idx is None:
         return ""
@@ -144,9 +888,106 @@ def parse_decimal(value: object) -> Decimal:
         raise ExcelImportError(f"Invalid decimal value: {value}") from exc
 
 
+def to_cents(value: Decimal) -> Decimal:
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def parse_optional_decimal(value: object) -> Optional[Decimal]:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return parse_decimal(value)
+
+
 def is_measurement_line(row: Iterable[object], column_map: ColumnMap) -> bool:
     for idx in [column_map.code_idx, column_map.description_idx]:
         text = get_cell_text(row, idx)
         if "Výkaz výměr:" in text or "Ztratné:" in text:
             return True
     return False
+
+
+def parse_measurement_line(
+    row: Iterable[object], column_map: ColumnMap, item: ParsedItem, position: int
+) -> Optional[ParsedMeasurement]:
+    text = get_cell_text(row, column_map.description_idx)
+    if is_measurement_line(row, column_map):
+        marker = get_cell_text(row, column_map.code_idx) + text
+        kind = BudgetItemMeasurement.Kind.WASTE if "Ztratné:" in marker else BudgetItemMeasurement.Kind.MEASUREMENT
+    elif text:
+        kind = BudgetItemMeasurement.Kind.LINE
+    else:
+        return None
+    raw_value = row[column_map.description_idx] if column_map.description_idx < len(row) else None
+    return ParsedMeasurement(item, position, kind.value, text, parse_measurement_value(raw_value))
+
+
+def parse_measurement_value(value: object) -> Optional[Decimal]:
+    # Measurement lines mix numbers, formulas, separators and notes; anything
+    # that is neither a number nor a formula is kept as text only.
+    if value is None or value == "":
+        return None
+    try:
+        number = parse_decimal(value)
+    except ExcelImportError:
+        number = evaluate_measurement_formula(str(value))
+        if number is None:
+            return None
+    try:
+        number = number.quantize(MEASUREMENT_PLACES)
+    except InvalidOperation:
+        return None
+    if not number.is_finite() or abs(number) >= MEASUREMENT_LIMIT:
+        return None
+    return number
+
+
+def evaluate_measurement_formula(text: str) -> Optional[Decimal]:
+    # Arithmetic on decimal numbers with + - * × / and parentheses, evaluated
+    # by a small recursive descent parser; nothing else is accepted.
+    match = MEASUREMENT_FORMULA.match(text.replace("\xa0", "").replace(" ", ""))
+    if match is None:
+        return None
+    tokens = MEASUREMENT_TOKEN.findall(match.group(1))
+    if "".join(tokens) != match.group(1):
+        return None
+    position = 0
+
+    def peek() -> Optional[str]:
+        return tokens[position] if position < len(tokens) else None
+
+    def take() -> str:
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def expression() -> Decimal:
+        result = term()
+        while peek() in ("+", "-"):
+            result = result + term() if take() == "+" else result - term()
+        return result
+
+    def term() -> Decimal:
+        result = factor()
+        while peek() in ("*", "×", "/"):
+            result = result / factor() if take() == "/" else result * factor()
+        return result
+
+    def factor() -> Decimal:
+        token = take() if peek() is not None else None
+        if token == "-":
+            return -factor()
+        if token == "(":
+            result = expression()
+            if peek() != ")":
+                raise ValueError(text)
+            take()
+            return result
+        if token is None or not token[0].isdigit():
+            raise ValueError(text)
+        return Decimal(token.replace(",", "."))
+
+    try:
+        result = expression()
+    except (ValueError, ArithmeticError, RecursionError):
+        return None
+    return result if position == len(tokens) else None
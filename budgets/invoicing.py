@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from construction.models import ContractForWork, Order
+
+from .importers import to_cents
+from .models import BudgetPeriod, BudgetPeriodInvoice, BudgetPeriodRetention
+
+# Bump when the calculation changes, so every cached invoice is recomputed.
+ENGINE_VERSION = 1
+INVOICED_STATUSES = (BudgetPeriod.Status.ACCEPTED, BudgetPeriod.Status.CLOSED)
+ZERO = Decimal("0.00")
+HUNDRED = Decimal("100")
+
+# Value drawn in each period and the VAT on it at the items' rates. Only items
+# with an amount in the period changed; their previous value is the newest
+# amount of an earlier period of the same budget.
+PERIOD_VALUES_SQL = """
+    SELECT p.id,
+           sum(d.delta_value) AS gross,
+           sum(round(d.delta_value * COALESCE(d.vat_rate, 0) / 100, 2)) AS vat
+    FROM budgets_budgetperiod p
+    JOIN budgets_budgetitemamount t ON t.period_id = p.id
+    JOIN budgets_budgetitem i ON i.id = t.budget_item_id
+    LEFT JOIN LATERAL (
+        SELECT a.amount FROM budgets_budgetitemamount a
+        WHERE a.budget_item_id = i.id AND a.period_id < p.id
+        ORDER BY a.period_id DESC LIMIT 1
+    ) previous ON true
+    CROSS JOIN LATERAL (
+        SELECT round(t.amount * i.price_for_unit, 2) - round(COALESCE(previous.amount, 0) * i.price_for_unit, 2)
+                   AS delta_value,
+               i.vat_rate
+    ) d
+    WHERE p.id = ANY(%s)
+    GROUP BY p.id
+"""
+
+
+@dataclass
+class InvoiceTerms:
+    contractor_share: Decimal = ZERO
+    reverse_charge: bool = False
+    day_after_due: int = 0
+    # (residual id, percentage, end date)
+    residuals: Tuple[Tuple[int, int, Optional[date]], ...] = ()
+
+
+def period_invoices(orders, force: bool = False) -> List[BudgetPeriodInvoice]:
+    invoiced = sync_invoices(orders, force=force)
+    return list(
+        BudgetPeriodInvoice.objects.filter(period_id__in=invoiced)
+        .select_related("period", "period__budget", "order")
+        .prefetch_related("retentions")
+    )
+
+
+def refresh_order_invoices(order_ids: Iterable[int]) -> None:
+    # Called when periods, contracts or residuals change, so the retention
+    # schedule is current without waiting for the next read.
+    sync_invoices(Order.objects.filter(pk__in=list(order_ids)))
+
+
+def refresh_budget_invoices(budget_id: int) -> None:
+    sync_invoices(Order.objects.filter(budgets=budget_id))
+
+
+def rebuild_retention_schedule(organization_ids: Optional[List[int]] = None, batch_size: int = 200) -> int:
+    # Drops the cached invoices in scope and recomputes them a batch of
+    # orders at a time; returns the number of retention rows written.
+    orders = Order.objects.order_by("pk")
+    if organization_ids:
+        orders = orders.filter(construction__organization__in=organization_ids)
+    order_ids = list(orders.values_list("pk", flat=True))
+    written = 0
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start : start + batch_size]
+        with transaction.atomic():
+            BudgetPeriodInvoice.objects.filter(order__in=batch).delete()
+            invoiced = sync_invoices(Order.objects.filter(pk__in=batch), force=True)
+        written += BudgetPeriodRetention.objects.filter(invoice_id__in=invoiced).count()
+    return written
+
+
+def upcoming_releases(organization, start: date, end: date):
+    # One range scan of the (organization, release_date) index.
+    return (
+        BudgetPeriodRetention.objects.filter(organization=organization, release_date__range=(start, end))
+        .select_related("invoice__order", "invoice__period__budget")
+        .order_by("release_date", "pk")
+    )
+
+
+def sync_invoices(orders, force: bool = False) -> Dict[int, dict]:
+    # Brings the cached invoices of every accepted or closed period of the
+    # given orders up to date in a fixed number of queries: periods, contracts
+    # with residuals and cached invoices are read once, and only stale periods
+    # are recomputed, all in one pass.
+    periods = list(
+        BudgetPeriod.objects.filter(budget__order__in=orders)
+        .order_by("budget_id", "pk")
+        .values(
+            "pk",
+            "budget_id",
+            "budget__order_id",
+            "budget__order__construction__organization_id",
+            "status",
+            "version",
+            "reviewed_at",
+            "decline_payment",
+            "decline_penalty",
+            "decline_fee",
+        )
+    )
+    contracts = ContractForWork.objects.filter(order__in={period["budget__order_id"] for period in periods})
+    terms = {contract.order_id: contract_terms(contract) for contract in contracts.prefetch_related("residuals")}
+
+    # Any transition of an earlier period can change what this one added, so
+    # the fingerprint covers the versions of the whole history up to it.
+    fingerprints: Dict[int, str] = {}
+    invoiced: Dict[int, dict] = {}
+    history: Dict[int, List[int]] = defaultdict(list)
+    for period in periods:
+        history[period["budget_id"]].append(period["version"])
+        if period["status"] not in INVOICED_STATUSES:
+            continue
+        invoiced[period["pk"]] = period
+        fingerprints[period["pk"]] = fingerprint(
+            history[period["budget_id"]], terms.get(period["budget__order_id"], InvoiceTerms())
+        )
+
+    cached = {
+        invoice.period_id: invoice
+        for invoice in BudgetPeriodInvoice.objects.filter(period_id__in=invoiced).only("period_id", "fingerprint")
+    }
+    stale = [pk for pk in invoiced if force or pk not in cached or cached[pk].fingerprint != fingerprints[pk]]
+    if stale:
+        refresh_invoices([invoiced[pk] for pk in stale], terms, fingerprints)
+    return invoiced
+
+
+def refresh_invoices(periods: List[dict], terms: Dict[int, InvoiceTerms], fingerprints: Dict[int, str]) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(PERIOD_VALUES_SQL, [[period["pk"] for period in periods]])
+        values = {pk: (gross, vat) for pk, gross, vat in cursor.fetchall()}
+
+    invoices = []
+    retentions = []
+    for period in periods:
+        gross, vat_gross = values.get(period["pk"], (ZERO, ZERO))
+        invoice, period_retentions = calculate_invoice(
+            period, gross, vat_gross, terms.get(period["budget__order_id"], InvoiceTerms())
+        )
+        invoice.fingerprint = fingerprints[period["pk"]]
+        invoices.append(invoice)
+        retentions.extend(period_retentions)
+
+    fields = [field.name for field in BudgetPeriodInvoice._meta.concrete_fields if not field.primary_key]
+    with transaction.atomic():
+        BudgetPeriodInvoice.objects.bulk_create(
+            invoices, update_conflicts=True, unique_fields=["period"], update_fields=fields
+        )
+        BudgetPeriodRetention.objects.filter(invoice_id__in=[invoice.period_id for invoice in invoices]).delete()
+        BudgetPeriodRetention.objects.bulk_create(retentions, batch_size=1000)
+
+
+def calculate_invoice(
+    period: dict,
+    gross: Decimal,
+    vat_gross: Decimal,
+    terms: InvoiceTerms,
+) -> Tuple[BudgetPeriodInvoice, List[BudgetPeriodRetention]]:
+    # The contractor's share is taken off the drawn value first; VAT and
+    # retention apply to the rest. Under reverse charge the customer accounts
+    # for VAT, so none is invoiced. Payment, penalty and fee recorded when the
+    # period was declined are deducted from the payable amount.
+    share = to_cents(gross * terms.contractor_share / HUNDRED)
+    net = gross - share
+    if terms.reverse_charge or not gross:
+        vat = ZERO
+    else:
+        vat = to_cents(vat_gross * net / gross)
+    retentions = [
+        BudgetPeriodRetention(
+            invoice_id=period["pk"],
+            organization_id=period["budget__order__construction__organization_id"],
+            residual_id=residual_id,
+            percentage=percentage,
+            amount=to_cents(net * percentage / HUNDRED),
+            release_date=end_date,
+        )
+        for residual_id, percentage, end_date in terms.residuals
+    ]
+    retention = sum((row.amount for row in retentions), ZERO)
+    deductions = sum(
+        (period[name] for name in ("decline_payment", "decline_penalty", "decline_fee") if period[name] is not None),
+        ZERO,
+    )
+    accepted_at = period["reviewed_at"]
+    invoice = BudgetPeriodInvoice(
+        period_id=period["pk"],
+        order_id=period["budget__order_id"],
+        gross=gross,
+        contractor_share=share,
+        net=net,
+        reverse_charge=terms.reverse_charge,
+        vat=vat,
+        retention=retention,
+        deductions=deductions,
+        payable=net + vat - retention - deductions,
+        accepted_at=accepted_at,
+        due_date=(
+            timezone.localdate(accepted_at) + timedelta(days=terms.day_after_due) if accepted_at else None
+        ),
+    )
+    return invoice, retentions
+
+
+def contract_terms(contract: ContractForWork) -> InvoiceTerms:
+    return InvoiceTerms(
+        contractor_share=contract.contractor_share,
+        reverse_charge=contract.tax_reverse_charge,
+        day_after_due=contract.day_after_due,
+        residuals=tuple(
+            (residual.pk, residual.percentage, residual.end_date)
+            for residual in sorted(contract.residuals.all(), key=lambda residual: residual.pk)
+        ),
+    )
+
+
+def fingerprint(versions: Iterable[int], terms: InvoiceTerms) -> str:
+    payload = [
+        ENGINE_VERSION,
+        list(versions),
+        str(terms.contractor_share),
+        terms.reverse_charge,
+        terms.day_after_due,
+        [[pk, percentage, str(end_date)] for pk, percentage, end_date in terms.residuals],
+    ]
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from accounts.models import Organization
+from budgets import importers
+from budgets.importers import ExcelImportError, ImportStats, import_workbook, iter_budget_records, open_budget_sheet
+from budgets.models import Budget
+from budgets.workbook_generator import WorkbookSpec, generate_budget_workbook
+from construction.models import Construction, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the budget importer on a workbook or a generated Zakázka workbook "
+        "and print the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="Workbook with a 'Zakázka' sheet. Omit to generate one.")
+        parser.add_argument("--reader", choices=["fast", "openpyxl", "both"], default="both")
+        parser.add_argument("--repeat", type=int, default=1, help="Runs per reader; the fastest run is reported.")
+        parser.add_argument("--persist", action="store_true", help="Write to the database (rolled back afterwards).")
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+        # Set on the per-run subprocesses started by the command itself.
+        parser.add_argument("--single-run", choices=["fast", "openpyxl"], help=argparse.SUPPRESS)
+        parser.add_argument("--items", type=int, default=WorkbookSpec.items)
+        parser.add_argument("--header-depth", type=int, default=WorkbookSpec.header_depth)
+        parser.add_argument("--items-per-section", type=int, default=WorkbookSpec.items_per_section)
+        parser.add_argument("--fanout", type=int, default=WorkbookSpec.fanout)
+        parser.add_argument("--measurement-density", type=float, default=WorkbookSpec.measurement_density)
+        parser.add_argument("--dirty-ratio", type=float, default=WorkbookSpec.dirty_ratio)
+        parser.add_argument("--seed", type=int, default=WorkbookSpec.seed)
+
+    def handle(self, *args, **options):
+        if options["single_run"]:
+            fast_reader = options["single_run"] == "fast"
+            result = benchmark_run(options["path"], fast_reader=fast_reader, persist=options["persist"])
+            self.stdout.write(json.dumps(result))
+            return
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if options["path"]:
+                path = Path(options["path"])
+                workbook = {"path": str(path)}
+            else:
+                spec = WorkbookSpec(
+                    items=options["items"],
+                    header_depth=options["header_depth"],
+                    items_per_section=options["items_per_section"],
+                    fanout=options["fanout"],
+                    measurement_density=options["measurement_density"],
+                    dirty_ratio=options["dirty_ratio"],
+                    seed=options["seed"],
+                )
+                path = Path(tmp_dir) / "generated.xlsx"
+                started = time.perf_counter()
+                try:
+                    generated = generate_budget_workbook(path, spec)
+                except ValueError as exc:
+                    raise CommandError(str(exc)) from exc
+                workbook = {
+                    "generated": spec.as_dict(),
+                    "rows": generated.rows,
+                    "headers": generated.headers,
+                    "items": generated.items,
+                    "measurement_lines": generated.measurement_lines,
+                    "generate_seconds": round(time.perf_counter() - started, 4),
+                }
+            workbook["size_bytes"] = path.stat().st_size
+
+            readers = ["fast", "openpyxl"] if options["reader"] == "both" else [options["reader"]]
+            runs = []
+            for reader in readers:
+                results = [
+                    benchmark_run_in_subprocess(path, reader, persist=options["persist"])
+                    for _run in range(options["repeat"])
+                ]
+                best = min(results, key=lambda result: result["seconds"])
+                runs.append({"reader": reader, "persist": options["persist"], **best})
+
+        report = {"workbook": workbook, "runs": runs}
+        payload = json.dumps(report, indent=2)
+        if options["output"]:
+            Path(options["output"]).write_text(payload + "\n", encoding="utf-8")
+        self.stdout.write(payload)
+
+
+def benchmark_run_in_subprocess(path, reader: str, persist: bool) -> dict:
+    # Each run gets a fresh process, so its peak RSS (ru_maxrss, which only
+    # ever grows within a process) covers that run alone, including memory
+    # allocated by openpyxl, lxml and psycopg. The child uses this process's
+    # database, e.g. the test database under pytest.
+    command = [sys.executable, "-m", "django", "benchmark_budget_import", str(path), "--single-run", reader]
+    if persist:
+        command.append("--persist")
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings"),
+        "POSTGRES_DB": connection.settings_dict["NAME"],
+    }
+    result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        message = lines[-1].removeprefix("CommandError: ") if lines else ""
+        raise CommandError(message or f"Benchmark run exited with status {result.returncode}.")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def benchmark_run(path, fast_reader: bool, persist: bool) -> dict:
+    stats = ImportStats()
+    decimal_timer = {"calls": 0, "seconds": 0.0}
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    try:
+        with timed_parse_decimal(decimal_timer):
+            if persist:
+                rows, records = persist_run(path, stats, fast_reader)
+            else:
+                rows, records = parse_run(path, stats, fast_reader)
+    except ExcelImportError as exc:
+        raise CommandError(str(exc)) from exc
+    elapsed = time.perf_counter() - started
+
+    phases = {name: round(stage.seconds, 4) for name, stage in stats.stages.items()}
+    phases["parse_decimal"] = round(decimal_timer["seconds"], 4)
+    if "parse" in phases:
+        phases["parse"] = round(max(phases["parse"] - decimal_timer["seconds"], 0.0), 4)
+    return {
+        "seconds": round(elapsed, 4),
+        "rows": rows,
+        "records": records,
+        "rows_per_second": round(rows / elapsed) if elapsed else None,
+        "queries": stats.total_queries,
+        "queries_by_phase": {name: stage.queries for name, stage in stats.stages.items()},
+        "parse_decimal_calls": decimal_timer["calls"],
+        # Peak RSS of the run's process; baseline_rss_kb is its peak before the
+        # run started (interpreter and Django).
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "baseline_rss_kb": baseline_rss,
+        "phases": phases,
+    }
+
+
+def parse_run(path, stats: ImportStats, fast_reader: bool) -> tuple[int, int]:
+    counter = {"rows": 0}
+
+    def counted(rows):
+        for row in rows:
+            counter["rows"] += 1
+            yield row
+
+    with open_budget_sheet(path, stats, fast_reader=fast_reader) as (rows, column_map):
+        with stats.stage("parse"):
+            records = sum(1 for _record in iter_budget_records(counted(rows), column_map))
+    return counter["rows"], records
+
+
+def persist_run(path, stats: ImportStats, fast_reader: bool) -> tuple[int, int]:
+    progress = {"rows": 0, "records": 0}
+
+    def record_progress(writer):
+        progress["rows"] = writer.rows_processed
+        progress["records"] = writer.headers_created + writer.items_created + writer.measurements_created
+
+    with transaction.atomic():
+        organization = Organization.objects.create(name="Benchmark")
+        construction = Construction.objects.create(organization=organization, name="Benchmark")
+        order = Order.objects.create(construction=construction, name="Benchmark")
+        budget = Budget.objects.create(order=order, name="Benchmark")
+        import_workbook(budget, path, stats=stats, on_flush=record_progress, fast_reader=fast_reader)
+        transaction.set_rollback(True)
+    return progress["rows"], progress["records"]
+
+
+@contextmanager
+def timed_parse_decimal(timer: dict):
+    original = importers.parse_decimal
+
+    def timed(value):
+        started = time.perf_counter()
+        try:
+            return original(value)
+        finally:
+            timer["calls"] += 1
+            timer["seconds"] += time.perf_counter() - started
+
+    importers.parse_decimal = timed
+    try:
+        yield
+    finally:
+        importers.parse_decimal = original
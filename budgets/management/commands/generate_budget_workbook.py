@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from budgets.workbook_generator import WorkbookSpec, generate_budget_workbook
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic Zakázka workbook for import benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Where to write the .xlsx file.")
+        parser.add_argument("--items", type=int, default=WorkbookSpec.items)
+        parser.add_argument("--header-depth", type=int, default=WorkbookSpec.header_depth)
+        parser.add_argument("--items-per-section", type=int, default=WorkbookSpec.items_per_section)
+        parser.add_argument("--fanout", type=int, default=WorkbookSpec.fanout)
+        parser.add_argument("--measurement-density", type=float, default=WorkbookSpec.measurement_density)
+        parser.add_argument("--dirty-ratio", type=float, default=WorkbookSpec.dirty_ratio)
+        parser.add_argument("--seed", type=int, default=WorkbookSpec.seed)
+
+    def handle(self, *args, **options):
+        spec = WorkbookSpec(
+            items=options["items"],
+            header_depth=options["header_depth"],
+            items_per_section=options["items_per_section"],
+            fanout=options["fanout"],
+            measurement_density=options["measurement_density"],
+            dirty_ratio=options["dirty_ratio"],
+            seed=options["seed"],
+        )
+        try:
+            generated = generate_budget_workbook(options["path"], spec)
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(
+            f"Wrote {options['path']}: {generated.rows} rows, {generated.headers} headers, "
+            f"{generated.items} items, {generated.measurement_lines} measurement lines"
+        )
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budgets.bulk_import import OrderResolver, collect_workbooks, import_budget_workbooks, load_order_mapping
+from budgets.importers import ExcelImportError
+from construction.models import Construction, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Import every workbook in a directory or zip archive as a new budget. Workbooks are "
+        "parsed in parallel worker processes and persisted one budget at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Directory or zip archive with Zakázka workbooks.")
+        parser.add_argument("--order", type=int, help="Order used for workbooks without a better match.")
+        parser.add_argument(
+            "--construction",
+            type=int,
+            help="Match workbooks to orders of this construction by file name.",
+        )
+        parser.add_argument("--mapping", help="CSV with 'file name,order id' rows.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--openpyxl", action="store_true", help="Use the openpyxl reader instead of the fast path.")
+
+    def handle(self, *args, **options):
+        source = Path(options["source"])
+        if not source.exists():
+            raise CommandError(f"{source} does not exist.")
+        default = None
+        if options["order"]:
+            default = Order.objects.filter(pk=options["order"]).first()
+            if default is None:
+                raise CommandError(f"Order {options['order']} does not exist.")
+
+        orders = Order.objects.all()
+        if options["construction"]:
+            if not Construction.objects.filter(pk=options["construction"]).exists():
+                raise CommandError(f"Construction {options['construction']} does not exist.")
+            orders = orders.filter(construction_id=options["construction"])
+        elif default is not None:
+            orders = orders.filter(construction_id=default.construction_id)
+        orders = list(orders)
+        if default is not None and default not in orders:
+            orders.append(default)
+        mapping = load_order_mapping(Path(options["mapping"])) if options["mapping"] else {}
+        if mapping:
+            orders.extend(Order.objects.filter(pk__in=mapping.values()).exclude(pk__in=[o.pk for o in orders]))
+        resolver = OrderResolver(orders, mapping=mapping, default=default)
+
+        def report_file(summary):
+            status = summary.error or f"budget {summary.budget}"
+            self.stderr.write(
+                f"{summary.name}: {summary.items} items, {summary.rows} rows, "
+                f"{summary.rows_per_second or 0} rows/s, {status}"
+            )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            try:
+                paths = collect_workbooks(source, Path(tmp_dir))
+            except ExcelImportError as exc:
+                raise CommandError(str(exc)) from exc
+            if not paths:
+                raise CommandError(f"No workbooks found in {source}.")
+            report = import_budget_workbooks(
+                paths,
+                resolver,
+                workers=min(options["workers"], len(paths)),
+                fast_reader=not options["openpyxl"],
+                on_file=report_file,
+            )
+        self.stdout.write(json.dumps(report.as_dict(), indent=2, ensure_ascii=False))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from budgets.services import rebuild_amount_ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the latest committed amount per budget item from period history."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--budget", type=int, action="append", dest="budgets", help="Only this budget (repeatable)."
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_amount_ledger(options["budgets"])
+        self.stdout.write(f"Wrote {written} ledger rows.")
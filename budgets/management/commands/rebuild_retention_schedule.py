@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from budgets.invoicing import rebuild_retention_schedule
+
+
+class Command(BaseCommand):
+    help = "Recompute cached period invoices and the retention release schedule."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            action="append",
+            dest="organizations",
+            help="Only this organization (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_retention_schedule(options["organizations"])
+        self.stdout.write(f"Wrote {written} retention rows.")
@@ -0,0 +1,49 @@
+import json
+from pathlib import Path
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from budgets.importers import ExcelImportError
+from budgets.models import Budget
+from budgets.reimport import apply_reimport, plan_reimport
+from budgets.storage import hash_file, replace_budget_workbook, save_workbook
+
+
+class Command(BaseCommand):
+    help = "Compare a revised workbook with an imported budget and optionally apply the changes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("budget_id", type=int)
+        parser.add_argument("path", help="Revised workbook with a 'Zakázka' sheet.")
+        parser.add_argument("--apply", action="store_true", help="Apply the changes instead of only reporting them.")
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Also delete removed items that already have period amounts.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            budget = Budget.objects.get(pk=options["budget_id"])
+        except Budget.DoesNotExist as exc:
+            raise CommandError(f"Budget {options['budget_id']} does not exist.") from exc
+        path = Path(options["path"])
+        if not path.is_file():
+            raise CommandError(f"{path} is not a file.")
+
+        with path.open("rb") as handle:
+            workbook = File(handle, name=path.name)
+            sha256 = hash_file(workbook)
+            try:
+                plan = plan_reimport(budget, path, sha256)
+                if options["apply"]:
+                    with transaction.atomic():
+                        apply_reimport(plan, force=options["force"])
+                        name, _sha256 = save_workbook(workbook, sha256)
+                        replace_budget_workbook(budget, name, sha256)
+            except ExcelImportError as exc:
+                raise CommandError(str(exc)) from exc
+
+        self.stdout.write(json.dumps({"applied": options["apply"], **plan.as_dict()}, indent=2, ensure_ascii=False))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from budgets.services import claim_next_import_job, recover_stale_import_jobs, run_import_job
+
+
+class Command(BaseCommand):
+    help = "Process queued budget import jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls when the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for job in recover_stale_import_jobs():
+                self.stdout.write(f"Import job {job.pk} for budget {job.budget_id} was abandoned: {job.status}")
+            job = claim_next_import_job()
+            if job is None:
+                if options["once"]:
+                    return
+                close_old_connections()
+                time.sleep(options["poll_interval"])
+                continue
+            run_import_job(job)
+            self.stdout.write(
+                f"Import job {job.pk} for budget {job.budget_id}: {job.status}, "
+                f"{job.rows_processed} rows, {job.headers_created} headers, {job.items_created} items"
+            )
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0002_import_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='excel_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='ParsedWorkbook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64)),
+                ('parser_version', models.PositiveSmallIntegerField()),
+                ('payload', models.BinaryField()),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('headers', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sha256', 'parser_version'), name='unique_parsed_workbook_per_version')],
+            },
+        ),
+    ]
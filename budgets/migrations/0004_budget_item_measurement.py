@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0003_parsed_workbook_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetItemMeasurement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('kind', models.CharField(choices=[('measurement', 'Výkaz výměr'), ('waste', 'Ztratné'), ('line', 'Line')], default='line', max_length=20)),
+                ('text', models.TextField(blank=True)),
+                ('value', models.DecimalField(blank=True, decimal_places=6, max_digits=18, null=True)),
+                ('budget_item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='measurements', to='budgets.budgetitem')),
+            ],
+            options={
+                'ordering': ['budget_item', 'position'],
+                'constraints': [models.UniqueConstraint(fields=('budget_item', 'position'), name='unique_measurement_position_per_item')],
+            },
+        ),
+    ]
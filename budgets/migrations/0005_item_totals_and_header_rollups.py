@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0004_budget_item_measurement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetheader',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='budgetheader',
+            name='total_with_vat',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='budgetheader',
+            name='vat',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='budgetheader',
+            name='workbook_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='budgetitem',
+            name='quantity',
+            field=models.DecimalField(decimal_places=6, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='budgetitem',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='budgetitem',
+            name='total_with_vat',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='budgetitem',
+            name='vat',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='budgetitem',
+            name='vat_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from django.db import migrations, models
+
+PATH_STEP = 5
+
+
+def fill_header_paths(apps, schema_editor):
+    # Existing trees were inserted in workbook order, so primary keys give the
+    # sibling positions.
+    BudgetHeader = apps.get_model("budgets", "BudgetHeader")
+    budget_ids = BudgetHeader.objects.values_list("budget_id", flat=True).distinct()
+    for budget_id in budget_ids:
+        children = defaultdict(list)
+        for pk, parent_id in BudgetHeader.objects.filter(budget_id=budget_id).order_by("pk").values_list(
+            "pk", "parent_id"
+        ):
+            children[parent_id].append(pk)
+        updates = []
+        stack = [(None, "")]
+        while stack:
+            parent_id, prefix = stack.pop()
+            for position, pk in enumerate(children.get(parent_id, [])):
+                path = f"{prefix}{position:0{PATH_STEP}d}"
+                updates.append(BudgetHeader(pk=pk, path=path))
+                stack.append((pk, path))
+        BudgetHeader.objects.bulk_update(updates, ["path"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0005_item_totals_and_header_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetheader',
+            name='path',
+            field=models.CharField(db_collation='C', default='', max_length=50),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_header_paths, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='budgetheader',
+            options={'ordering': ['budget_id', 'path']},
+        ),
+        migrations.AddConstraint(
+            model_name='budgetheader',
+            constraint=models.UniqueConstraint(
+                deferrable=models.Deferrable['DEFERRED'],
+                fields=('budget', 'path'),
+                name='budgets_header_unique_path',
+            ),
+        ),
+    ]
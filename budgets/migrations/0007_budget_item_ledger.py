@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0006_budget_header_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetItemLedger',
+            fields=[
+                ('budget_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to='budgets.budgetitem')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('previous_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='budgets.budgetperiod')),
+                ('previous_period', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='budgets.budgetperiod')),
+            ],
+        ),
+    ]
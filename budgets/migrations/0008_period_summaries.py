@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0007_budget_item_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetPeriodSummary',
+            fields=[
+                ('period', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='budgets.budgetperiod')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('delta', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('decline_payment', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('decline_penalty', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('decline_fee', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('closed_at', models.DateTimeField()),
+                ('budget', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_summaries', to='budgets.budget')),
+                ('previous_period', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='budgets.budgetperiod')),
+            ],
+            options={
+                'ordering': ['budget_id', 'closed_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BudgetPeriodHeaderSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(db_collation='C', max_length=50)),
+                ('title', models.CharField(max_length=200)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('delta', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('header', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='budgets.budgetheader')),
+                ('summary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='headers', to='budgets.budgetperiodsummary')),
+            ],
+            options={
+                'ordering': ['summary_id', 'path'],
+                'constraints': [models.UniqueConstraint(fields=('summary', 'path'), name='budgets_period_header_summary_unique_path')],
+            },
+        ),
+    ]
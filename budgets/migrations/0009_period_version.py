@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0008_period_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetperiod',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
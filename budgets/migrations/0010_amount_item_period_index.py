@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0009_period_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='budgetitemamount',
+            name='budget_item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='period_amounts', to='budgets.budgetitem'),
+        ),
+        migrations.AddIndex(
+            model_name='budgetitemamount',
+            index=models.Index(fields=['budget_item', 'period'], name='budgets_amount_item_period'),
+        ),
+    ]
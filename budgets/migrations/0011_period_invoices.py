@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0010_amount_item_period_index'),
+        ('construction', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetPeriodInvoice',
+            fields=[
+                ('period', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='invoice', serialize=False, to='budgets.budgetperiod')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('gross', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('contractor_share', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('net', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('reverse_charge', models.BooleanField(default=False)),
+                ('vat', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('retention', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('deductions', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('payable', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('accepted_at', models.DateTimeField(blank=True, null=True)),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_invoices', to='construction.order')),
+            ],
+            options={
+                'ordering': ['order_id', 'period_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BudgetPeriodRetention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('percentage', models.IntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('release_date', models.DateField(blank=True, null=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retentions', to='budgets.budgetperiodinvoice')),
+                ('residual', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='construction.residual')),
+            ],
+            options={
+                'ordering': ['invoice_id', 'release_date', 'pk'],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_retention_organization(apps, schema_editor):
+    BudgetPeriodRetention = apps.get_model("budgets", "BudgetPeriodRetention")
+    BudgetPeriodInvoice = apps.get_model("budgets", "BudgetPeriodInvoice")
+    BudgetPeriodRetention.objects.update(
+        organization_id=Subquery(
+            BudgetPeriodInvoice.objects.filter(pk=OuterRef("invoice_id")).values(
+                "order__construction__organization_id"
+            )[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('budgets', '0011_period_invoices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budgetperiodretention',
+            name='organization',
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='+',
+                to='accounts.organization',
+            ),
+        ),
+        migrations.RunPython(fill_retention_organization, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='budgetperiodretention',
+            name='organization',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='+',
+                to='accounts.organization',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='budgetperiodretention',
+            index=models.Index(fields=['organization', 'release_date'], name='budgets_retention_release'),
+        ),
+    ]
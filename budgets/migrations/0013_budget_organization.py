@@ -0,0 +1,42 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.backfills import restart_backfills
+
+
+class Migration(migrations.Migration):
+    # First of two releases: the column is added nullable and without an
+    # index, and the application writes it from here on. Existing rows are
+    # filled by the budgets.*_organization backfills (budgets/backfills.py);
+    # 0016 adds the NOT NULL constraint and the indexes once they are done.
+
+    dependencies = [
+        ('accounts', '0003_organization_closure'),
+        ('budgets', '0012_retention_schedule'),
+        ('construction', '0001_initial'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name='organization',
+                field=models.ForeignKey(
+                    db_index=False,
+                    editable=False,
+                    null=True,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='+',
+                    to='accounts.organization',
+                ),
+            )
+            for model_name in ['budget', 'budgetheader', 'budgetitem', 'budgetitemamount']
+        ],
+        restart_backfills(
+            'budgets.budget_organization',
+            'budgets.header_organization',
+            'budgets.item_organization',
+            'budgets.amount_organization',
+        ),
+    ]
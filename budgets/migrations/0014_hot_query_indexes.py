@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+def period_budget_field(apps):
+    model = apps.get_model('budgets', 'BudgetPeriod')
+    return model, model._meta.get_field('budget')
+
+
+def drop_period_budget_index(apps, schema_editor):
+    model, field = period_budget_field(apps)
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, model._meta.db_table)
+    for name, info in constraints.items():
+        if info['index'] and not info['unique'] and info['columns'] == [field.column]:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(name)}')
+
+
+def create_period_budget_index(apps, schema_editor):
+    model, field = period_budget_field(apps)
+    schema_editor.execute(schema_editor._create_index_sql(model, fields=[field], concurrently=True))
+
+
+class Migration(migrations.Migration):
+    # Indexes on the item and amount tables are built without blocking
+    # writes; the indexes they replace are dropped afterwards.
+    atomic = False
+
+    dependencies = [
+        ('budgets', '0013_budget_organization'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='budgetitem',
+            options={'ordering': ['code', 'pk']},
+        ),
+        AddIndexConcurrently(
+            model_name='budgetitem',
+            index=models.Index(fields=['header', 'code', 'id'], name='budgets_item_header_code'),
+        ),
+        AddIndexConcurrently(
+            model_name='budgetitemamount',
+            index=models.Index(fields=['budget_item', 'period'], include=('amount',), name='budgets_amount_covering'),
+        ),
+        AddIndexConcurrently(
+            model_name='budgetperiod',
+            index=models.Index(fields=['budget', 'created_at'], name='budgets_period_budget_created'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='budgetitemamount',
+            name='budgets_amount_item_period',
+        ),
+        migrations.AlterField(
+            model_name='budgetheader',
+            name='budget',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='headers', to='budgets.budget'),
+        ),
+        migrations.AlterField(
+            model_name='budgetitem',
+            name='header',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='budgets.budgetheader'),
+        ),
+        # AlterField would drop every single-column index on budget_id,
+        # including the partial unique index behind
+        # unique_open_period_per_budget, so only the state is altered and the
+        # plain foreign key index is dropped on its own.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='budgetperiod',
+                    name='budget',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='periods', to='budgets.budget'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_period_budget_index, create_period_budget_index),
+            ],
+        ),
+    ]
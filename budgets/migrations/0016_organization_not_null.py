@@ -0,0 +1,50 @@
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+from core.backfills import require_backfill
+
+# (model, backfill, index) in the order the backfills read each other.
+TABLES = [
+    ('budget', 'budgets.budget_organization', 'budgets_budget_organization'),
+    ('budgetheader', 'budgets.header_organization', 'budgets_header_organization'),
+    ('budgetitem', 'budgets.item_organization', 'budgets_item_organization'),
+    ('budgetitemamount', 'budgets.amount_organization', 'budgets_amount_organization'),
+]
+
+
+class Migration(migrations.Migration):
+    # Second release after 0013: stops until `manage.py run_backfills` has
+    # filled every row, then sets NOT NULL and builds the indexes without
+    # blocking writes.
+    atomic = False
+
+    dependencies = [
+        ('budgets', '0015_import_job_heartbeat'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        *[require_backfill(backfill) for _model_name, backfill, _index in TABLES],
+        *[
+            migrations.AlterField(
+                model_name=model_name,
+                name='organization',
+                field=models.ForeignKey(
+                    db_index=False,
+                    editable=False,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='+',
+                    to='accounts.organization',
+                ),
+            )
+            for model_name, _backfill, _index in TABLES
+        ],
+        *[
+            AddIndexConcurrently(
+                model_name=model_name,
+                index=models.Index(fields=['organization'], name=index),
+            )
+            for model_name, _backfill, index in TABLES
+        ],
+    ]
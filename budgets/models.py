@@ -5,24 +5,134 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import Q
 
-from construction.models import Order
+from accounts.models import Organization
+from construction.models import Order, Residual
+
+# Workbook header totals are sums of unrounded item prices; allow for the
+# rounding of each item to cents.
+TOTAL_TOLERANCE = Decimal("1.00")
+
+# BudgetHeader.path holds one fixed-width segment per level: the header's
+# position among its siblings. Sorting by path gives workbook order and every
+# subtree is a contiguous range of paths sharing its root's prefix.
+HEADER_PATH_STEP = 5
+HEADER_PATH_MAX_DEPTH = 10
+
+
+def header_path_segment(position: int) -> str:
+    if not 0 <= position < 10**HEADER_PATH_STEP:
+        raise ValueError(f"Header position {position} does not fit in the path.")
+    return f"{position:0{HEADER_PATH_STEP}d}"
+
+
+class OrganizationScopedQuerySet(models.QuerySet):
+    # Budgets and their headers, items and amounts carry the organization of
+    # the budget's construction, so tenant filters are a single-column lookup
+    # instead of a join through order and construction.
+
+    def for_organization(self, organization):
+        return self.filter(organization=organization)
+
+    def for_hierarchy(self, organization):
+        # The organization and its subcontractors, as accounts.services.in_hierarchy.
+        return self.filter(organization__ancestor_links__ancestor=organization)
+
+
+def header_ancestor_paths(path: str) -> list[str]:
+    return [path[:end] for end in range(HEADER_PATH_STEP, len(path), HEADER_PATH_STEP)]
 
 
 class Budget(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="budgets")
+    # Copied from order.construction; see move_budget_organizations for moves.
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+", editable=False, db_index=False
+    )
     name = models.CharField(max_length=200)
     excel_file = models.FileField(upload_to="budgets/excel/", null=True, blank=True)
+    excel_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = OrganizationScopedQuerySet.as_manager()
+
     class Meta:
         ordering = ["name"]
+        # The organization indexes are named so that they can be built
+        # concurrently (migration 0016).
+        indexes = [models.Index(fields=["organization"], name="budgets_budget_organization")]
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.organization_id is None and self.order_id is not None:
+            self.organization_id = self.order.construction.organization_id
+        super().save(*args, **kwargs)
+
+
+class ParsedWorkbook(models.Model):
+    sha256 = models.CharField(max_length=64)
+    parser_version = models.PositiveSmallIntegerField()
+    payload = models.BinaryField()
+    rows = models.PositiveIntegerField(default=0)
+    headers = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["sha256", "parser_version"],
+                name="unique_parsed_workbook_per_version",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.sha256[:12]} (v{self.parser_version})"
+
+
+class ImportJob(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name="import_jobs")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    rows_processed = models.PositiveIntegerField(default=0)
+    headers_created = models.PositiveIntegerField(default=0)
+    items_created = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched on every committed batch; a running job whose heartbeat is
+    # older than IMPORT_JOB_TIMEOUT has lost its worker.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # Incremented on every claim; a worker only writes to the job while the
+    # count still matches the one it claimed.
+    attempts = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.budget} ({self.status})"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in {self.Status.SUCCEEDED, self.Status.FAILED}
+
 
 class BudgetHeader(models.Model):
-    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name="headers")
+    # Covered by the unique (budget, path) index, which also returns a
+    # budget's headers in the default order.
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name="headers", db_index=False)
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+", editable=False, db_index=False
+    )
     parent = models.ForeignKey(
         "self",
         on_delete=models.CASCADE,
@@ -31,27 +141,123 @@ class BudgetHeader(models.Model):
         related_name="children",
     )
     title = models.CharField(max_length=200)
+    # "C" collation keeps byte order, so prefix lookups can use the index.
+    path = models.CharField(max_length=HEADER_PATH_STEP * HEADER_PATH_MAX_DEPTH, db_collation="C")
+    # Rollups of every item below this header, maintained at import time.
+    total_price = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0.00"))
+    vat = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0.00"))
+    total_with_vat = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0.00"))
+    # The header's own Cena from the workbook, kept to check the rollup.
+    workbook_total = models.DecimalField(max_digits=16, decimal_places=2, null=True, blank=True)
+
+    objects = OrganizationScopedQuerySet.as_manager()
 
     class Meta:
-        ordering = ["title"]
+        ordering = ["budget_id", "path"]
+        indexes = [models.Index(fields=["organization"], name="budgets_header_organization")]
+        constraints = [
+            # Deferred so a re-import can renumber siblings in any order.
+            models.UniqueConstraint(
+                fields=["budget", "path"],
+                name="budgets_header_unique_path",
+                deferrable=models.Deferrable.DEFERRED,
+            )
+        ]
 
     def __str__(self) -> str:
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self.organization_id is None and self.budget_id is not None:
+            self.organization_id = self.budget.organization_id
+        super().save(*args, **kwargs)
+
+    @property
+    def depth(self) -> int:
+        return len(self.path) // HEADER_PATH_STEP - 1
+
+    def ancestors(self) -> models.QuerySet:
+        return BudgetHeader.objects.filter(budget_id=self.budget_id, path__in=header_ancestor_paths(self.path))
+
+    def subtree(self) -> models.QuerySet:
+        return BudgetHeader.objects.filter(budget_id=self.budget_id, path__startswith=self.path)
+
+    def descendants(self) -> models.QuerySet:
+        return self.subtree().filter(path__gt=self.path)
+
+    def subtree_items(self) -> models.QuerySet:
+        return BudgetItem.objects.filter(header__budget_id=self.budget_id, header__path__startswith=self.path)
+
+    @property
+    def total_matches_workbook(self) -> bool:
+        return self.workbook_total is None or abs(self.workbook_total - self.total_price) <= TOTAL_TOLERANCE
+
 
 class BudgetItem(models.Model):
-    header = models.ForeignKey(BudgetHeader, on_delete=models.CASCADE, related_name="items")
+    # Covered by the (header, code, id) index, which also returns a header's
+    # items in the default order without a sort.
+    header = models.ForeignKey(BudgetHeader, on_delete=models.CASCADE, related_name="items", db_index=False)
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+", editable=False, db_index=False
+    )
     code = models.CharField(max_length=50, blank=True)
     description = models.TextField()
     measure_unit = models.CharField(max_length=50, blank=True)
     price_for_unit = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    quantity = models.DecimalField(max_digits=18, decimal_places=6, default=Decimal("0"))
+    total_price = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0.00"))
+    vat_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    vat = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0.00"))
+    total_with_vat = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal("0.00"))
+
+    objects = OrganizationScopedQuerySet.as_manager()
 
     class Meta:
-        ordering = ["code", "description"]
+        # Ties break on the primary key (workbook order): the description is
+        # unbounded text, too large to index safely.
+        ordering = ["code", "pk"]
+        indexes = [
+            models.Index(fields=["header", "code", "id"], name="budgets_item_header_code"),
+            models.Index(fields=["organization"], name="budgets_item_organization"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.code} {self.description}".strip()
 
+    def save(self, *args, **kwargs):
+        if self.organization_id is None and self.header_id is not None:
+            self.organization_id = self.header.organization_id
+        super().save(*args, **kwargs)
+
+
+class BudgetItemMeasurement(models.Model):
+    class Kind(models.TextChoices):
+        MEASUREMENT = "measurement", "Výkaz výměr"
+        WASTE = "waste", "Ztratné"
+        LINE = "line", "Line"
+
+    # The unique (budget_item, position) index doubles as the lookup index, so
+    # the foreign key does not get a separate one.
+    budget_item = models.ForeignKey(
+        BudgetItem, on_delete=models.CASCADE, related_name="measurements", db_index=False
+    )
+    position = models.PositiveSmallIntegerField()
+    kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.LINE)
+    text = models.TextField(blank=True)
+    value = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
+
+    class Meta:
+        ordering = ["budget_item", "position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["budget_item", "position"],
+                name="unique_measurement_position_per_item",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.budget_item_id}#{self.position} {self.text}"
+
 
 class BudgetPeriod(models.Model):
     class Status(models.TextChoices):
@@ -61,7 +267,10 @@ class BudgetPeriod(models.Model):
         DECLINED = "declined", "Declined"
         CLOSED = "closed", "Closed"
 
-    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name="periods")
+    # Covered by the (budget, created_at) index, which serves the default order
+    # and "periods before this one" lookups. The open-period check uses the
+    # partial unique index.
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name="periods", db_index=False)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.OPEN)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="budget_periods"
@@ -73,9 +282,12 @@ class BudgetPeriod(models.Model):
     decline_payment = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     decline_penalty = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     decline_fee = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    # Bumped by every status transition; see services.transition_period.
+    version = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["budget", "created_at"], name="budgets_period_budget_created")]
         constraints = [
             models.UniqueConstraint(
                 fields=["budget"],
@@ -90,10 +302,24 @@ class BudgetPeriod(models.Model):
 
 class BudgetItemAmount(models.Model):
     period = models.ForeignKey(BudgetPeriod, on_delete=models.CASCADE, related_name="item_amounts")
-    budget_item = models.ForeignKey(BudgetItem, on_delete=models.CASCADE, related_name="period_amounts")
+    # Covered by the (budget_item, period) index, which also serves "newest
+    # amount of an item up to a period" lookups in reports. It includes the
+    # amount, so those lookups are index-only scans.
+    budget_item = models.ForeignKey(
+        BudgetItem, on_delete=models.CASCADE, related_name="period_amounts", db_index=False
+    )
     amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+", editable=False, db_index=False
+    )
+
+    objects = OrganizationScopedQuerySet.as_manager()
 
     class Meta:
+        indexes = [
+            models.Index(fields=["budget_item", "period"], include=["amount"], name="budgets_amount_covering"),
+            models.Index(fields=["organization"], name="budgets_amount_organization"),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["period", "budget_item"],
@@ -104,6 +330,11 @@ class BudgetItemAmount(models.Model):
     def __str__(self) -> str:
         return f"{self.budget_item} ({self.amount})"
 
+    def save(self, *args, **kwargs):
+        if self.organization_id is None and self.budget_item_id is not None:
+            self.organization_id = self.budget_item.organization_id
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.amount is not None and self.amount < 0:
             raise ValidationError("Amount must be non-negative.")
@@ -111,16 +342,131 @@ class BudgetItemAmount(models.Model):
             if self.period.budget_id != self.budget_item.header.budget_id:
                 raise ValidationError("Budget item does not belong to the same budget as period.")
 
-            if self.period.created_at:
-                previous_amount = (
-                    BudgetItemAmount.objects.filter(
-                        budget_item=self.budget_item,
-                        period__budget=self.period.budget,
-                        period__created_at__lt=self.period.created_at,
-                    )
-                    .order_by("-period__created_at")
-                    .values_list("amount", flat=True)
-                    .first()
-                )
-                if previous_amount is not None and self.amount < previous_amount:
-                    raise ValidationError("Amount cannot be lower than previous period.")
+            ledger = BudgetItemLedger.objects.filter(budget_item_id=self.budget_item_id).first()
+            previous_amount = ledger.previous_for(self.period_id) if ledger else None
+            if previous_amount is not None and self.amount < previous_amount:
+                raise ValidationError("Amount cannot be lower than previous period.")
+
+
+class BudgetItemLedger(models.Model):
+    # Latest committed amount per item: amounts are copied here when their
+    # period is submitted and reverted when it is declined, so validation and
+    # progress views read one row per item instead of the item's history.
+    budget_item = models.OneToOneField(
+        BudgetItem, on_delete=models.CASCADE, primary_key=True, related_name="ledger"
+    )
+    period = models.ForeignKey(BudgetPeriod, on_delete=models.CASCADE, related_name="+")
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # The value this period replaced, restored if the period is declined.
+    previous_period = models.ForeignKey(
+        BudgetPeriod, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    previous_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.budget_item_id}: {self.amount}"
+
+    def previous_for(self, period_id: int) -> Decimal | None:
+        # The amount a period must not go below: its own committed value does
+        # not count, only what earlier periods committed.
+        return self.previous_amount if self.period_id == period_id else self.amount
+
+
+class BudgetPeriodSummary(models.Model):
+    # Written once when a period is closed; reports read these instead of
+    # recomputing amount × unit price over every item.
+    period = models.OneToOneField(
+        BudgetPeriod, on_delete=models.CASCADE, primary_key=True, related_name="summary"
+    )
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name="period_summaries")
+    previous_period = models.ForeignKey(
+        BudgetPeriod, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    # Value drawn up to and including this period, and within this period.
+    total = models.DecimalField(max_digits=16, decimal_places=2)
+    delta = models.DecimalField(max_digits=16, decimal_places=2)
+    items = models.PositiveIntegerField(default=0)
+    decline_payment = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    decline_penalty = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    decline_fee = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    closed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["budget_id", "closed_at"]
+
+    def __str__(self) -> str:
+        return f"{self.period} {self.total}"
+
+
+class BudgetPeriodHeaderSummary(models.Model):
+    # Title and path are copied so the snapshot survives a re-import that
+    # renames or removes the header.
+    summary = models.ForeignKey(BudgetPeriodSummary, on_delete=models.CASCADE, related_name="headers")
+    header = models.ForeignKey(BudgetHeader, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    path = models.CharField(max_length=HEADER_PATH_STEP * HEADER_PATH_MAX_DEPTH, db_collation="C")
+    title = models.CharField(max_length=200)
+    total = models.DecimalField(max_digits=16, decimal_places=2)
+    delta = models.DecimalField(max_digits=16, decimal_places=2)
+
+    class Meta:
+        ordering = ["summary_id", "path"]
+        constraints = [
+            models.UniqueConstraint(fields=["summary", "path"], name="budgets_period_header_summary_unique_path")
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.title} {self.total}"
+
+    @property
+    def depth(self) -> int:
+        return len(self.path) // HEADER_PATH_STEP - 1
+
+
+class BudgetPeriodInvoice(models.Model):
+    # Cached result of invoicing.period_invoices. ``fingerprint`` covers the
+    # period history of the budget and the contract terms it was computed
+    # from; a mismatch means the row is stale and gets recomputed.
+    period = models.OneToOneField(
+        BudgetPeriod, on_delete=models.CASCADE, primary_key=True, related_name="invoice"
+    )
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="period_invoices")
+    fingerprint = models.CharField(max_length=64)
+    # Value drawn in the period, the contractor's share of it and the rest.
+    gross = models.DecimalField(max_digits=16, decimal_places=2)
+    contractor_share = models.DecimalField(max_digits=16, decimal_places=2)
+    net = models.DecimalField(max_digits=16, decimal_places=2)
+    reverse_charge = models.BooleanField(default=False)
+    vat = models.DecimalField(max_digits=16, decimal_places=2)
+    retention = models.DecimalField(max_digits=16, decimal_places=2)
+    deductions = models.DecimalField(max_digits=16, decimal_places=2)
+    payable = models.DecimalField(max_digits=16, decimal_places=2)
+    accepted_at = models.DateTimeField(null=True, blank=True)
+    due_date = models.DateField(null=True, blank=True)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["order_id", "period_id"]
+
+    def __str__(self) -> str:
+        return f"{self.period} {self.payable}"
+
+
+class BudgetPeriodRetention(models.Model):
+    # Percentage and end date are copied so the amount stays explained if the
+    # residual is edited or removed before the invoice is recomputed.
+    invoice = models.ForeignKey(BudgetPeriodInvoice, on_delete=models.CASCADE, related_name="retentions")
+    residual = models.ForeignKey(Residual, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # Copied from the order so the release schedule of an organization is one
+    # index range; see invoicing.upcoming_releases.
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="+", db_index=False)
+    percentage = models.IntegerField()
+    amount = models.DecimalField(max_digits=16, decimal_places=2)
+    release_date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["invoice_id", "release_date", "pk"]
+        indexes = [models.Index(fields=["organization", "release_date"], name="budgets_retention_release")]
+
+    def __str__(self) -> str:
+        return f"{self.percentage}% {self.amount}"
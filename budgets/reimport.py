@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+
+from .importers import (
+    IMPORT_BATCH_SIZE,
+    BudgetWriter,
+    ExcelImportError,
+    ParsedHeader,
+    ParsedItem,
+    ParsedMeasurement,
+    iter_workbook_records,
+    rollup_header_totals,
+    to_cents,
+)
+from .models import Budget, BudgetHeader, BudgetItem, BudgetItemAmount, BudgetItemMeasurement, ImportJob
+
+logger = logging.getLogger(__name__)
+
+ITEM_FIELDS = [
+    "code",
+    "description",
+    "measure_unit",
+    "price_for_unit",
+    "quantity",
+    "total_price",
+    "vat_rate",
+    "vat",
+    "total_with_vat",
+]
+
+# A header is identified by the titles on its path from the root. Siblings with
+# the same title are told apart by their order of appearance.
+HeaderKey = Tuple[Tuple[str, int], ...]
+ItemKey = Tuple[HeaderKey, str, int]
+MeasurementLine = Tuple[str, str, Optional[Decimal]]
+
+
+class ReimportError(ExcelImportError):
+    pass
+
+
+@dataclass
+class ItemChange:
+    item_id: int
+    item: ParsedItem
+    changes: Dict[str, Tuple[object, object]]
+    measurements: List[ParsedMeasurement] = field(default_factory=list)
+
+
+@dataclass
+class ReimportPlan:
+    budget: Budget
+    sha256: str
+    new_headers: List[ParsedHeader] = field(default_factory=list)
+    deleted_header_ids: List[int] = field(default_factory=list)
+    new_items: List[ParsedItem] = field(default_factory=list)
+    new_measurements: List[ParsedMeasurement] = field(default_factory=list)
+    updated_items: List[ItemChange] = field(default_factory=list)
+    deleted_item_ids: List[int] = field(default_factory=list)
+    protected_item_ids: List[int] = field(default_factory=list)
+    unchanged_items: int = 0
+    header_paths: Dict[int, str] = field(default_factory=dict, repr=False)
+    # Kept headers whose position in the tree changed, with their new path.
+    moved_headers: Dict[int, str] = field(default_factory=dict, repr=False)
+    workbook_totals: Dict[int, Optional[Decimal]] = field(default_factory=dict, repr=False)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(
+            self.new_headers
+            or self.deleted_header_ids
+            or self.new_items
+            or self.updated_items
+            or self.deleted_item_ids
+            or self.moved_headers
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "budget": self.budget.pk,
+            "sha256": self.sha256,
+            "headers": {
+                "created": len(self.new_headers),
+                "deleted": len(self.deleted_header_ids),
+                "moved": len(self.moved_headers),
+            },
+            "items": {
+                "created": len(self.new_items),
+                "updated": len(self.updated_items),
+                "deleted": len(self.deleted_item_ids),
+                "unchanged": self.unchanged_items,
+                "deleted_with_amounts": len(self.protected_item_ids),
+            },
+            "measurements": {"created": len(self.new_measurements)},
+            "changes": [
+                {
+                    "item": change.item_id,
+                    "fields": {name: [str(old), str(new)] for name, (old, new) in change.changes.items()},
+                }
+                for change in self.updated_items
+            ],
+            "created": [
+                {"header": header_path(item.header), "code": item.code, "description": item.description}
+                for item in self.new_items
+            ],
+            "deleted": self.deleted_item_ids,
+        }
+
+
+def header_path(header: ParsedHeader) -> str:
+    titles = []
+    while header is not None:
+        titles.append(header.title)
+        header = header.parent
+    return " / ".join(reversed(titles))
+
+
+def plan_reimport(budget: Budget, file, sha256: str, fast_reader: bool = True) -> ReimportPlan:
+    # Existing rows are indexed by key (two queries); the incoming workbook is
+    # streamed against that index, so only the delta is kept in memory.
+    plan = ReimportPlan(budget=budget, sha256=sha256)
+    existing_headers, existing_paths = index_existing_headers(budget)
+    existing_items = index_existing_items(budget, existing_headers)
+    header_ids = {key: header_id for header_id, key in existing_headers.items()}
+    plan.header_paths = {
+        header_id: " / ".join(title for title, _ordinal in key) for header_id, key in existing_headers.items()
+    }
+    matched_headers = set()
+
+    header_keys: Dict[ParsedHeader, HeaderKey] = {}
+    header_counts: Dict[Tuple[Optional[HeaderKey], str], int] = defaultdict(int)
+    item_counts: Dict[Tuple[HeaderKey, str], int] = defaultdict(int)
+    unmatched_items: List[ParsedItem] = []
+    matched_items: List[Tuple[dict, ParsedItem]] = []
+    measurements: Dict[ParsedItem, List[ParsedMeasurement]] = defaultdict(list)
+
+    for record in iter_workbook_records(file, sha256, fast_reader=fast_reader):
+        if isinstance(record, ParsedMeasurement):
+            measurements[record.item].append(record)
+            continue
+        if isinstance(record, ParsedHeader):
+            parent_key = header_keys[record.parent] if record.parent else ()
+            ordinal = header_counts[(parent_key, record.title)]
+            header_counts[(parent_key, record.title)] += 1
+            key = parent_key + ((record.title, ordinal),)
+            header_keys[record] = key
+            header_id = header_ids.get(key)
+            if header_id is None:
+                plan.new_headers.append(record)
+            else:
+                record.instance = BudgetHeader(pk=header_id, budget=budget)
+                matched_headers.add(header_id)
+                if existing_paths[header_id] != record.path:
+                    plan.moved_headers[header_id] = record.path
+                plan.workbook_totals[header_id] = record.workbook_total
+            continue
+
+        key = item_key(header_keys[record.header], record.code, record.description, item_counts)
+        existing = existing_items.pop(key, None)
+        if existing is None:
+            unmatched_items.append(record)
+        else:
+            matched_items.append((existing, record))
+
+    # Items moved to another header keep their row when the code is unique
+    # among the unmatched items on both sides.
+    remaining_by_code: Dict[str, List[dict]] = defaultdict(list)
+    for existing in existing_items.values():
+        if existing["code"]:
+            remaining_by_code[existing["code"]].append(existing)
+    incoming_by_code: Dict[str, int] = defaultdict(int)
+    for record in unmatched_items:
+        if record.code:
+            incoming_by_code[record.code] += 1
+    for record in unmatched_items:
+        candidates = remaining_by_code.get(record.code) if record.code else None
+        if candidates and len(candidates) == 1 and incoming_by_code[record.code] == 1:
+            existing = candidates.pop()
+            existing_items.pop(existing["key"])
+            matched_items.append((existing, record))
+        else:
+            plan.new_items.append(record)
+            plan.new_measurements.extend(measurements.get(record, []))
+
+    existing_measurements = index_existing_measurements(budget)
+    for existing, record in matched_items:
+        compare_item(plan, existing, record, existing_measurements.get(existing["id"], []), measurements.get(record, []))
+
+    plan.deleted_item_ids = sorted(existing["id"] for existing in existing_items.values())
+    plan.deleted_header_ids = sorted(set(existing_headers) - matched_headers)
+    if plan.deleted_item_ids:
+        plan.protected_item_ids = sorted(
+            BudgetItemAmount.objects.filter(budget_item_id__in=plan.deleted_item_ids)
+            .values_list("budget_item_id", flat=True)
+            .distinct()
+        )
+    return plan
+
+
+def index_existing_headers(budget: Budget) -> Tuple[Dict[int, HeaderKey], Dict[int, str]]:
+    rows = BudgetHeader.objects.filter(budget=budget).order_by("path").values_list("pk", "parent_id", "title", "path")
+    children: Dict[Optional[int], List[Tuple[int, str]]] = defaultdict(list)
+    paths: Dict[int, str] = {}
+    for pk, parent_id, title, path in rows:
+        children[parent_id].append((pk, title))
+        paths[pk] = path
+
+    keys: Dict[int, HeaderKey] = {}
+    stack: List[Tuple[Optional[int], HeaderKey]] = [(None, ())]
+    while stack:
+        parent_id, parent_key = stack.pop()
+        counts: Dict[str, int] = defaultdict(int)
+        for pk, title in children.get(parent_id, []):
+            keys[pk] = parent_key + ((title, counts[title]),)
+            counts[title] += 1
+            stack.append((pk, keys[pk]))
+    return keys, paths
+
+
+def index_existing_items(budget: Budget, header_keys: Dict[int, HeaderKey]) -> Dict[ItemKey, dict]:
+    counts: Dict[Tuple[HeaderKey, str], int] = defaultdict(int)
+    items: Dict[ItemKey, dict] = {}
+    rows = (
+        BudgetItem.objects.filter(header__budget=budget)
+        .order_by("pk")
+        .values("id", "header_id", *ITEM_FIELDS)
+    )
+    for row in rows.iterator(chunk_size=IMPORT_BATCH_SIZE):
+        key = item_key(header_keys[row["header_id"]], row["code"], row["description"], counts)
+        row["key"] = key
+        items[key] = row
+    return items
+
+
+def index_existing_measurements(budget: Budget) -> Dict[int, List[MeasurementLine]]:
+    lines: Dict[int, List[MeasurementLine]] = defaultdict(list)
+    rows = (
+        BudgetItemMeasurement.objects.filter(budget_item__header__budget=budget)
+        .order_by("budget_item_id", "position")
+        .values_list("budget_item_id", "kind", "text", "value")
+    )
+    for item_id, kind, text, value in rows.iterator(chunk_size=IMPORT_BATCH_SIZE):
+        lines[item_id].append((kind, text, value))
+    return lines
+
+
+def item_key(header_key: HeaderKey, code: str, description: str, counts) -> ItemKey:
+    identity = code or description
+    ordinal = counts[(header_key, identity)]
+    counts[(header_key, identity)] += 1
+    return header_key, identity, ordinal
+
+
+def item_values(record: ParsedItem) -> dict:
+    values = {name: getattr(record, name) for name in ITEM_FIELDS}
+    values["price_for_unit"] = to_cents(record.price_for_unit)
+    return values
+
+
+def compare_item(
+    plan: ReimportPlan,
+    existing: dict,
+    record: ParsedItem,
+    existing_measurements: List[MeasurementLine],
+    measurements: List[ParsedMeasurement],
+) -> None:
+    incoming = item_values(record)
+    changes = {name: (existing[name], incoming[name]) for name in ITEM_FIELDS if existing[name] != incoming[name]}
+    if record.header.instance is None or record.header.instance.pk != existing["header_id"]:
+        changes["header"] = (plan.header_paths[existing["header_id"]], header_path(record.header))
+    incoming_measurements = [(line.kind, line.text, line.value) for line in measurements]
+    if incoming_measurements != existing_measurements:
+        changes["measurements"] = (len(existing_measurements), len(incoming_measurements))
+    else:
+        measurements = []
+    if changes:
+        plan.updated_items.append(
+            ItemChange(item_id=existing["id"], item=record, changes=changes, measurements=measurements)
+        )
+    else:
+        plan.unchanged_items += 1
+
+
+def apply_reimport(plan: ReimportPlan, force: bool = False, batch_size: int = IMPORT_BATCH_SIZE) -> None:
+    if plan.protected_item_ids and not force:
+        raise ReimportError(
+            f"{len(plan.protected_item_ids)} removed items already have period amounts; "
+            "apply with force to delete them."
+        )
+    budget = plan.budget
+    with transaction.atomic():
+        if ImportJob.objects.filter(
+            budget=budget, status__in=[ImportJob.Status.QUEUED, ImportJob.Status.RUNNING]
+        ).exists():
+            raise ReimportError("Budget import is still running.")
+
+        # Sibling positions shift when headers are added or removed; the
+        # unique path constraint is deferred, so old and new paths may overlap
+        # until commit.
+        BudgetHeader.objects.bulk_update(
+            [BudgetHeader(pk=pk, path=path) for pk, path in plan.moved_headers.items()],
+            ["path"],
+            batch_size=batch_size,
+        )
+        writer = BudgetWriter(budget, batch_size=batch_size)
+        for header in plan.new_headers:
+            writer.add(header)
+        writer.flush()
+        BudgetItem.objects.bulk_update(
+            [
+                BudgetItem(
+                    pk=change.item_id,
+                    header_id=change.item.header.instance.pk,
+                    **item_values(change.item),
+                )
+                for change in plan.updated_items
+            ],
+            ["header", *ITEM_FIELDS],
+            batch_size=batch_size,
+        )
+        remeasured = [change for change in plan.updated_items if "measurements" in change.changes]
+        if remeasured:
+            BudgetItemMeasurement.objects.filter(
+                budget_item_id__in=[change.item_id for change in remeasured]
+            ).delete()
+        for item in plan.new_items:
+            writer.add(item)
+        writer.flush()
+        for change in remeasured:
+            change.item.instance = BudgetItem(pk=change.item_id)
+            for measurement in change.measurements:
+                writer.add(measurement)
+        for measurement in plan.new_measurements:
+            writer.add(measurement)
+        writer.flush()
+        if plan.deleted_item_ids:
+            BudgetItem.objects.filter(pk__in=plan.deleted_item_ids).delete()
+        if plan.deleted_header_ids:
+            BudgetHeader.objects.filter(pk__in=plan.deleted_header_ids).delete()
+        rollup_header_totals(budget, workbook_totals=plan.workbook_totals, batch_size=batch_size)
+
+    logger.info(
+        "Re-imported budget %s: %d headers created, %d deleted; %d items created, %d updated, %d deleted",
+        budget.pk,
+        len(plan.new_headers),
+        len(plan.deleted_header_ids),
+        len(plan.new_items),
+        len(plan.updated_items),
+        len(plan.deleted_item_ids),
+    )
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+from django.db import connection
+
+from .models import HEADER_PATH_STEP, Budget, BudgetPeriod
+
+REPORT_PAGE_SIZE = 100
+ORDER_PATH = "path"
+ORDER_MOVERS = "movers"
+ORDERINGS = {
+    ORDER_PATH: "path, id",
+    ORDER_MOVERS: "abs(delta_value) DESC, path, id",
+}
+
+# Amounts are cumulative, so an item's amount at a period is its newest amount
+# at or before that period. Period ids follow creation order within a budget,
+# and each lookup is one probe of the (budget_item, period) index, so the cost
+# depends on the number of items, not on the number of periods.
+ITEM_VALUES_SQL = """
+    SELECT i.id, i.code, i.description, i.measure_unit, i.quantity, i.price_for_unit,
+           h.id AS header_id, h.path, h.title AS header_title,
+           COALESCE(base.amount, 0) AS base_amount,
+           COALESCE(target.amount, 0) AS target_amount,
+           round(COALESCE(base.amount, 0) * i.price_for_unit, 2) AS base_value,
+           round(COALESCE(target.amount, 0) * i.price_for_unit, 2) AS target_value
+    FROM budgets_budgetitem i
+    JOIN budgets_budgetheader h ON h.id = i.header_id
+    LEFT JOIN LATERAL (
+        SELECT a.amount FROM budgets_budgetitemamount a
+        WHERE a.budget_item_id = i.id AND a.period_id <= %(base)s
+        ORDER BY a.period_id DESC LIMIT 1
+    ) base ON true
+    LEFT JOIN LATERAL (
+        SELECT a.amount FROM budgets_budgetitemamount a
+        WHERE a.budget_item_id = i.id AND a.period_id <= %(target)s
+        ORDER BY a.period_id DESC LIMIT 1
+    ) target ON true
+    WHERE h.budget_id = %(budget)s
+"""
+
+ITEM_DELTAS_SQL = f"""
+    WITH item_values AS ({ITEM_VALUES_SQL}),
+    deltas AS (
+        SELECT *,
+               target_amount - base_amount AS delta_amount,
+               target_value - base_value AS delta_value,
+               CASE WHEN quantity > 0 THEN round(target_amount / quantity * 100, 1) END AS progress
+        FROM item_values
+    )
+    SELECT *,
+           rank() OVER (ORDER BY abs(delta_value) DESC) AS mover_rank,
+           count(*) OVER () AS total_rows
+    FROM deltas
+    WHERE %(changed_only)s = false OR delta_amount <> 0
+"""
+
+# Item values are summed per header, then added to every ancestor by cutting
+# the header path at each level, so the rollup joins on the path index instead
+# of walking the tree.
+HEADER_DELTAS_SQL = f"""
+    WITH item_values AS ({ITEM_VALUES_SQL}),
+    own AS (
+        SELECT path, sum(base_value) AS base_value, sum(target_value) AS target_value
+        FROM item_values GROUP BY path
+    ),
+    rolled AS (
+        SELECT left(own.path, level.n * {HEADER_PATH_STEP}) AS path,
+               sum(own.base_value) AS base_value, sum(own.target_value) AS target_value
+        FROM own CROSS JOIN LATERAL generate_series(1, length(own.path) / {HEADER_PATH_STEP}) AS level(n)
+        GROUP BY 1
+    )
+    SELECT h.id, h.path, h.title, h.total_price,
+           COALESCE(r.base_value, 0) AS base_value,
+           COALESCE(r.target_value, 0) AS target_value,
+           COALESCE(r.target_value, 0) - COALESCE(r.base_value, 0) AS delta_value,
+           CASE WHEN h.total_price > 0 THEN round(COALESCE(r.target_value, 0) / h.total_price * 100, 1) END
+               AS progress
+    FROM budgets_budgetheader h
+    LEFT JOIN rolled r ON r.path = h.path
+    WHERE h.budget_id = %(budget)s AND length(h.path) <= %(max_length)s
+    ORDER BY h.path
+"""
+
+# What each amount row adds over the item's previous amount, summed per period
+# and accumulated over the periods in creation order.
+PROGRESS_SQL = """
+    WITH steps AS (
+        SELECT a.period_id,
+               round(a.amount * i.price_for_unit, 2)
+               - COALESCE(round(lag(a.amount) OVER (PARTITION BY a.budget_item_id ORDER BY a.period_id)
+                                * i.price_for_unit, 2), 0) AS delta_value
+        FROM budgets_budgetitemamount a
+        JOIN budgets_budgetperiod p ON p.id = a.period_id
+        JOIN budgets_budgetitem i ON i.id = a.budget_item_id
+        WHERE p.budget_id = %(budget)s
+    ),
+    per_period AS (
+        SELECT period_id, sum(delta_value) AS delta_value FROM steps GROUP BY period_id
+    ),
+    budgeted AS (
+        SELECT sum(total_price) AS total_price FROM budgets_budgetheader
+        WHERE budget_id = %(budget)s AND parent_id IS NULL
+    ),
+    cumulative AS (
+        SELECT p.id, p.status, p.created_at,
+               COALESCE(pp.delta_value, 0) AS delta_value,
+               sum(COALESCE(pp.delta_value, 0)) OVER (ORDER BY p.id) AS total_value
+        FROM budgets_budgetperiod p
+        LEFT JOIN per_period pp ON pp.period_id = p.id
+        WHERE p.budget_id = %(budget)s
+    )
+    SELECT c.*,
+           CASE WHEN b.total_price > 0 THEN round(c.total_value / b.total_price * 100, 1) END AS progress
+    FROM cumulative c CROSS JOIN budgeted b
+    ORDER BY c.id
+"""
+
+
+@dataclass
+class ReportPage:
+    rows: List[dict] = field(default_factory=list)
+    number: int = 1
+    page_size: int = REPORT_PAGE_SIZE
+    count: int = 0
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-self.count // self.page_size))
+
+    @property
+    def has_previous(self) -> bool:
+        return self.number > 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.number < self.pages
+
+
+def period_item_deltas(
+    base: Optional[BudgetPeriod],
+    target: BudgetPeriod,
+    page: int = 1,
+    page_size: int = REPORT_PAGE_SIZE,
+    order: str = ORDER_PATH,
+    changed_only: bool = False,
+) -> ReportPage:
+    # One query per page; the total row count comes from a window over the
+    # same result, so no separate COUNT is needed.
+    page = max(1, page)
+    sql = f"{ITEM_DELTAS_SQL} ORDER BY {ORDERINGS[order]} LIMIT %(limit)s OFFSET %(offset)s"
+    params = comparison_params(base, target, changed_only=changed_only, limit=page_size, offset=(page - 1) * page_size)
+    rows = fetch_dicts(sql, params)
+    count = rows[0]["total_rows"] if rows else 0
+    return ReportPage(rows=rows, number=page, page_size=page_size, count=count)
+
+
+def iter_period_item_deltas(
+    base: Optional[BudgetPeriod],
+    target: BudgetPeriod,
+    changed_only: bool = False,
+    chunk_size: int = 2000,
+) -> Iterator[dict]:
+    # Export path: every row in path order, read through a server-side cursor.
+    sql = f"{ITEM_DELTAS_SQL} ORDER BY {ORDERINGS[ORDER_PATH]}"
+    params = comparison_params(base, target, changed_only=changed_only)
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column.name for column in cursor.description]
+        while chunk := cursor.fetchmany(chunk_size):
+            for row in chunk:
+                yield dict(zip(columns, row))
+
+
+def period_header_deltas(
+    base: Optional[BudgetPeriod],
+    target: BudgetPeriod,
+    max_depth: Optional[int] = None,
+) -> List[dict]:
+    max_length = HEADER_PATH_STEP * (max_depth + 1) if max_depth is not None else 10**6
+    rows = fetch_dicts(HEADER_DELTAS_SQL, comparison_params(base, target, max_length=max_length))
+    for row in rows:
+        row["depth"] = len(row["path"]) // HEADER_PATH_STEP - 1
+    return rows
+
+
+def budget_progress(budget: Budget) -> List[dict]:
+    return fetch_dicts(PROGRESS_SQL, {"budget": budget.pk})
+
+
+def comparison_params(base: Optional[BudgetPeriod], target: BudgetPeriod, **extra) -> dict:
+    if base is not None and base.budget_id != target.budget_id:
+        raise ValueError("Compared periods must belong to the same budget.")
+    return {"budget": target.budget_id, "base": base.pk if base else 0, "target": target.pk, **extra}
+
+
+def fetch_dicts(sql: str, params: dict) -> List[dict]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column.name for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
@@ -1,50 +1,187 @@
+import logging
+from collections import defaultdict
 from decimal import Decimal
+from datetime import timedelta
+from typing import Dict, List, Mapping
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import F
 from django.utils import timezone
 
-from .models import BudgetItem, BudgetItemAmount, BudgetPeriod
+from .importers import BudgetWriter, ExcelImportError, import_budget_from_excel
+from .invoicing import refresh_budget_invoices
+from .models import (
+    Budget,
+    BudgetHeader,
+    BudgetItem,
+    BudgetItemAmount,
+    BudgetItemLedger,
+    BudgetPeriod,
+    BudgetPeriodRetention,
+    ImportJob,
+)
+from .snapshots import write_period_snapshot
+from .storage import release_budget_workbook
 
+logger = logging.getLogger(__name__)
 
-def create_period(budget, created_by=None):
-    if budget.periods.filter(status=BudgetPeriod.Status.OPEN).exists():
-        raise ValidationError("An open period already exists.")
-    return BudgetPeriod.objects.create(
-        budget=budget,
-        status=BudgetPeriod.Status.OPEN,
-        created_by=created_by,
-    )
+# First key of the per-budget advisory lock taken by period changes.
+PERIOD_LOCK_NAMESPACE = 4101
+
+
+class PeriodConflictError(ValidationError):
+    pass
+
+
+class ImportJobLost(Exception):
+    pass
+
+
+def create_period(budget, created_by=None, copy_forward: bool = False):
+    with transaction.atomic():
+        lock_budget_periods(budget.pk)
+        if budget.periods.filter(status=BudgetPeriod.Status.OPEN).exists():
+            raise ValidationError("An open period already exists.")
+        period = BudgetPeriod.objects.create(
+            budget=budget,
+            status=BudgetPeriod.Status.OPEN,
+            created_by=created_by,
+        )
+        if copy_forward:
+            copy_forward_amounts(period)
+    return period
+
+
+def move_budget_organizations(budgets) -> int:
+    # Re-derives the organization of the given budgets from their order's
+    # construction; budgets that moved take their headers, items, amounts and
+    # retention schedule along, one UPDATE per table and target organization.
+    moved: Dict[int, List[int]] = defaultdict(list)
+    stale = budgets.exclude(organization_id=F("order__construction__organization_id"))
+    for pk, organization_id in stale.values_list("pk", "order__construction__organization_id"):
+        moved[organization_id].append(pk)
+    with transaction.atomic():
+        for organization_id, budget_ids in moved.items():
+            Budget.objects.filter(pk__in=budget_ids).update(organization_id=organization_id)
+            BudgetHeader.objects.filter(budget_id__in=budget_ids).update(organization_id=organization_id)
+            BudgetItem.objects.filter(header__budget_id__in=budget_ids).update(organization_id=organization_id)
+            BudgetItemAmount.objects.filter(period__budget_id__in=budget_ids).update(organization_id=organization_id)
+            BudgetPeriodRetention.objects.filter(invoice__period__budget_id__in=budget_ids).update(
+                organization_id=organization_id
+            )
+    return sum(len(budget_ids) for budget_ids in moved.values())
+
+
+def copy_forward_amounts(period: BudgetPeriod) -> int:
+    # Seeds the period with every item's committed amount in one INSERT ...
+    # SELECT from the ledger, so only changed rows need to be written later.
+    amounts = BudgetItemAmount._meta
+    ledger = BudgetItemLedger._meta
+    periods = BudgetPeriod._meta
+    budgets = Budget._meta
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {quote(amounts.db_table)} (period_id, budget_item_id, amount, organization_id)
+            SELECT %s, ledger.budget_item_id, ledger.amount, budget.organization_id
+            FROM {quote(ledger.db_table)} AS ledger
+            JOIN {quote(periods.db_table)} AS committed ON committed.id = ledger.period_id
+            JOIN {quote(budgets.db_table)} AS budget ON budget.id = committed.budget_id
+            WHERE committed.budget_id = %s
+            """,
+            [period.pk, period.budget_id],
+        )
+        return cursor.rowcount
 
 
 def set_item_amount(period: BudgetPeriod, item: BudgetItem, amount: Decimal) -> BudgetItemAmount:
+    set_item_amounts(period, {item.pk: amount})
+    return BudgetItemAmount.objects.get(period=period, budget_item=item)
+
+
+def set_item_amounts(period: BudgetPeriod, amounts: Mapping[int, object]) -> int:
+    # Validates the whole batch with two set-based queries (budget membership
+    # and the items' ledger rows), then upserts every row in one statement.
+    # Errors are collected per item id and raised together. The period row is
+    # locked while open and unchanged, so a concurrent submit either waits
+    # for these amounts or makes this call fail with a conflict.
     if period.status != BudgetPeriod.Status.OPEN:
         raise ValidationError("Amounts can only be updated for an open period.")
     if period.created_at is None:
         raise ValidationError("Period must be saved before adding amounts.")
 
-    obj, _created = BudgetItemAmount.objects.get_or_create(period=period, budget_item=item)
-    obj.amount = amount
-    obj.full_clean()
-    obj.save()
-    return obj
+    amount_field = BudgetItemAmount._meta.get_field("amount")
+    errors: Dict[str, List[str]] = {}
+    cleaned: Dict[int, Decimal] = {}
+    for item_id, value in amounts.items():
+        try:
+            if not str(item_id).isdigit():
+                raise ValidationError("Invalid budget item id.")
+            amount = amount_field.clean(value, None)
+            if amount is None:
+                raise ValidationError("Amount is required.")
+            if amount < 0:
+                raise ValidationError("Amount must be non-negative.")
+        except ValidationError as exc:
+            errors[str(item_id)] = exc.messages
+            continue
+        cleaned[int(item_id)] = amount
+    if not cleaned:
+        if errors:
+            raise ValidationError(errors)
+        return 0
+
+    with transaction.atomic():
+        locked = BudgetPeriod.objects.select_for_update().filter(
+            pk=period.pk, status=BudgetPeriod.Status.OPEN, version=period.version
+        )
+        if not locked.values_list("pk", flat=True):
+            raise PeriodConflictError("Period was changed by someone else; reload it and try again.")
+
+        known = dict(
+            BudgetItem.objects.filter(pk__in=cleaned, header__budget_id=period.budget_id).values_list(
+                "pk", "organization_id"
+            )
+        )
+        for item_id in cleaned.keys() - known:
+            errors[str(item_id)] = ["Budget item does not belong to the same budget as period."]
+        for ledger in BudgetItemLedger.objects.filter(budget_item_id__in=known):
+            previous_amount = ledger.previous_for(period.pk)
+            if previous_amount is not None and cleaned[ledger.budget_item_id] < previous_amount:
+                message = f"Amount cannot be lower than previous period ({previous_amount})."
+                errors[str(ledger.budget_item_id)] = [message]
+        if errors:
+            raise ValidationError(errors)
+
+        BudgetItemAmount.objects.bulk_create(
+            [
+                BudgetItemAmount(period=period, budget_item_id=item_id, amount=amount, organization_id=known[item_id])
+                for item_id, amount in cleaned.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["period", "budget_item"],
+            update_fields=["amount"],
+        )
+    return len(cleaned)
 
 
 def submit_period(period: BudgetPeriod) -> BudgetPeriod:
     if period.status != BudgetPeriod.Status.OPEN:
         raise ValidationError("Only open periods can be submitted.")
-    period.status = BudgetPeriod.Status.SUBMITTED
-    period.submitted_at = timezone.now()
-    period.save(update_fields=["status", "submitted_at"])
+    with transaction.atomic():
+        transition_period(period, BudgetPeriod.Status.SUBMITTED, submitted_at=timezone.now())
+        commit_period_amounts(period)
     return period
 
 
 def accept_period(period: BudgetPeriod) -> BudgetPeriod:
     if period.status != BudgetPeriod.Status.SUBMITTED:
         raise ValidationError("Only submitted periods can be accepted.")
-    period.status = BudgetPeriod.Status.ACCEPTED
-    period.reviewed_at = timezone.now()
-    period.save(update_fields=["status", "reviewed_at"])
+    with transaction.atomic():
+        transition_period(period, BudgetPeriod.Status.ACCEPTED, reviewed_at=timezone.now())
     return period
 
 
@@ -57,34 +194,244 @@ def decline_period(
     if period.status != BudgetPeriod.Status.SUBMITTED:
         raise ValidationError("Only submitted periods can be declined.")
     with transaction.atomic():
-        period = BudgetPeriod.objects.select_for_update().get(pk=period.pk)
-        if (
-            BudgetPeriod.objects.filter(budget=period.budget, status=BudgetPeriod.Status.OPEN)
-            .exclude(pk=period.pk)
-            .exists()
-        ):
+        # Reopening competes with create_period for the budget's single open
+        # period, so both take the budget lock.
+        lock_budget_periods(period.budget_id)
+        other_open = BudgetPeriod.objects.filter(budget_id=period.budget_id, status=BudgetPeriod.Status.OPEN)
+        if other_open.exists():
             raise ValidationError("Cannot reopen period while another period is open.")
-        period.status = BudgetPeriod.Status.OPEN
-        period.reviewed_at = timezone.now()
-        period.decline_payment = payment
-        period.decline_penalty = penalty
-        period.decline_fee = fee
-        period.save(
-            update_fields=[
-                "status",
-                "reviewed_at",
-                "decline_payment",
-                "decline_penalty",
-                "decline_fee",
-            ]
+        transition_period(
+            period,
+            BudgetPeriod.Status.OPEN,
+            reviewed_at=timezone.now(),
+            decline_payment=payment,
+            decline_penalty=penalty,
+            decline_fee=fee,
         )
-        return period
+        revert_period_amounts(period)
+    return period
 
 
 def close_period(period: BudgetPeriod) -> BudgetPeriod:
     if period.status != BudgetPeriod.Status.ACCEPTED:
         raise ValidationError("Only accepted periods can be closed.")
-    period.status = BudgetPeriod.Status.CLOSED
-    period.closed_at = timezone.now()
-    period.save(update_fields=["status", "closed_at"])
+    with transaction.atomic():
+        transition_period(period, BudgetPeriod.Status.CLOSED, closed_at=timezone.now())
+        write_period_snapshot(period)
+    return period
+
+
+def transition_period(period: BudgetPeriod, status: str, **changes) -> BudgetPeriod:
+    # One conditional UPDATE: it only matches while the row still has the
+    # status and version this instance was loaded with, so concurrent
+    # transitions fail fast instead of waiting on a row lock.
+    updated = BudgetPeriod.objects.filter(pk=period.pk, status=period.status, version=period.version).update(
+        status=status, version=F("version") + 1, **changes
+    )
+    if not updated:
+        raise PeriodConflictError("Period was changed by someone else; reload it and try again.")
+    period.status = status
+    period.version += 1
+    for name, value in changes.items():
+        setattr(period, name, value)
+    # A transition can change what this and later periods add, so the cached
+    # invoices and retention schedule of the budget are brought up to date
+    # once the change commits, outside the caller's locks. Reads check the
+    # fingerprint as well, so a refresh lost to a crash is caught up there.
+    budget_id = period.budget_id
+    transaction.on_commit(lambda: refresh_budget_invoices(budget_id))
     return period
+
+
+def lock_budget_periods(budget_id: int) -> None:
+    # Transaction-scoped advisory lock; a second caller gets a conflict error
+    # immediately instead of queueing behind the first.
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", [PERIOD_LOCK_NAMESPACE, budget_id])
+        (acquired,) = cursor.fetchone()
+    if not acquired:
+        raise PeriodConflictError("Another period change for this budget is in progress; try again.")
+
+
+def commit_period_amounts(period: BudgetPeriod) -> int:
+    # Copies the period's amounts into the ledger (two reads, one upsert). A
+    # resubmitted period keeps the previous value it replaced the first time.
+    amounts = list(BudgetItemAmount.objects.filter(period=period).values_list("budget_item_id", "amount"))
+    if not amounts:
+        return 0
+    existing = BudgetItemLedger.objects.in_bulk([item_id for item_id, _amount in amounts])
+    rows = []
+    for item_id, amount in amounts:
+        ledger = existing.get(item_id)
+        row = BudgetItemLedger(budget_item_id=item_id, period=period, amount=amount)
+        if ledger is not None and ledger.period_id == period.pk:
+            row.previous_period_id, row.previous_amount = ledger.previous_period_id, ledger.previous_amount
+        elif ledger is not None:
+            row.previous_period_id, row.previous_amount = ledger.period_id, ledger.amount
+        rows.append(row)
+    BudgetItemLedger.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["budget_item"],
+        update_fields=["period", "amount", "previous_period", "previous_amount", "updated_at"],
+    )
+    return len(rows)
+
+
+def revert_period_amounts(period: BudgetPeriod) -> None:
+    # A declined period is open again; its amounts are no longer committed.
+    rows = BudgetItemLedger.objects.filter(period=period)
+    rows.filter(previous_period__isnull=True).delete()
+    rows.update(
+        period=F("previous_period"),
+        amount=F("previous_amount"),
+        previous_period=None,
+        previous_amount=None,
+        updated_at=timezone.now(),
+    )
+
+
+def rebuild_amount_ledger(budget_ids: List[int] | None = None, batch_size: int = 1000) -> int:
+    # Recomputes the ledger from period history: per item, the newest amount
+    # from a period that is not open and the one before it.
+    committed = BudgetItemAmount.objects.exclude(period__status=BudgetPeriod.Status.OPEN)
+    ledger = BudgetItemLedger.objects.all()
+    if budget_ids is not None:
+        committed = committed.filter(period__budget_id__in=budget_ids)
+        ledger = ledger.filter(period__budget_id__in=budget_ids)
+    history = committed.order_by("budget_item_id", "-period__created_at").values_list(
+        "budget_item_id", "period_id", "amount"
+    )
+    written = 0
+    with transaction.atomic():
+        ledger.delete()
+        rows: List[BudgetItemLedger] = []
+        current = None
+        for item_id, period_id, amount in history.iterator(chunk_size=batch_size):
+            if current is not None and current.budget_item_id == item_id:
+                if current.previous_period_id is None:
+                    current.previous_period_id, current.previous_amount = period_id, amount
+                continue
+            current = BudgetItemLedger(budget_item_id=item_id, period_id=period_id, amount=amount)
+            rows.append(current)
+            if len(rows) > batch_size:
+                # Keep the newest row: its previous value may still follow.
+                BudgetItemLedger.objects.bulk_create(rows[:-1])
+                written += len(rows) - 1
+                rows = rows[-1:]
+        BudgetItemLedger.objects.bulk_create(rows)
+        written += len(rows)
+    return written
+
+
+def enqueue_import(budget) -> ImportJob:
+    return ImportJob.objects.create(budget=budget)
+
+
+def claim_next_import_job() -> ImportJob | None:
+    with transaction.atomic():
+        job = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .select_related("budget")
+            .filter(status=ImportJob.Status.QUEUED)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ImportJob.Status.RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=["status", "started_at", "heartbeat_at", "attempts"])
+    return job
+
+
+def recover_stale_import_jobs(timeout: int | None = None) -> List[ImportJob]:
+    # Jobs left running by a worker that died or was evicted. Their partial
+    # tree is removed and they are queued again, or failed once they have
+    # used up IMPORT_JOB_MAX_ATTEMPTS (a workbook that kills its worker
+    # would otherwise be retried forever).
+    timeout = settings.IMPORT_JOB_TIMEOUT if timeout is None else timeout
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    recovered = []
+    while True:
+        with transaction.atomic():
+            job = (
+                ImportJob.objects.select_for_update(skip_locked=True)
+                .select_related("budget")
+                .filter(status=ImportJob.Status.RUNNING, heartbeat_at__lt=cutoff)
+                .order_by("heartbeat_at")
+                .first()
+            )
+            if job is None:
+                return recovered
+            logger.warning("Import job %s stopped reporting progress; attempt %s abandoned", job.pk, job.attempts)
+            discard_imported_tree(job.budget)
+            job.rows_processed = job.headers_created = job.items_created = 0
+            if job.attempts >= settings.IMPORT_JOB_MAX_ATTEMPTS:
+                release_budget_workbook(job.budget)
+                job.status = ImportJob.Status.FAILED
+                job.error = "The import worker stopped responding."
+                job.finished_at = timezone.now()
+            else:
+                job.status = ImportJob.Status.QUEUED
+                job.started_at = job.heartbeat_at = None
+            job.save()
+        recovered.append(job)
+
+
+def run_import_job(job: ImportJob) -> ImportJob:
+    # Batches are committed as they are written so progress is visible to the
+    # status endpoint; a failed import removes the partial tree explicitly.
+    # Every write is fenced on the claimed attempt, so a worker whose job
+    # was recovered as stale stops instead of racing the next attempt.
+    budget = job.budget
+    claimed = ImportJob.objects.filter(pk=job.pk, status=ImportJob.Status.RUNNING, attempts=job.attempts)
+
+    def report_progress(writer: BudgetWriter) -> None:
+        job.rows_processed = writer.rows_processed
+        job.headers_created = writer.headers_created
+        job.items_created = writer.items_created
+        updated = claimed.update(
+            rows_processed=job.rows_processed,
+            headers_created=job.headers_created,
+            items_created=job.items_created,
+            heartbeat_at=timezone.now(),
+        )
+        if not updated:
+            raise ImportJobLost(f"Import job {job.pk} was taken over after attempt {job.attempts}.")
+
+    try:
+        import_budget_from_excel(budget, on_flush=report_progress)
+    except Exception as exc:
+        if not claimed.exists():
+            # Recovered as stale meanwhile; the tree belongs to the next attempt.
+            logger.warning("Import job %s was recovered while attempt %s was running", job.pk, job.attempts)
+            job.refresh_from_db()
+            return job
+        if not isinstance(exc, ExcelImportError):
+            logger.exception("Import job %s failed", job.pk)
+        discard_imported_tree(budget)
+        release_budget_workbook(budget)
+        job.status = ImportJob.Status.FAILED
+        job.error = str(exc)
+    else:
+        job.status = ImportJob.Status.SUCCEEDED
+    job.finished_at = timezone.now()
+    updated = claimed.update(
+        status=job.status,
+        error=job.error,
+        finished_at=job.finished_at,
+        rows_processed=job.rows_processed,
+        headers_created=job.headers_created,
+        items_created=job.items_created,
+    )
+    if not updated:
+        job.refresh_from_db()
+    return job
+
+
+def discard_imported_tree(budget) -> None:
+    with transaction.atomic():
+        BudgetItem.objects.filter(header__budget=budget).delete()
+        BudgetHeader.objects.filter(budget=budget).delete()
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from construction.models import Construction, ContractForWork, Order, Residual
+
+from .invoicing import refresh_order_invoices
+from .models import Budget
+from .services import move_budget_organizations
+
+# Contract terms live in the construction app; these keep the cached invoices
+# and retention schedule in step with them. The refresh runs after commit, so
+# an order deleted in the same transaction is already gone.
+
+
+@receiver([post_save, post_delete], sender=ContractForWork)
+def refresh_contract_invoices(sender, instance, **kwargs):
+    order_id = instance.order_id
+    transaction.on_commit(lambda: refresh_order_invoices([order_id]))
+
+
+@receiver([post_save, post_delete], sender=Residual)
+def refresh_residual_invoices(sender, instance, **kwargs):
+    # After a contract delete the residuals' contract is gone; the contract's
+    # own signal covers that order.
+    orders = ContractForWork.objects.filter(pk=instance.contract_for_work_id).values_list("order_id", flat=True)
+    transaction.on_commit(lambda: refresh_order_invoices(orders))
+
+
+# Budgets and their rows carry the construction's organization; moving a
+# construction, an order or a budget rewrites it for everything below.
+
+
+@receiver(post_save, sender=Construction)
+def move_construction_budgets(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or "organization" in update_fields):
+        move_budget_organizations(Budget.objects.filter(order__construction=instance))
+
+
+@receiver(post_save, sender=Order)
+def move_order_budgets(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or "construction" in update_fields):
+        move_budget_organizations(Budget.objects.filter(order=instance))
+
+
+@receiver(post_save, sender=Budget)
+def move_budget(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or "order" in update_fields):
+        if move_budget_organizations(Budget.objects.filter(pk=instance.pk)):
+            instance.refresh_from_db(fields=["organization"])
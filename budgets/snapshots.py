@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from .importers import to_cents
+from .models import (
+    BudgetHeader,
+    BudgetItemAmount,
+    BudgetPeriod,
+    BudgetPeriodHeaderSummary,
+    BudgetPeriodSummary,
+)
+
+ZERO = Decimal("0.00")
+# Value at the period and value before it.
+NO_TOTALS = (ZERO, ZERO)
+
+
+def write_period_snapshot(period: BudgetPeriod) -> BudgetPeriodSummary:
+    # Three reads (amount history up to this period, headers, previous period)
+    # and two inserts. Amounts are cumulative, so an item's value at a period
+    # is its newest amount at or before it; the value before the period comes
+    # from the newest amount of an earlier period.
+    history = (
+        BudgetItemAmount.objects.filter(period__budget_id=period.budget_id, period__created_at__lte=period.created_at)
+        .order_by("budget_item_id", "-period__created_at")
+        .values_list("budget_item_id", "period_id", "amount", "budget_item__price_for_unit", "budget_item__header_id")
+    )
+    totals: Dict[int, List[Decimal]] = {}
+    items = 0
+    current: Optional[int] = None
+    seen_before = False
+    for item_id, period_id, amount, price_for_unit, header_id in history.iterator(chunk_size=2000):
+        value = to_cents(amount * price_for_unit)
+        header_totals = totals.setdefault(header_id, [ZERO, ZERO])
+        if item_id != current:
+            current, seen_before = item_id, period_id != period.pk
+            items += 1
+            header_totals[0] += value
+            if seen_before:
+                # Nothing drawn in this period: the item's total carries over.
+                header_totals[1] += value
+        elif not seen_before:
+            seen_before = True
+            header_totals[1] += value
+
+    headers: List[Tuple[int, Optional[int], str, str]] = list(
+        BudgetHeader.objects.filter(budget_id=period.budget_id)
+        .order_by("path")
+        .values_list("pk", "parent_id", "path", "title")
+    )
+    # Children follow their parent in path order, so a backwards pass adds
+    # every subtree into its parent once.
+    for pk, parent_id, _path, _title in reversed(headers):
+        if parent_id is not None and pk in totals:
+            parent_totals = totals.setdefault(parent_id, [ZERO, ZERO])
+            parent_totals[0] += totals[pk][0]
+            parent_totals[1] += totals[pk][1]
+
+    roots = [totals.get(pk, NO_TOTALS) for pk, parent_id, _path, _title in headers if parent_id is None]
+    total = sum((at_period for at_period, _before in roots), ZERO)
+    before = sum((before for _at_period, before in roots), ZERO)
+    summary = BudgetPeriodSummary.objects.create(
+        period=period,
+        budget_id=period.budget_id,
+        previous_period=(
+            BudgetPeriod.objects.filter(budget_id=period.budget_id, created_at__lt=period.created_at)
+            .order_by("-created_at")
+            .first()
+        ),
+        total=total,
+        delta=total - before,
+        items=items,
+        decline_payment=period.decline_payment,
+        decline_penalty=period.decline_penalty,
+        decline_fee=period.decline_fee,
+        closed_at=period.closed_at,
+    )
+    BudgetPeriodHeaderSummary.objects.bulk_create(
+        [
+            BudgetPeriodHeaderSummary(
+                summary=summary,
+                header_id=pk,
+                path=path,
+                title=title,
+                total=totals.get(pk, NO_TOTALS)[0],
+                delta=totals.get(pk, NO_TOTALS)[0] - totals.get(pk, NO_TOTALS)[1],
+            )
+            for pk, _parent_id, path, title in headers
+        ],
+        batch_size=1000,
+    )
+    return summary
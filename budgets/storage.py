@@ -0,0 +1,216 @@
+import hashlib
+import os
+import time
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import connection, transaction
+
+from .models import Budget
+
+WORKBOOK_DIR = "budgets/excel"
+PREVIEW_DIR = f"{WORKBOOK_DIR}/previews"
+# First key of the per-workbook advisory lock taken by saves and deletes.
+WORKBOOK_LOCK_NAMESPACE = 4102
+
+
+def hash_file(file) -> str:
+    # Uploads received through the hashing upload handlers carry the digest
+    # already; anything else is hashed here.
+    if getattr(file, "sha256", None):
+        return file.sha256
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class HashingUploadMixin:
+    # Hashes an upload in the loop that writes its chunks, so the form does
+    # not read the file a second time. A chunk is hashed by the handler that
+    # keeps it, not by one that passes it on.
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            self.digest.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.digest.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def workbook_name(sha256: str, original_name: str) -> str:
+    extension = os.path.splitext(original_name)[1].lower() or ".xlsx"
+    return f"{WORKBOOK_DIR}/{sha256[:2]}/{sha256}{extension}"
+
+
+def workbook_storage():
+    return Budget._meta.get_field("excel_file").storage
+
+
+def workbook_lock_key(name: str) -> int:
+    return zlib.crc32(name.encode()) - 2**31
+
+
+def lock_workbook(name: str, wait: bool = True) -> bool:
+    # Transaction-scoped advisory lock on a stored name. Saving a workbook
+    # holds it until the reference to the file commits, and deleting one
+    # only goes ahead while nobody else holds it.
+    function = "pg_advisory_xact_lock" if wait else "pg_try_advisory_xact_lock"
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {function}(%s, %s)", [WORKBOOK_LOCK_NAMESPACE, workbook_lock_key(name)])
+        (acquired,) = cursor.fetchone()
+    return acquired is not False
+
+
+def write_temporary_copy(upload) -> tuple[str, str]:
+    # Copies an upload to a temporary file next to the stored workbooks,
+    # hashing it in the same pass. Returns the path and the digest.
+    temporary = workbook_storage().path(f"{WORKBOOK_DIR}/tmp/{uuid.uuid4().hex}")
+    os.makedirs(os.path.dirname(temporary), exist_ok=True)
+    digest = hashlib.sha256()
+    try:
+        with open(temporary, "wb") as handle:
+            upload.seek(0)
+            for chunk in upload.chunks():
+                digest.update(chunk)
+                handle.write(chunk)
+        upload.seek(0)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return temporary, digest.hexdigest()
+
+
+def move_into_place(temporary: str, name: str) -> None:
+    path = workbook_storage().path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temporary, path)
+
+
+def save_workbook(upload, sha256: str | None = None) -> tuple[str, str]:
+    # Workbooks are stored under their content hash, so uploading the same file
+    # again reuses the stored copy instead of writing a new one. A new file is
+    # hashed while it is copied to a temporary name and then renamed into
+    # place, so the stored name never holds a partial file. Call it in the
+    # transaction that saves the reference: the name stays locked until then.
+    storage = workbook_storage()
+    with transaction.atomic():
+        if sha256 is not None:
+            name = workbook_name(sha256, upload.name)
+            lock_workbook(name)
+            if storage.exists(name):
+                return name, sha256
+        temporary, digest = write_temporary_copy(upload)
+        try:
+            sha256 = sha256 or digest
+            name = workbook_name(sha256, upload.name)
+            lock_workbook(name)
+            if not storage.exists(name):
+                move_into_place(temporary, name)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+    return name, sha256
+
+
+def save_preview_workbook(upload, sha256: str) -> str:
+    # Re-import previews keep the upload under its own name outside the
+    # content-addressed store until the change is applied; previews that
+    # were never applied are removed by later ones once they are older than
+    # WORKBOOK_PREVIEW_MAX_AGE.
+    delete_stale_previews()
+    extension = os.path.splitext(upload.name)[1].lower() or ".xlsx"
+    name = f"{PREVIEW_DIR}/{sha256}-{uuid.uuid4().hex}{extension}"
+    temporary, _digest = write_temporary_copy(upload)
+    move_into_place(temporary, name)
+    return name
+
+
+def delete_stale_previews(max_age: int | None = None) -> None:
+    max_age = settings.WORKBOOK_PREVIEW_MAX_AGE if max_age is None else max_age
+    directory = workbook_storage().path(PREVIEW_DIR)
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory) if os.path.isdir(directory) else ():
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def apply_preview_workbook(budget: Budget, preview: str, sha256: str) -> None:
+    # Stores an applied preview under its content hash and points the budget
+    # at it; the preview itself is removed once that has committed.
+    storage = workbook_storage()
+    with transaction.atomic():
+        with storage.open(preview, "rb") as handle:
+            name, _sha256 = save_workbook(File(handle, name=preview), sha256)
+        replace_budget_workbook(budget, name, sha256)
+        transaction.on_commit(lambda: storage.delete(preview))
+
+
+def store_budget_workbook(budget: Budget, upload, sha256: str | None = None) -> None:
+    budget.excel_file, budget.excel_sha256 = save_workbook(upload, sha256)
+
+
+def replace_budget_workbook(budget: Budget, name: str, sha256: str) -> None:
+    previous = budget.excel_file.name
+    with transaction.atomic():
+        lock_workbook(name)
+        budget.excel_file = name
+        budget.excel_sha256 = sha256
+        budget.save(update_fields=["excel_file", "excel_sha256"])
+        if previous and previous != name:
+            delete_unreferenced_workbook(previous)
+
+
+def ensure_workbook_hash(budget: Budget) -> str:
+    if not budget.excel_sha256:
+        with budget.excel_file.open("rb") as handle:
+            budget.excel_sha256 = hash_file(handle)
+        if budget.pk:
+            Budget.objects.filter(pk=budget.pk).update(excel_sha256=budget.excel_sha256)
+    return budget.excel_sha256
+
+
+def release_budget_workbook(budget: Budget) -> None:
+    # Stored workbooks can be shared between budgets; the file is only removed
+    # once no other budget points at it.
+    name = budget.excel_file.name
+    if not name:
+        return
+    budget.excel_file = None
+    budget.excel_sha256 = ""
+    with transaction.atomic():
+        if budget.pk:
+            budget.save(update_fields=["excel_file", "excel_sha256"])
+        delete_unreferenced_workbook(name)
+
+
+def delete_unreferenced_workbook(name: str) -> None:
+    # The references are counted under the name's lock. A save still holding
+    # it is about to reference the file, so then the file is kept.
+    with transaction.atomic():
+        if lock_workbook(name, wait=False) and not Budget.objects.filter(excel_file=name).exists():
+            workbook_storage().delete(name)
@@ -0,0 +1,116 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets.importers import import_budget_from_excel
+from budgets.models import Budget, BudgetHeader, BudgetItem
+from budgets.services import create_period, set_item_amount, submit_period
+from budgets.tree import load_budget_tree
+from budgets.workbook_generator import WorkbookSpec, generate_budget_workbook
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+
+def build_member(client, organization):
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(user=user, organization=organization, role=OrganizationRole.BUDGET_MANAGER)
+    client.login(username="bm@example.com", password="StrongPass123!")
+
+
+def build_budget(tmp_path, organization, items, name="Budget A"):
+    construction = Construction.objects.create(name="Site A", organization=organization)
+    order = Order.objects.create(name="Order A", construction=construction)
+    path = tmp_path / f"{name}.xlsx"
+    spec = WorkbookSpec(items=items, header_depth=4, items_per_section=5, fanout=2, measurement_density=0)
+    generate_budget_workbook(path, spec)
+    budget = Budget.objects.create(
+        order=order, name=name, excel_file=SimpleUploadedFile("budget.xlsx", path.read_bytes())
+    )
+    import_budget_from_excel(budget)
+    return budget
+
+
+def iter_nodes(nodes):
+    for node in nodes:
+        yield node
+        yield from iter_nodes(node.children)
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return response, len(queries)
+
+
+@pytest.mark.django_db
+def test_tree_loads_window_in_three_queries(settings, tmp_path, django_assert_num_queries):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_budget(tmp_path, Organization.objects.create(name="Alpha Build"), items=40)
+    item = BudgetItem.objects.filter(header__budget=budget).first()
+    first = create_period(budget)
+    set_item_amount(first, item, Decimal("1.00"))
+    submit_period(first)
+    set_item_amount(create_period(budget), item, Decimal("2.50"))
+
+    with django_assert_num_queries(3):
+        tree = load_budget_tree(budget, levels=4)
+
+    [root] = tree.roots
+    assert root.header.title == "Stavba 0"
+    assert tree.items == 40
+    leaves = {loaded.pk: loaded for node in iter_nodes(tree.roots) for loaded in node.items}
+    # Only committed amounts are shown; the open period is still a draft.
+    assert leaves[item.pk].latest_amount == Decimal("1.00")
+
+    window = load_budget_tree(budget, levels=2)
+    deferred = [node for node in iter_nodes(window.roots) if node.deferred]
+    assert deferred and all(node.header.depth == 2 and not node.children for node in deferred)
+    assert window.items == 0
+
+
+@pytest.mark.django_db
+def test_budget_detail_query_count_does_not_grow_with_budget(settings, tmp_path, client):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    build_member(client, organization)
+    small = build_budget(tmp_path, organization, items=10, name="Small")
+    large = build_budget(tmp_path, organization, items=200, name="Large")
+
+    # Warm the membership cache so both requests measure the page alone.
+    client.get(reverse("budgets:budget-list"))
+    _response, small_queries = count_queries(client, reverse("budgets:budget-detail", args=[small.pk]))
+    response, large_queries = count_queries(client, reverse("budgets:budget-detail", args=[large.pk]))
+
+    assert small_queries == large_queries
+    # Only the first levels ship with the page; the rest loads on demand.
+    assert response.context["tree"].items < BudgetItem.objects.filter(header__budget=large).count()
+    assert b"data-tree-url" in response.content
+
+
+@pytest.mark.django_db
+def test_tree_fragment_returns_subtree_of_collapsed_header(settings, tmp_path, client):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    build_member(client, organization)
+    budget = build_budget(tmp_path, organization, items=20)
+    leaf = BudgetHeader.objects.filter(budget=budget, title__startswith="Podobjekt").first()
+
+    response = client.get(reverse("budgets:budget-tree", args=[budget.pk, leaf.pk]))
+
+    assert response.status_code == 200
+    codes = set(BudgetItem.objects.filter(header=leaf).values_list("code", flat=True))
+    assert codes and all(code.encode() in response.content for code in codes)
+
+    other = Organization.objects.create(name="Beta Build")
+    foreign = build_budget(tmp_path, other, items=5, name="Foreign")
+    foreign_header = BudgetHeader.objects.filter(budget=foreign).first()
+    assert client.get(reverse("budgets:budget-tree", args=[foreign.pk, foreign_header.pk])).status_code == 404
+    assert client.get(reverse("budgets:budget-tree", args=[budget.pk, foreign_header.pk])).status_code == 404
@@ -0,0 +1,196 @@
+import json
+import zipfile
+from io import BytesIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from openpyxl import Workbook
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets.models import Budget, BudgetItem, ImportJob, ParsedWorkbook
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+
+def build_construction():
+    organization = Organization.objects.create(name="Alpha Build")
+    construction = Construction.objects.create(name="Site A", organization=organization)
+    return construction
+
+
+def build_workbook_bytes(items=2, valid=True):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka" if valid else "Other"
+    sheet.append(["Typ", "Kód", "Popis", "MJ", "Jedn. Cena"])
+    sheet.append(["Stavba", "", "Stavba A", "", ""])
+    for index in range(items):
+        sheet.append(["SUB", f"K-{index}", f"Item {index}", "m2", "10,00"])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_archive(files):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, payload in files.items():
+            archive.writestr(name, payload)
+    return buffer.getvalue()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("workers", [1, 2])
+def test_import_budgets_command_imports_directory(settings, tmp_path, capsys, workers):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    construction = build_construction()
+    default = Order.objects.create(name="Order A", construction=construction)
+    matched = Order.objects.create(name="Objekt SO-02", construction=construction)
+    source = tmp_path / "workbooks"
+    source.mkdir()
+    (source / "Objekt SO-01.xlsx").write_bytes(build_workbook_bytes(items=3))
+    (source / "Objekt SO-02.xlsx").write_bytes(build_workbook_bytes(items=2))
+    (source / "broken.xlsx").write_bytes(build_workbook_bytes(valid=False))
+    (source / "corrupt.xlsx").write_bytes(b"not a zip archive")
+    (source / "notes.txt").write_text("ignored")
+
+    call_command("import_budgets", str(source), "--order", str(default.pk), "--workers", str(workers))
+
+    report = json.loads(capsys.readouterr().out)
+    files = {summary["name"]: summary for summary in report["files"]}
+    assert set(files) == {"Objekt SO-01.xlsx", "Objekt SO-02.xlsx", "broken.xlsx", "corrupt.xlsx"}
+    assert (report["imported"], report["failed"]) == (2, 2)
+    assert "Zakázka" in files["broken.xlsx"]["error"]
+    assert files["corrupt.xlsx"]["error"] == "File is not a readable Excel workbook."
+    assert files["Objekt SO-02.xlsx"]["order"] == matched.pk
+    assert files["Objekt SO-01.xlsx"]["order"] == default.pk
+    budget = Budget.objects.get(pk=files["Objekt SO-01.xlsx"]["budget"])
+    assert budget.name == "Objekt SO-01"
+    assert BudgetItem.objects.filter(header__budget=budget).count() == 3
+    assert report["rows_per_second"] > 0
+    assert not Budget.objects.filter(name="broken").exists()
+
+
+@pytest.mark.django_db
+def test_import_budgets_command_reads_zip_and_mapping(settings, tmp_path, capsys):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    construction = build_construction()
+    first = Order.objects.create(name="Order A", construction=construction)
+    second = Order.objects.create(name="Order B", construction=construction)
+    archive = tmp_path / "budgets.zip"
+    archive.write_bytes(
+        build_archive({"a/one.xlsx": build_workbook_bytes(), "two.xlsx": build_workbook_bytes(items=1)})
+    )
+    mapping = tmp_path / "mapping.csv"
+    mapping.write_text(f"file,order\none.xlsx,{first.pk}\ntwo,{second.pk}\n", encoding="utf-8")
+
+    call_command("import_budgets", str(archive), "--mapping", str(mapping), "--workers", "1")
+
+    report = json.loads(capsys.readouterr().out)
+    orders = {summary["name"]: summary["order"] for summary in report["files"]}
+    assert orders == {"one.xlsx": first.pk, "two.xlsx": second.pk}
+    assert Budget.objects.filter(order=second, name="two").exists()
+
+
+@pytest.mark.django_db
+def test_import_budgets_command_parses_uncached_workbooks_again(settings, tmp_path, capsys):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    settings.PARSE_CACHE_MAX_BYTES = 0
+    order = Order.objects.create(name="Order A", construction=build_construction())
+    source = tmp_path / "workbooks"
+    source.mkdir()
+    (source / "large.xlsx").write_bytes(build_workbook_bytes(items=3))
+
+    call_command("import_budgets", str(source), "--order", str(order.pk), "--workers", "1")
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["imported"] == 1
+    assert BudgetItem.objects.filter(header__budget=report["files"][0]["budget"]).count() == 3
+    assert not ParsedWorkbook.objects.exists()
+
+
+@pytest.mark.django_db
+def test_import_budgets_command_reports_a_single_corrupt_file(settings, tmp_path, capsys):
+    # One file means one worker, so the file is parsed in this process.
+    settings.MEDIA_ROOT = tmp_path / "media"
+    order = Order.objects.create(name="Order A", construction=build_construction())
+    source = tmp_path / "workbooks"
+    source.mkdir()
+    (source / "corrupt.xlsx").write_bytes(b"not a zip archive")
+
+    call_command("import_budgets", str(source), "--order", str(order.pk), "--workers", "4")
+
+    report = json.loads(capsys.readouterr().out)
+    assert (report["imported"], report["failed"]) == (0, 1)
+    assert report["files"][0]["error"] == "File is not a readable Excel workbook."
+
+
+@pytest.mark.django_db
+def test_bulk_upload_queues_one_job_per_workbook(settings, tmp_path, client):
+    settings.MEDIA_ROOT = tmp_path
+    construction = build_construction()
+    order = Order.objects.create(name="Order A", construction=construction)
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user, organization=construction.organization, role=OrganizationRole.BUDGET_MANAGER
+    )
+    client.login(username="bm@example.com", password="StrongPass123!")
+    archive = build_archive(
+        {
+            "one.xlsx": build_workbook_bytes(),
+            "two.xlsx": build_workbook_bytes(items=1),
+            "bad.xlsx": build_workbook_bytes(valid=False),
+        }
+    )
+
+    response = client.post(
+        reverse("budgets:budget-bulk-import"),
+        {"order": order.pk, "archive": SimpleUploadedFile("budgets.zip", archive)},
+    )
+
+    assert response.status_code == 200
+    errors = {summary.name: summary.error for summary in response.context["summaries"]}
+    assert errors["one.xlsx"] == errors["two.xlsx"] == ""
+    assert errors["bad.xlsx"]
+    assert ImportJob.objects.filter(budget__order=order, status=ImportJob.Status.QUEUED).count() == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ("files", "limits", "error"),
+    [
+        ({"one.xlsx": b"", "run.sh": b"echo"}, {}, "run.sh, which is not an .xlsx workbook"),
+        ({"one.xlsx": b"", "two.xlsx": b""}, {"BULK_IMPORT_MAX_FILES": 1}, "at most 1 are allowed"),
+        ({"one.xlsx": b"0" * 4096}, {"BULK_IMPORT_MAX_BYTES": 1024}, "unpacks to more than"),
+    ],
+)
+def test_bulk_upload_rejects_archives_before_extracting(settings, tmp_path, client, monkeypatch, files, limits, error):
+    settings.MEDIA_ROOT = tmp_path
+    for name, value in limits.items():
+        setattr(settings, name, value)
+    construction = build_construction()
+    order = Order.objects.create(name="Order A", construction=construction)
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user, organization=construction.organization, role=OrganizationRole.BUDGET_MANAGER
+    )
+    client.login(username="bm@example.com", password="StrongPass123!")
+
+    archive = build_archive({name: payload or build_workbook_bytes() for name, payload in files.items()})
+
+    def no_extract(*args, **kwargs):
+        raise AssertionError("rejected archives must not be extracted")
+
+    monkeypatch.setattr(zipfile.ZipFile, "open", no_extract)
+    response = client.post(
+        reverse("budgets:budget-bulk-import"),
+        {"order": order.pk, "archive": SimpleUploadedFile("budgets.zip", archive)},
+    )
+
+    assert response.status_code == 200
+    assert error in response.context["form"].errors["archive"][0]
+    assert not Budget.objects.exists()
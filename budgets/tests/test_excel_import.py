@@ -6,8 +6,16 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from openpyxl import Workbook
 
 from accounts.models import Organization
-from budgets.importers import ExcelImportError, import_budget_from_excel
-from budgets.models import BudgetHeader, BudgetItem, Budget
+from budgets.importers import (
+    BudgetWriter,
+    ExcelImportError,
+    ImportStats,
+    ParsedHeader,
+    import_budget_from_excel,
+    parse_measurement_value,
+    rollup_header_totals,
+)
+from budgets.models import BudgetHeader, BudgetItem, BudgetItemMeasurement, Budget
 from construction.models import Construction, Order
 
 
@@ -33,6 +41,57 @@ def build_workbook_bytes(include_headers=True, include_header_rows=True):
     return buffer.getvalue()
 
 
+def build_large_workbook_bytes(sections=3, items_per_section=50):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka"
+    sheet.append(["Poř.", "Typ", "Kód", "Popis", "MJ", "Výměra", "Jedn. Cena", "Cena"])
+    sheet.append(["", "Stavba", "", "Stavba A", "", "", "", ""])
+    for section in range(sections):
+        sheet.append(["", "Objekt", "", f"Objekt {section}", "", "", "", ""])
+        sheet.append(["", "Oddíl", "", f"Oddil {section}", "", "", "", ""])
+        for index in range(items_per_section):
+            sheet.append(["", "SUB", f"K-{section}-{index}", f"Item {index}", "m2", "1", "10,00", ""])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_measured_workbook_bytes():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka"
+    sheet.append(["Poř.", "Typ", "Kód", "Popis", "MJ", "Výměra", "Jedn. Cena", "Cena"])
+    sheet.append(["", "Stavba", "", "Stavba A", "", "", "", ""])
+    sheet.append(["1", "SUB", "K-01", "Item 1", "t", "1117,491", "100", ""])
+    sheet.append(["", "", "Výkaz výměr:", "–   ", "", "", "", ""])
+    sheet.append(["", "", "", " 1\xa0454,656", "", "", "", ""])
+    sheet.append(["", "", "", "- 337,165", "", "", "", ""])
+    sheet.append(["", "", "", "", "", "", "", ""])
+    sheet.append(["", "", "Ztratné:", 10400, "", "116219,064", "", ""])
+    sheet.append(["2", "SUB", "K-02", "Item 2", "m2", "5", "10", ""])
+    sheet.append(["", "Oddíl", "", "Oddil 1", "", "", "", ""])
+    sheet.append(["", "", "", " 9,420", "", "", "", ""])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_priced_workbook_bytes(stavba_total=260.5):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka"
+    sheet.append(["Typ", "Kód", "Popis", "MJ", "Výměra", "Jedn. Cena", "Cena", "Sazba DPH", "DPH", "Cena s DPH"])
+    sheet.append(["Stavba", "", "Stavba A", "", "", "", stavba_total, "", "", ""])
+    sheet.append(["Objekt", "", "Objekt 1", "", "", "", 250.5, "", "", ""])
+    sheet.append(["SUB", "K-01", "Item 1", "m2", 10, 25, 250.5, 21, 52.605, 303.105])
+    sheet.append(["Objekt", "", "Objekt 2", "", "", "", 10, "", "", ""])
+    sheet.append(["SUB", "K-02", "Item 2", "kus", "2", "5", "", "21", "", ""])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
 def build_workbook_without_zakazka():
     workbook = Workbook()
     sheet = workbook.active
@@ -94,3 +153,198 @@ def test_import_requires_zakazka_sheet(settings, tmp_path):
 
     with pytest.raises(ExcelImportError):
         import_budget_from_excel(budget)
+
+
+@pytest.mark.django_db
+def test_import_query_count_depends_on_depth_not_rows(settings, tmp_path, django_assert_max_num_queries):
+    settings.MEDIA_ROOT = tmp_path
+    order = build_order()
+    budget = Budget.objects.create(
+        order=order,
+        name="Budget D",
+        excel_file=SimpleUploadedFile("budget.xlsx", build_large_workbook_bytes()),
+    )
+    stats = ImportStats()
+
+    with django_assert_max_num_queries(8):
+        created = import_budget_from_excel(budget, stats=stats)
+
+    assert created == 150
+    assert BudgetHeader.objects.filter(budget=budget).count() == 7
+    assert BudgetItem.objects.filter(header__budget=budget).count() == 150
+    oddil = BudgetHeader.objects.get(budget=budget, title="Oddil 2")
+    assert oddil.parent.title == "Objekt 2"
+    assert oddil.parent.parent.title == "Stavba A"
+    assert set(stats.stages) == {"cache", "load", "header", "parse", "persist_headers", "persist_items", "rollup"}
+    assert stats.stages["persist_headers"].queries == 3
+    assert stats.stages["persist_items"].queries == 1
+    assert stats.stages["cache"].queries == 3
+    assert stats.stages["rollup"].queries == 1
+    assert stats.total_queries == 8
+    assert BudgetHeader.objects.get(budget=budget, title="Stavba A").total_price == Decimal("1500.00")
+    assert oddil.total_price == oddil.parent.total_price == Decimal("500.00")
+
+
+@pytest.mark.django_db
+def test_import_stores_measurement_lines_per_item(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = Budget.objects.create(
+        order=build_order(),
+        name="Budget E",
+        excel_file=SimpleUploadedFile("budget.xlsx", build_measured_workbook_bytes()),
+    )
+    stats = ImportStats()
+
+    import_budget_from_excel(budget, stats=stats)
+
+    item = BudgetItem.objects.get(code="K-01")
+    assert list(item.measurements.values_list("position", "kind", "text", "value")) == [
+        (0, "measurement", "–", None),
+        (1, "line", "1\xa0454,656", Decimal("1454.656")),
+        (2, "line", "- 337,165", Decimal("-337.165")),
+        (3, "waste", "10400", Decimal("10400")),
+    ]
+    # Lines after a header row do not belong to the previous item.
+    assert not BudgetItemMeasurement.objects.filter(budget_item__code="K-02").exists()
+    assert stats.stages["persist_measurements"].queries == 1
+
+
+@pytest.mark.parametrize(
+    ("text", "value"),
+    [
+        ("2*3,5", Decimal("7")),
+        ("12,5+4", Decimal("16.5")),
+        ("(3,65+2,4)*2*2,85", Decimal("34.485")),
+        ("2 × 1\xa0250,5 - 0,9*2,1", Decimal("2499.11")),
+        ('obvod: 2*(4,5+3,2) "místnost 1.02"', Decimal("15.4")),
+        ("10/3", Decimal("3.333333")),
+        ("6,5*-2=-13,000", Decimal("-13")),
+        ("Výkaz výměr:", None),
+        ("2*", None),
+        ("(2+3", None),
+        ("2**3", None),
+        ("1/0", None),
+        ("__import__('os')", None),
+        ("1.5.2024", None),
+    ],
+)
+def test_measurement_formulas_are_evaluated(text, value):
+    assert parse_measurement_value(text) == value
+
+
+@pytest.mark.django_db
+def test_import_stores_item_totals_and_header_rollups(settings, tmp_path, caplog):
+    settings.MEDIA_ROOT = tmp_path
+    budget = Budget.objects.create(
+        order=build_order(),
+        name="Budget F",
+        excel_file=SimpleUploadedFile("budget.xlsx", build_priced_workbook_bytes()),
+    )
+
+    import_budget_from_excel(budget)
+
+    item = BudgetItem.objects.get(code="K-01")
+    assert (item.quantity, item.total_price, item.vat_rate, item.vat, item.total_with_vat) == (
+        Decimal("10"),
+        Decimal("250.50"),
+        Decimal("21.00"),
+        Decimal("52.61"),
+        Decimal("303.11"),
+    )
+    # Missing Cena/DPH cells are derived from quantity, unit price and rate.
+    derived = BudgetItem.objects.get(code="K-02")
+    assert (derived.total_price, derived.vat, derived.total_with_vat) == (
+        Decimal("10.00"),
+        Decimal("2.10"),
+        Decimal("12.10"),
+    )
+    root = BudgetHeader.objects.get(budget=budget, title="Stavba A")
+    assert (root.total_price, root.vat, root.total_with_vat) == (
+        Decimal("260.50"),
+        Decimal("54.71"),
+        Decimal("315.21"),
+    )
+    assert root.workbook_total == Decimal("260.50")
+    assert root.total_matches_workbook
+    assert "workbook total" not in caplog.text
+
+
+@pytest.mark.django_db
+def test_rollup_flags_and_recomputes_totals(settings, tmp_path, caplog):
+    settings.MEDIA_ROOT = tmp_path
+    budget = Budget.objects.create(
+        order=build_order(),
+        name="Budget G",
+        excel_file=SimpleUploadedFile("budget.xlsx", build_priced_workbook_bytes(stavba_total=999)),
+    )
+
+    import_budget_from_excel(budget)
+
+    root = BudgetHeader.objects.get(budget=budget, title="Stavba A")
+    assert not root.total_matches_workbook
+    assert "Stavba A" in caplog.text
+
+    BudgetItem.objects.filter(code="K-02").update(total_price=Decimal("738.50"))
+    changed = rollup_header_totals(budget, workbook_totals={root.pk: Decimal("999.00")})
+
+    assert {header.title for header in changed} == {"Stavba A", "Objekt 2"}
+    root.refresh_from_db()
+    assert root.total_price == Decimal("989.00")
+    assert root.total_matches_workbook is False
+
+
+@pytest.mark.django_db
+def test_header_paths_keep_workbook_order_and_load_subtrees(settings, tmp_path, django_assert_num_queries):
+    settings.MEDIA_ROOT = tmp_path
+    order = build_order()
+    payload = build_large_workbook_bytes(sections=3, items_per_section=2)
+    budget = Budget.objects.create(
+        order=order, name="Budget E", excel_file=SimpleUploadedFile("budget.xlsx", payload)
+    )
+    import_budget_from_excel(budget)
+
+    headers = list(BudgetHeader.objects.filter(budget=budget))
+    assert [(header.title, header.depth) for header in headers] == [
+        ("Stavba A", 0),
+        ("Objekt 0", 1),
+        ("Oddil 0", 2),
+        ("Objekt 1", 1),
+        ("Oddil 1", 2),
+        ("Objekt 2", 1),
+        ("Oddil 2", 2),
+    ]
+    assert [header.path for header in headers[:3]] == ["00000", "0000000000", "000000000000000"]
+    assert headers[3].path == "0000000001"
+
+    objekt = headers[3]
+    oddil = headers[4]
+    with django_assert_num_queries(1):
+        assert [header.title for header in objekt.subtree()] == ["Objekt 1", "Oddil 1"]
+    with django_assert_num_queries(1):
+        assert [header.title for header in oddil.ancestors()] == ["Stavba A", "Objekt 1"]
+    assert [header.title for header in objekt.descendants()] == ["Oddil 1"]
+    assert set(objekt.subtree_items().values_list("code", flat=True)) == {"K-1-0", "K-1-1"}
+
+    # A cached replay numbers the tree the same way.
+    copy = Budget.objects.create(
+        order=order, name="Budget F", excel_file=SimpleUploadedFile("budget.xlsx", payload)
+    )
+    import_budget_from_excel(copy)
+    assert list(BudgetHeader.objects.filter(budget=copy).values_list("title", "path")) == [
+        (header.title, header.path) for header in headers
+    ]
+
+
+@pytest.mark.django_db
+def test_writer_flushes_headers_without_items():
+    budget = Budget.objects.create(order=build_order(), name="Headers only")
+    writer = BudgetWriter(budget, batch_size=3)
+    root = ParsedHeader(level=0, title="Root", path="00000")
+    writer.add(root)
+    for index in range(5):
+        writer.add(ParsedHeader(level=1, title=f"Header {index}", parent=root, path=f"00000{index:05d}"))
+
+    assert len(writer.pending_headers) == 0
+    assert BudgetHeader.objects.filter(budget=budget).count() == 6
+    writer.finish()
+    assert writer.headers_created == 6
@@ -0,0 +1,200 @@
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets import services
+from budgets.importers import import_budget_from_excel
+from budgets.models import Budget, BudgetHeader, BudgetItem, ImportJob
+from budgets.services import claim_next_import_job, enqueue_import, recover_stale_import_jobs, run_import_job
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+
+def build_order(organization=None):
+    organization = organization or Organization.objects.create(name="Alpha Build")
+    construction = Construction.objects.create(name="Site A", organization=organization)
+    return Order.objects.create(name="Order A", construction=construction)
+
+
+def build_workbook_bytes(items=3, bad_price_at=None):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka"
+    sheet.append(["Typ", "Kód", "Popis", "MJ", "Jedn. Cena"])
+    sheet.append(["Stavba", "", "Stavba A", "", ""])
+    sheet.append(["Oddíl", "", "Oddil 1", "", ""])
+    for index in range(items):
+        price = "n/a" if index == bad_price_at else "10,00"
+        sheet.append(["SUB", f"K-{index}", f"Item {index}", "m2", price])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_budget_with_file(payload, order=None):
+    return Budget.objects.create(
+        order=order or build_order(),
+        name="Budget A",
+        excel_file=SimpleUploadedFile("budget.xlsx", payload),
+    )
+
+
+def login_budget_manager(client, organization):
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user,
+        organization=organization,
+        role=OrganizationRole.BUDGET_MANAGER,
+    )
+    client.login(username="bm@example.com", password="StrongPass123!")
+
+
+@pytest.mark.django_db
+def test_budget_create_queues_import_and_returns_immediately(settings, tmp_path, client):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    login_budget_manager(client, organization)
+    order = build_order(organization)
+
+    payload = {
+        "order": order.id,
+        "name": "Budget A",
+        "excel_file": SimpleUploadedFile("budget.xlsx", build_workbook_bytes()),
+    }
+    response = client.post(reverse("budgets:budget-create"), payload)
+
+    budget = Budget.objects.get(order=order, name="Budget A")
+    assert response.status_code == 302
+    assert response["Location"] == reverse("budgets:budget-detail", args=[budget.pk])
+    assert budget.import_jobs.get().status == ImportJob.Status.QUEUED
+    assert not BudgetHeader.objects.filter(budget=budget).exists()
+
+    detail = client.get(response["Location"])
+    assert detail.context["import_job"].status == ImportJob.Status.QUEUED
+
+
+@pytest.mark.django_db
+def test_run_import_job_records_progress(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_budget_with_file(build_workbook_bytes(items=3))
+    enqueue_import(budget)
+
+    job = claim_next_import_job()
+    assert job.status == ImportJob.Status.RUNNING
+    assert claim_next_import_job() is None
+
+    run_import_job(job)
+    job.refresh_from_db()
+
+    assert job.status == ImportJob.Status.SUCCEEDED
+    assert job.rows_processed == 5
+    assert job.headers_created == 2
+    assert job.items_created == 3
+    assert job.finished_at is not None
+    assert BudgetItem.objects.filter(header__budget=budget).count() == 3
+
+
+@pytest.mark.django_db
+def test_failed_import_job_discards_partial_tree_and_file(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    monkeypatch.setattr(services, "import_budget_from_excel", partial(import_budget_from_excel, batch_size=1))
+    budget = build_budget_with_file(build_workbook_bytes(items=5, bad_price_at=3))
+    enqueue_import(budget)
+
+    job = run_import_job(claim_next_import_job())
+
+    budget.refresh_from_db()
+    assert job.status == ImportJob.Status.FAILED
+    assert "Invalid decimal value" in job.error
+    assert job.items_created == 3
+    assert not BudgetHeader.objects.filter(budget=budget).exists()
+    assert not BudgetItem.objects.filter(header__budget=budget).exists()
+    assert not budget.excel_file
+    assert not list(tmp_path.rglob("*.xlsx"))
+
+
+@pytest.mark.django_db
+def test_import_worker_command_drains_queue(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_budget_with_file(build_workbook_bytes(items=2))
+    enqueue_import(budget)
+
+    call_command("run_import_worker", "--once")
+
+    assert budget.import_jobs.get().status == ImportJob.Status.SUCCEEDED
+    assert BudgetItem.objects.filter(header__budget=budget).count() == 2
+
+
+@pytest.mark.django_db
+def test_abandoned_import_job_is_requeued_then_failed(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.IMPORT_JOB_MAX_ATTEMPTS = 2
+    budget = build_budget_with_file(build_workbook_bytes(items=2))
+    enqueue_import(budget)
+    header = BudgetHeader.objects.create(budget=budget, title="Partial")
+    BudgetItem.objects.create(header=header, description="Partial item")
+
+    job = claim_next_import_job()
+    assert recover_stale_import_jobs() == []
+    ImportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+    assert recover_stale_import_jobs() == [job]
+
+    job.refresh_from_db()
+    assert (job.status, job.attempts, job.started_at) == (ImportJob.Status.QUEUED, 1, None)
+    assert not BudgetHeader.objects.filter(budget=budget).exists()
+
+    assert claim_next_import_job().attempts == 2
+    recover_stale_import_jobs(timeout=0)
+
+    job.refresh_from_db()
+    budget.refresh_from_db()
+    assert job.status == ImportJob.Status.FAILED
+    assert job.error
+    assert not budget.excel_file
+
+
+# The worker runs in autocommit, with each batch in its own transaction.
+@pytest.mark.django_db(transaction=True)
+def test_recovered_import_job_stops_its_old_worker(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_budget_with_file(build_workbook_bytes(items=3))
+    enqueue_import(budget)
+    stale = claim_next_import_job()
+    recover_stale_import_jobs(timeout=0)
+    current = claim_next_import_job()
+
+    assert run_import_job(stale).attempts == 2
+    current.refresh_from_db()
+    assert current.status == ImportJob.Status.RUNNING
+    assert budget.excel_file
+    assert run_import_job(current).status == ImportJob.Status.SUCCEEDED
+    assert BudgetItem.objects.filter(header__budget=budget).count() == 3
+
+
+@pytest.mark.django_db
+def test_import_status_endpoint_is_scoped(settings, tmp_path, client):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    login_budget_manager(client, organization)
+    budget = build_budget_with_file(build_workbook_bytes(), order=build_order(organization))
+    other_budget = build_budget_with_file(build_workbook_bytes())
+    enqueue_import(budget)
+    enqueue_import(other_budget)
+
+    response = client.get(reverse("budgets:budget-import-status", args=[budget.pk]))
+    assert response.status_code == 200
+    assert response.json()["status"] == ImportJob.Status.QUEUED
+    assert response.json()["finished"] is False
+
+    response = client.get(reverse("budgets:budget-import-status", args=[other_budget.pk]))
+    assert response.status_code == 404
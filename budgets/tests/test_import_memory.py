@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from openpyxl import Workbook
+
+from accounts.models import Organization
+from budgets.importers import import_budget_from_excel
+from budgets.models import Budget, BudgetHeader, BudgetItem, ParsedWorkbook
+from construction.models import Construction, Order
+
+SAMPLE_WORKBOOK = Path(django_settings.BASE_DIR) / "ImportExcel" / "APT Kvilda - Rozpočet s VV.xlsx"
+
+IMPORT_SCRIPT = """
+import json
+import resource
+import sys
+
+import django
+
+django.setup()
+
+from django.db import transaction
+
+from budgets.importers import import_budget_from_excel
+from budgets.models import Budget
+
+budget = Budget.objects.get(pk=int(sys.argv[1]))
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with transaction.atomic():
+    items = import_budget_from_excel(budget)
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"items": items, "baseline_kb": baseline, "peak_kb": peak}))
+"""
+
+
+def build_order():
+    organization = Organization.objects.create(name="Alpha Build")
+    construction = Construction.objects.create(name="Site A", organization=organization)
+    return Order.objects.create(name="Order A", construction=construction)
+
+
+def build_synthetic_workbook(path, items, items_per_section=500):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Zakázka")
+    sheet.append(["Typ", "Kód", "Popis", "MJ", "Jedn. Cena"])
+    sheet.append(["Stavba", None, "Stavba A", None, None])
+    for index in range(items):
+        if index % items_per_section == 0:
+            sheet.append(["Oddíl", None, f"Oddil {index // items_per_section}", None, None])
+        sheet.append(["SUB", f"K-{index}", f"Item {index}", "m2", "10,50"])
+    workbook.save(path)
+
+
+@pytest.mark.django_db
+def test_sample_workbook_import_peak_memory(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = Budget.objects.create(
+        order=build_order(),
+        name="Kvilda",
+        excel_file=SimpleUploadedFile("kvilda.xlsx", SAMPLE_WORKBOOK.read_bytes()),
+    )
+
+    tracemalloc.start()
+    try:
+        created = import_budget_from_excel(budget)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert created == BudgetItem.objects.filter(header__budget=budget).count()
+    assert created > 1000
+    # Loading the full workbook DOM peaks at roughly 40 MB for this file.
+    assert peak < 16 * 1024 * 1024
+
+
+@pytest.mark.django_db(transaction=True)
+def test_synthetic_workbook_streams_in_bounded_memory(settings, tmp_path):
+    # The import path the worker runs (stored file, sheet reader, record
+    # parser, parse cache recorder and batched writer) runs in a fresh process
+    # against the test database, so the peak RSS is that of one import.
+    settings.MEDIA_ROOT = tmp_path / "media"
+    path = tmp_path / "synthetic.xlsx"
+    build_synthetic_workbook(path, items=200_000)
+    with path.open("rb") as handle:
+        budget = Budget.objects.create(order=build_order(), name="Synthetic", excel_file=File(handle, name=path.name))
+
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "config.settings",
+        "POSTGRES_DB": connection.settings_dict["NAME"],
+        "MEDIA_ROOT": str(settings.MEDIA_ROOT),
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT, str(budget.pk)],
+        cwd=django_settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["items"] == 200_000
+    assert BudgetHeader.objects.filter(budget=budget).count() == 200_000 // 500 + 1
+    assert report["peak_kb"] - report["baseline_kb"] < 96 * 1024
+    assert all(
+        len(payload) <= django_settings.PARSE_CACHE_MAX_BYTES
+        for payload in ParsedWorkbook.objects.values_list("payload", flat=True)
+    )
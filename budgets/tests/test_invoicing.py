@@ -0,0 +1,191 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets.invoicing import period_invoices
+from budgets.models import BudgetHeader, BudgetItem, BudgetPeriodInvoice
+from budgets.services import accept_period, create_period, decline_period, set_item_amounts, submit_period
+from construction.models import Construction, ContractForWork, Order, Residual
+
+User = get_user_model()
+
+
+def build_order(construction, name):
+    order = Order.objects.create(construction=construction, name=name)
+    budget = order.budgets.create(name=f"Rozpocet {name}")
+    header = BudgetHeader.objects.create(budget=budget, title="Stavba", path="00000")
+    items = [
+        BudgetItem.objects.create(header=header, code="A", description="A", price_for_unit="100.00", vat_rate="21"),
+        BudgetItem.objects.create(header=header, code="B", description="B", price_for_unit="10.00", vat_rate="12"),
+    ]
+    return order, budget, items
+
+
+def run_period(budget, amounts, decline=None):
+    period = create_period(budget)
+    set_item_amounts(period, amounts)
+    submit_period(period)
+    if decline:
+        period = decline_period(period, **decline)
+        submit_period(period)
+    return accept_period(period)
+
+
+@pytest.mark.django_db
+def test_invoice_applies_share_vat_retention_and_deductions():
+    organization = Organization.objects.create(name="Org A")
+    construction = Construction.objects.create(organization=organization, name="Site A")
+    order, budget, (a, b) = build_order(construction, "A")
+    contract = ContractForWork.objects.create(
+        order=order, contract_number="C-1", contractor_share="10.00", day_after_due=30
+    )
+    Residual.objects.create(contract_for_work=contract, percentage=5, end_date=date(2027, 6, 30))
+    Residual.objects.create(contract_for_work=contract, percentage=3)
+
+    first = run_period(budget, {a.pk: "1"})
+    second = run_period(budget, {a.pk: "3", b.pk: "10"}, decline={"penalty": "20.00", "fee": "5.00"})
+
+    invoices = {invoice.period_id: invoice for invoice in period_invoices(Order.objects.all())}
+    invoice = invoices[second.pk]
+    # Drawn: A 100 → 300 (+200 at 21 %), B 0 → 100 (+100 at 12 %).
+    assert (invoice.gross, invoice.contractor_share, invoice.net) == (
+        Decimal("300.00"),
+        Decimal("30.00"),
+        Decimal("270.00"),
+    )
+    assert invoice.vat == Decimal("48.60")
+    assert [(row.percentage, row.amount, row.release_date) for row in invoice.retentions.all()] == [
+        (5, Decimal("13.50"), date(2027, 6, 30)),
+        (3, Decimal("8.10"), None),
+    ]
+    assert (invoice.retention, invoice.deductions, invoice.payable) == (
+        Decimal("21.60"),
+        Decimal("25.00"),
+        Decimal("272.00"),
+    )
+    assert invoice.due_date == timezone.localdate(second.reviewed_at) + timedelta(days=30)
+    assert invoices[first.pk].gross == Decimal("100.00")
+
+    contract.tax_reverse_charge = True
+    contract.save()
+    invoice = {invoice.period_id: invoice for invoice in period_invoices(Order.objects.all())}[second.pk]
+    assert (invoice.reverse_charge, invoice.vat, invoice.payable) == (True, Decimal("0.00"), Decimal("223.40"))
+
+
+@pytest.mark.django_db
+def test_invoices_are_batched_and_cached_across_orders(django_capture_on_commit_callbacks):
+    organization = Organization.objects.create(name="Org A")
+    construction = Construction.objects.create(organization=organization, name="Site A")
+    budgets = []
+    for name in ("A", "B", "C"):
+        order, budget, items = build_order(construction, name)
+        ContractForWork.objects.create(order=order, contract_number=f"C-{name}")
+        with django_capture_on_commit_callbacks(execute=True):
+            run_period(budget, {items[0].pk: "1"})
+        budgets.append((budget, items))
+    orders = Order.objects.filter(construction=construction)
+
+    # Accepting a period computed its invoice after commit; reading is cached.
+    computed_at = dict(BudgetPeriodInvoice.objects.values_list("period_id", "computed_at"))
+    assert len(computed_at) == 3
+    with CaptureQueriesContext(connection) as cached:
+        assert len(period_invoices(orders)) == 3
+    assert dict(BudgetPeriodInvoice.objects.values_list("period_id", "computed_at")) == computed_at
+
+    # A new accepted period in one budget recomputes only that budget's rows.
+    budget, items = budgets[0]
+    period = run_period(budget, {items[0].pk: "4"})
+    invoices = {invoice.period_id: invoice for invoice in period_invoices(orders)}
+    assert invoices[period.pk].gross == Decimal("300.00")
+    assert sum(1 for invoice in invoices.values() if invoice.computed_at != computed_at.get(invoice.period_id)) == 1
+
+    with CaptureQueriesContext(connection) as computed:
+        period_invoices(orders, force=True)
+    assert len(cached) < len(computed)
+
+
+@pytest.mark.django_db
+def test_period_transition_refreshes_invoices_after_commit(django_capture_on_commit_callbacks):
+    organization = Organization.objects.create(name="Org A")
+    construction = Construction.objects.create(organization=organization, name="Site A")
+    order, budget, items = build_order(construction, "A")
+    period = create_period(budget)
+    set_item_amounts(period, {items[0].pk: "1"})
+    submit_period(period)
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        accept_period(period)
+    assert not BudgetPeriodInvoice.objects.filter(period=period).exists()
+
+    callbacks[-1]()
+    assert BudgetPeriodInvoice.objects.get(period=period).gross == Decimal("100.00")
+
+
+@pytest.mark.django_db
+def test_invoice_list_view_scopes_to_construction(client):
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="ceo@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(user=user, organization=organization, role=OrganizationRole.CEO)
+    client.login(username="ceo@example.com", password="StrongPass123!")
+    site_a = Construction.objects.create(organization=organization, name="Site A")
+    site_b = Construction.objects.create(organization=organization, name="Site B")
+    for construction in (site_a, site_b):
+        _order, budget, items = build_order(construction, construction.name)
+        run_period(budget, {items[0].pk: "1"})
+
+    response = client.get(reverse("budgets:period-invoices"))
+    assert len(response.context["invoices"]) == 2
+
+    response = client.get(reverse("budgets:period-invoices"), {"construction": site_b.pk})
+    assert [invoice.order.name for invoice in response.context["invoices"]] == ["Site B"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_retention_schedule_follows_contract_changes_and_rebuilds(client):
+    organization = Organization.objects.create(name="Alpha Build")
+    other = Organization.objects.create(name="Beta Build")
+    user = User.objects.create_user(username="ceo@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(user=user, organization=organization, role=OrganizationRole.CEO)
+    client.login(username="ceo@example.com", password="StrongPass123!")
+    for owner in (organization, other):
+        construction = Construction.objects.create(organization=owner, name=f"Site {owner.pk}")
+        order, budget, items = build_order(construction, owner.name)
+        contract = ContractForWork.objects.create(order=order, contract_number=f"C-{owner.pk}")
+        Residual.objects.create(contract_for_work=contract, percentage=5, end_date=date(2027, 3, 31))
+        run_period(budget, {items[0].pk: "2"})
+    url = reverse("budgets:retention-schedule")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, {"from": "2027-01-01", "to": "2027-12-31"})
+    releases = response.json()["releases"]
+    assert [(row["order_name"], row["release_date"], row["amount"]) for row in releases] == [
+        ("Alpha Build", "2027-03-31", "10.00")
+    ]
+    retention_queries = [query for query in queries if "budgets_budgetperiodretention" in query["sql"]]
+    assert len(retention_queries) == 1
+
+    # Editing a residual reschedules it without any read of the invoices.
+    residual = Residual.objects.get(contract_for_work__order__construction__organization=organization)
+    residual.end_date = date(2028, 1, 31)
+    residual.percentage = 10
+    residual.save()
+    assert client.get(url, {"from": "2027-01-01", "to": "2027-12-31"}).json()["releases"] == []
+    releases = client.get(url, {"from": "2028-01-01", "to": "2028-01-31"}).json()["releases"]
+    assert [row["amount"] for row in releases] == ["20.00"]
+
+    residual.contract_for_work.delete()
+    assert client.get(url, {"from": "2028-01-01", "to": "2028-01-31"}).json()["releases"] == []
+
+    BudgetPeriodInvoice.objects.all().delete()
+    call_command("rebuild_retention_schedule", "--organization", str(other.pk))
+    assert BudgetPeriodInvoice.objects.get().order.construction.organization == other
+
+    assert client.get(url, {"from": "March"}).status_code == 400
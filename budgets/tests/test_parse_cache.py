@@ -0,0 +1,240 @@
+import contextlib
+import hashlib
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.db import connections
+from django.urls import reverse
+from openpyxl import Workbook
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets import importers
+from budgets.importers import PARSER_VERSION, ImportStats, import_budget_from_excel, iter_cached_records
+from budgets.models import Budget, BudgetHeader, BudgetItem, ParsedWorkbook
+from budgets.storage import (
+    WORKBOOK_LOCK_NAMESPACE,
+    HashingMemoryFileUploadHandler,
+    HashingTemporaryFileUploadHandler,
+    delete_unreferenced_workbook,
+    hash_file,
+    release_budget_workbook,
+    save_workbook,
+    workbook_lock_key,
+)
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+
+def build_order(organization=None):
+    organization = organization or Organization.objects.create(name="Alpha Build")
+    construction = Construction.objects.create(name="Site A", organization=organization)
+    return Order.objects.create(name="Order A", construction=construction)
+
+
+def build_workbook_bytes():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka"
+    sheet.append(["Typ", "Kód", "Popis", "MJ", "Jedn. Cena"])
+    sheet.append(["Stavba", "", "Stavba A", "", ""])
+    sheet.append(["Objekt", "", "Objekt 1", "", ""])
+    sheet.append(["SUB", "K-01", "Item 1", "m2", "1 234,50"])
+    sheet.append(["Oddíl", "", "Oddil 1", "", ""])
+    sheet.append(["SUB", "K-02", "Item 2", "kus", 7])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def budget_tree(budget):
+    return sorted(
+        (item.header.title, item.header.parent.title, item.code, item.measure_unit, item.price_for_unit)
+        for item in BudgetItem.objects.filter(header__budget=budget).select_related("header__parent")
+    )
+
+
+def create_budget_via_form(client, order, name):
+    return client.post(
+        reverse("budgets:budget-create"),
+        {
+            "order": order.id,
+            "name": name,
+            "excel_file": SimpleUploadedFile("rozpocet.xlsx", build_workbook_bytes()),
+        },
+    )
+
+
+@pytest.mark.django_db
+def test_identical_uploads_share_one_stored_file(settings, tmp_path, client):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user, organization=organization, role=OrganizationRole.BUDGET_MANAGER
+    )
+    client.login(username="bm@example.com", password="StrongPass123!")
+    order = build_order(organization)
+
+    create_budget_via_form(client, order, "Budget A")
+    create_budget_via_form(client, order, "Budget B")
+
+    first, second = Budget.objects.filter(order=order).order_by("name")
+    assert first.excel_sha256 and first.excel_sha256 == second.excel_sha256
+    assert first.excel_file.name == second.excel_file.name
+    assert len(list(tmp_path.rglob("*.xlsx"))) == 1
+
+    release_budget_workbook(first)
+    assert len(list(tmp_path.rglob("*.xlsx"))) == 1
+    release_budget_workbook(second)
+    assert not list(tmp_path.rglob("*.xlsx"))
+
+
+@pytest.mark.parametrize("handler_class", [HashingMemoryFileUploadHandler, HashingTemporaryFileUploadHandler])
+def test_upload_handlers_hash_while_receiving(handler_class):
+    payload = build_workbook_bytes()
+    handler = handler_class()
+    handler.handle_raw_input(None, {}, len(payload), "boundary")
+    with contextlib.suppress(StopFutureHandlers):
+        handler.new_file("excel_file", "rozpocet.xlsx", "application/octet-stream", len(payload))
+    for start in range(0, len(payload), 1000):
+        handler.receive_data_chunk(payload[start : start + 1000], start)
+    upload = handler.file_complete(len(payload))
+
+    assert upload.sha256 == hashlib.sha256(payload).hexdigest()
+    assert hash_file(upload) == upload.sha256
+
+
+@pytest.mark.django_db
+def test_save_workbook_renames_complete_files_into_place(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    payload = build_workbook_bytes()
+
+    name, sha256 = save_workbook(ContentFile(payload, name="a.xlsx"))
+    assert save_workbook(ContentFile(payload, name="b.xlsx")) == (name, sha256)
+    assert sha256 == hashlib.sha256(payload).hexdigest()
+    assert [path.read_bytes() for path in tmp_path.rglob("*") if path.is_file()] == [payload]
+
+
+@pytest.mark.django_db
+def test_workbook_in_use_by_another_transaction_is_kept(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    # Stored directly: save_workbook would hold the lock for the whole test.
+    budget = Budget.objects.create(
+        order=build_order(), name="Budget A", excel_file=ContentFile(build_workbook_bytes(), name="a.xlsx")
+    )
+    name = budget.excel_file.name
+
+    lock = [WORKBOOK_LOCK_NAMESPACE, workbook_lock_key(name)]
+    other = connections.create_connection("default")
+    try:
+        with other.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s, %s)", lock)
+            release_budget_workbook(budget)
+            assert list(tmp_path.rglob("*.xlsx"))
+            # Unlocked explicitly: the server releases a closed session's
+            # locks only after the close has returned.
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", lock)
+    finally:
+        other.close()
+
+    delete_unreferenced_workbook(name)
+    assert not list(tmp_path.rglob("*.xlsx"))
+
+
+@pytest.mark.django_db
+def test_repeat_import_replays_cached_parse(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    order = build_order()
+    payload = build_workbook_bytes()
+    first = Budget.objects.create(
+        order=order, name="Budget A", excel_file=SimpleUploadedFile("a.xlsx", payload)
+    )
+    second = Budget.objects.create(
+        order=order, name="Budget B", excel_file=SimpleUploadedFile("b.xlsx", payload)
+    )
+
+    assert import_budget_from_excel(first) == 2
+    cached = ParsedWorkbook.objects.get()
+    assert cached.parser_version == PARSER_VERSION
+    assert (cached.rows, cached.headers, cached.items) == (5, 3, 2)
+
+    def no_reader(*args, **kwargs):
+        raise AssertionError("cached workbook must not be opened")
+
+    monkeypatch.setattr(importers, "open_sheet_reader", no_reader)
+    stats = ImportStats()
+    assert import_budget_from_excel(second, stats=stats) == 2
+
+    assert "replay" in stats.stages and "load" not in stats.stages
+    assert budget_tree(second) == budget_tree(first)
+    assert BudgetHeader.objects.filter(budget=second).count() == 3
+
+
+@pytest.mark.django_db
+def test_parses_over_the_size_cap_are_not_cached(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.PARSE_CACHE_MAX_BYTES = 16
+    budget = Budget.objects.create(
+        order=build_order(), name="Budget A", excel_file=SimpleUploadedFile("a.xlsx", build_workbook_bytes())
+    )
+
+    assert import_budget_from_excel(budget) == 2
+    assert BudgetItem.objects.filter(header__budget=budget).count() == 2
+    assert not ParsedWorkbook.objects.exists()
+
+
+@pytest.mark.django_db
+def test_cache_from_older_parser_version_is_ignored(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    budget = Budget.objects.create(
+        order=build_order(), name="Budget A", excel_file=SimpleUploadedFile("a.xlsx", build_workbook_bytes())
+    )
+    import_budget_from_excel(budget)
+    BudgetHeader.objects.filter(budget=budget).delete()
+
+    monkeypatch.setattr(importers, "PARSER_VERSION", PARSER_VERSION + 1)
+    stats = ImportStats()
+    import_budget_from_excel(budget, stats=stats)
+
+    assert "load" in stats.stages
+    assert ParsedWorkbook.objects.count() == 2
+
+
+def test_cached_records_round_trip_across_chunks():
+    recorder = importers.ParseCacheRecorder()
+    root = importers.ParsedHeader(1, "Stavba A")
+    child = importers.ParsedHeader(5, "Oddíl 1", parent=root)
+    records = [root, child] + [
+        importers.ParsedItem(child, f"K-{index}", f"Položka {index}", "m2", Decimal("10.50"))
+        for index in range(2000)
+    ]
+    records.append(importers.ParsedMeasurement(records[-1], 0, "line", " 1\xa0454,656", Decimal("1454.656")))
+    for record in records:
+        recorder.add(record)
+
+    replayed = list(iter_cached_records(recorder.payload()))
+
+    assert len(replayed) == len(records)
+    assert replayed[1].parent is replayed[0]
+    assert replayed[-2].header is replayed[1]
+    assert replayed[-2].description == "Položka 1999"
+    assert replayed[-2].price_for_unit == Decimal("10.50")
+    assert replayed[-1].item is replayed[-2]
+    assert (replayed[-1].kind, replayed[-1].value) == ("line", Decimal("1454.656"))
+
+
+def test_recorder_only_counts_records_past_its_cap():
+    recorder = importers.ParseCacheRecorder(max_bytes=1024)
+    header = importers.ParsedHeader(1, "Stavba A")
+    recorder.add(header)
+    for index in range(2000):
+        recorder.add(importers.ParsedItem(header, f"K-{index}", f"Položka {index}", "m2", Decimal(index)))
+
+    assert recorder.payload() is None
+    assert (recorder.headers, recorder.items) == (1, 2000)
@@ -0,0 +1,121 @@
+import csv
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets.models import BudgetHeader, BudgetItem
+from budgets.reports import ORDER_MOVERS, budget_progress, period_header_deltas, period_item_deltas
+from budgets.services import accept_period, create_period, set_item_amounts, submit_period
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+
+def build_budget(organization=None):
+    organization = organization or Organization.objects.create(name="Org A")
+    construction = Construction.objects.create(organization=organization, name="Site A")
+    order = Order.objects.create(construction=construction, name="Order A")
+    return order.budgets.create(name="Rozpocet A")
+
+
+def build_tree(budget):
+    root = BudgetHeader.objects.create(budget=budget, title="Stavba", path="00000", total_price="240.00")
+    first = BudgetHeader.objects.create(
+        budget=budget, parent=root, title="Objekt 1", path="0000000000", total_price="40.00"
+    )
+    second = BudgetHeader.objects.create(
+        budget=budget, parent=root, title="Objekt 2", path="0000000001", total_price="200.00"
+    )
+    items = [
+        BudgetItem.objects.create(header=first, code="A", description="A", price_for_unit="10.00", quantity=2),
+        BudgetItem.objects.create(header=first, code="B", description="B", price_for_unit="2.50", quantity=8),
+        BudgetItem.objects.create(header=second, code="C", description="C", price_for_unit="100.00", quantity=2),
+    ]
+    return items
+
+
+def run_period(budget, amounts):
+    period = create_period(budget)
+    set_item_amounts(period, amounts)
+    submit_period(period)
+    return accept_period(period)
+
+
+@pytest.mark.django_db
+def test_item_and_header_deltas_between_periods():
+    budget = build_budget()
+    a, b, c = build_tree(budget)
+    one = run_period(budget, {a.pk: "1", b.pk: "4"})
+    two = run_period(budget, {c.pk: "1"})
+    three = run_period(budget, {a.pk: "2", c.pk: "2"})
+
+    page = period_item_deltas(one, three)
+    assert page.count == 3
+    assert [(row["code"], row["base_amount"], row["target_amount"], row["delta_value"]) for row in page.rows] == [
+        ("A", Decimal("1.00"), Decimal("2.00"), Decimal("10.00")),
+        ("B", Decimal("4.00"), Decimal("4.00"), Decimal("0.00")),
+        ("C", Decimal("0"), Decimal("2.00"), Decimal("200.00")),
+    ]
+    assert [row["progress"] for row in page.rows] == [Decimal("100.0"), Decimal("50.0"), Decimal("100.0")]
+
+    movers = period_item_deltas(one, three, order=ORDER_MOVERS, changed_only=True, page_size=1)
+    assert (movers.count, movers.pages, movers.rows[0]["code"], movers.rows[0]["mover_rank"]) == (2, 2, "C", 1)
+    second_page = period_item_deltas(one, three, order=ORDER_MOVERS, changed_only=True, page=2, page_size=1)
+    assert [row["code"] for row in second_page.rows] == ["A"]
+
+    headers = {
+        row["title"]: (row["base_value"], row["target_value"], row["progress"])
+        for row in period_header_deltas(two, three)
+    }
+    assert headers == {
+        "Stavba": (Decimal("120.00"), Decimal("230.00"), Decimal("95.8")),
+        "Objekt 1": (Decimal("20.00"), Decimal("30.00"), Decimal("75.0")),
+        "Objekt 2": (Decimal("100.00"), Decimal("200.00"), Decimal("100.0")),
+    }
+    assert [row["title"] for row in period_header_deltas(None, one, max_depth=0)] == ["Stavba"]
+
+    progress = [(row["delta_value"], row["total_value"], row["progress"]) for row in budget_progress(budget)]
+    assert progress == [
+        (Decimal("20.00"), Decimal("20.00"), Decimal("8.3")),
+        (Decimal("100.00"), Decimal("120.00"), Decimal("50.0")),
+        (Decimal("110.00"), Decimal("230.00"), Decimal("95.8")),
+    ]
+
+
+@pytest.mark.django_db
+def test_comparison_view_pages_and_exports(client):
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(user=user, organization=organization, role=OrganizationRole.BUDGET_MANAGER)
+    client.login(username="bm@example.com", password="StrongPass123!")
+    budget = build_budget(organization)
+    a, b, c = build_tree(budget)
+    one = run_period(budget, {a.pk: "1"})
+    url = reverse("budgets:budget-period-comparison", args=[budget.pk])
+    client.get(url)
+
+    with CaptureQueriesContext(connection) as before:
+        client.get(url)
+    two = run_period(budget, {a.pk: "2", b.pk: "1"})
+    run_period(budget, {c.pk: "1"})
+    with CaptureQueriesContext(connection) as after:
+        response = client.get(url, {"base": one.pk, "target": two.pk})
+
+    assert response.status_code == 200
+    assert len(after) == len(before)
+    assert [row["code"] for row in response.context["page"].rows] == ["A", "B", "C"]
+
+    response = client.get(url, {"base": one.pk, "target": two.pk, "changed_only": "on", "format": "csv"})
+    rows = list(csv.reader(StringIO(b"".join(response.streaming_content).decode())))
+    assert rows[0][:4] == ["path", "header_title", "code", "description"]
+    assert [(row[2], row[9], row[10]) for row in rows[1:]] == [("A", "1.00", "10.00"), ("B", "1.00", "2.50")]
+
+    response = client.get(url, {"base": two.pk, "target": one.pk})
+    assert response.status_code == 200
+    assert "page" not in response.context
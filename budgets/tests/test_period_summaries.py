@@ -0,0 +1,125 @@
+import csv
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets.models import BudgetHeader, BudgetItem, BudgetPeriodHeaderSummary, BudgetPeriodSummary
+from budgets.services import (
+    accept_period,
+    close_period,
+    create_period,
+    decline_period,
+    set_item_amounts,
+    submit_period,
+)
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+
+def build_budget(organization=None):
+    organization = organization or Organization.objects.create(name="Org A")
+    construction = Construction.objects.create(organization=organization, name="Site A")
+    order = Order.objects.create(construction=construction, name="Order A")
+    return order.budgets.create(name="Rozpocet A")
+
+
+def build_tree(budget):
+    root = BudgetHeader.objects.create(budget=budget, title="Stavba", path="00000")
+    first = BudgetHeader.objects.create(budget=budget, parent=root, title="Objekt 1", path="0000000000")
+    second = BudgetHeader.objects.create(budget=budget, parent=root, title="Objekt 2", path="0000000001")
+    items = [
+        BudgetItem.objects.create(header=first, code="A", description="A", price_for_unit="10.00"),
+        BudgetItem.objects.create(header=first, code="B", description="B", price_for_unit="2.50"),
+        BudgetItem.objects.create(header=second, code="C", description="C", price_for_unit="100.00"),
+    ]
+    return root, first, second, items
+
+
+def run_period(budget, amounts, decline=None):
+    period = create_period(budget)
+    set_item_amounts(period, amounts)
+    submit_period(period)
+    if decline:
+        period = decline_period(period, **decline)
+        submit_period(period)
+    accept_period(period)
+    return close_period(period)
+
+
+def header_totals(period):
+    return {
+        header.title: (header.total, header.delta)
+        for header in BudgetPeriodHeaderSummary.objects.filter(summary__period=period)
+    }
+
+
+@pytest.mark.django_db
+def test_closing_period_writes_header_and_budget_snapshot():
+    budget = build_budget()
+    root, first, second, (a, b, c) = build_tree(budget)
+
+    one = run_period(budget, {a.pk: "2", b.pk: "4"})
+    two = run_period(budget, {a.pk: "3", c.pk: "1"}, decline={"payment": "50.00", "fee": "5.00"})
+
+    assert header_totals(one) == {
+        "Stavba": (Decimal("30.00"), Decimal("30.00")),
+        "Objekt 1": (Decimal("30.00"), Decimal("30.00")),
+        "Objekt 2": (Decimal("0.00"), Decimal("0.00")),
+    }
+    # B keeps its earlier amount; A and C were drawn further in period two.
+    assert header_totals(two) == {
+        "Stavba": (Decimal("140.00"), Decimal("110.00")),
+        "Objekt 1": (Decimal("40.00"), Decimal("10.00")),
+        "Objekt 2": (Decimal("100.00"), Decimal("100.00")),
+    }
+    summary = BudgetPeriodSummary.objects.get(period=two)
+    assert (summary.total, summary.delta, summary.items) == (Decimal("140.00"), Decimal("110.00"), 3)
+    assert summary.previous_period == one
+    assert (summary.decline_payment, summary.decline_penalty, summary.decline_fee) == (
+        Decimal("50.00"),
+        None,
+        Decimal("5.00"),
+    )
+
+    second.delete()
+    assert header_totals(two)["Objekt 2"] == (Decimal("100.00"), Decimal("100.00"))
+
+
+@pytest.mark.django_db
+def test_period_history_and_export_read_snapshots(client):
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(user=user, organization=organization, role=OrganizationRole.BUDGET_MANAGER)
+    client.login(username="bm@example.com", password="StrongPass123!")
+    budget = build_budget(organization)
+    _root, _first, _second, items = build_tree(budget)
+    period = run_period(budget, {items[0].pk: "1"})
+    history_url = reverse("budgets:budget-period-history", args=[budget.pk])
+    client.get(history_url)
+
+    with CaptureQueriesContext(connection) as before:
+        client.get(history_url)
+    run_period(budget, {item.pk: "5" for item in items})
+    with CaptureQueriesContext(connection) as after:
+        response = client.get(history_url)
+
+    assert response.status_code == 200
+    assert len(after) == len(before)
+    assert len(response.context["summaries"]) == 2
+
+    response = client.get(reverse("budgets:budget-period-summary-export", args=[budget.pk, period.pk]))
+    rows = list(csv.reader(StringIO(response.content.decode())))
+    assert rows[0] == ["level", "header", "total", "delta"]
+    assert rows[1:4] == [
+        ["0", "Stavba", "10.00", "10.00"],
+        ["1", "Objekt 1", "10.00", "10.00"],
+        ["1", "Objekt 2", "0.00", "0.00"],
+    ]
+    assert rows[4] == ["", "Rozpocet A", "10.00", "10.00"]
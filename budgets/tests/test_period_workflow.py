@@ -1,14 +1,21 @@
+from decimal import Decimal
+
 import pytest
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connections
 
 from accounts.models import Organization
-from budgets.models import BudgetHeader, BudgetItem
+from budgets.models import BudgetHeader, BudgetItem, BudgetItemAmount, BudgetItemLedger, BudgetPeriod
 from budgets.services import (
+    PERIOD_LOCK_NAMESPACE,
+    PeriodConflictError,
     accept_period,
     close_period,
     create_period,
     decline_period,
     set_item_amount,
+    set_item_amounts,
     submit_period,
 )
 from construction.models import Construction, Order
@@ -32,6 +39,24 @@ def build_item(budget):
     )
 
 
+def build_items(budget, count):
+    header = BudgetHeader.objects.create(budget=budget, title="Header")
+    return BudgetItem.objects.bulk_create(
+        [
+            BudgetItem(
+                header=header, organization_id=budget.organization_id, code=f"{index:03}", description=f"Item {index}"
+            )
+            for index in range(count)
+        ]
+    )
+
+
+def close(period):
+    submit_period(period)
+    accept_period(period)
+    close_period(period)
+
+
 @pytest.mark.django_db
 def test_submit_accept_close_flow():
     budget = build_budget()
@@ -118,3 +143,168 @@ def test_decline_fails_if_another_open_period_exists():
         decline_period(period_one)
 
     assert period_two.status == period_two.Status.OPEN
+
+
+@pytest.mark.django_db
+def test_set_item_amounts_upserts_batch_in_constant_queries(django_assert_max_num_queries):
+    budget = build_budget()
+    items = build_items(budget, 300)
+    first = create_period(budget)
+    set_item_amounts(first, {item.pk: "10.00" for item in items})
+    close(first)
+    period = create_period(budget)
+    set_item_amounts(period, {items[0].pk: "10.00"})
+
+    # The period lock, the two validation reads and the upsert, in a savepoint.
+    with django_assert_max_num_queries(6):
+        saved = set_item_amounts(period, {item.pk: Decimal("12.50") for item in items})
+
+    assert saved == 300
+    assert BudgetItemAmount.objects.filter(period=period).count() == 300
+    assert set(BudgetItemAmount.objects.filter(period=period).values_list("amount", flat=True)) == {Decimal("12.50")}
+
+
+@pytest.mark.django_db
+def test_set_item_amounts_reports_every_invalid_item():
+    budget = build_budget()
+    items = build_items(budget, 4)
+    foreign = build_item(build_budget())
+    first = create_period(budget)
+    set_item_amounts(first, {items[0].pk: "100.00"})
+    close(first)
+    period = create_period(budget)
+
+    with pytest.raises(ValidationError) as excinfo:
+        set_item_amounts(
+            period,
+            {
+                items[0].pk: "50.00",
+                items[1].pk: "-1",
+                items[2].pk: "1.234",
+                items[3].pk: "5.00",
+                foreign.pk: "1.00",
+                "abc": "1.00",
+            },
+        )
+
+    invalid = {str(items[0].pk), str(items[1].pk), str(items[2].pk), str(foreign.pk), "abc"}
+    assert set(excinfo.value.message_dict) == invalid
+    assert not BudgetItemAmount.objects.filter(period=period).exists()
+
+
+@pytest.mark.django_db
+def test_set_item_amounts_rejects_a_period_submitted_meanwhile():
+    budget = build_budget()
+    item = build_item(budget)
+    period = create_period(budget)
+    stale = BudgetPeriod.objects.get(pk=period.pk)
+    submit_period(period)
+
+    with pytest.raises(PeriodConflictError):
+        set_item_amounts(stale, {item.pk: "5.00"})
+    assert not BudgetItemAmount.objects.filter(period=period).exists()
+
+
+def ledger_rows(budget):
+    return list(
+        BudgetItemLedger.objects.filter(period__budget=budget)
+        .order_by("budget_item_id")
+        .values_list("budget_item_id", "period_id", "amount", "previous_period_id", "previous_amount")
+    )
+
+
+@pytest.mark.django_db
+def test_ledger_follows_submit_and_decline():
+    budget = build_budget()
+    first_item, second_item = build_items(budget, 2)
+    first = create_period(budget)
+    set_item_amounts(first, {first_item.pk: "100.00"})
+    close(first)
+    period = create_period(budget)
+    set_item_amounts(period, {first_item.pk: "150.00", second_item.pk: "20.00"})
+    assert BudgetItemLedger.objects.get(budget_item=first_item).amount == Decimal("100.00")
+
+    submit_period(period)
+    assert ledger_rows(budget) == [
+        (first_item.pk, period.pk, Decimal("150.00"), first.pk, Decimal("100.00")),
+        (second_item.pk, period.pk, Decimal("20.00"), None, None),
+    ]
+
+    period = decline_period(period)
+    assert ledger_rows(budget) == [(first_item.pk, first.pk, Decimal("100.00"), None, None)]
+    with pytest.raises(ValidationError):
+        set_item_amounts(period, {first_item.pk: "90.00"})
+    set_item_amounts(period, {first_item.pk: "120.00"})
+    submit_period(period)
+    assert BudgetItemLedger.objects.get(budget_item=first_item).previous_amount == Decimal("100.00")
+
+
+@pytest.mark.django_db
+def test_rebuild_amount_ledger_matches_maintained_ledger():
+    budget = build_budget()
+    items = build_items(budget, 3)
+    for step in range(3):
+        period = create_period(budget)
+        set_item_amounts(period, {item.pk: Decimal(10 * step + index) for index, item in enumerate(items[: step + 1])})
+        close(period)
+    set_item_amounts(create_period(budget), {items[0].pk: "99.00"})
+    maintained = ledger_rows(budget)
+
+    BudgetItemLedger.objects.all().delete()
+    call_command("rebuild_amount_ledger", "--budget", str(budget.pk))
+
+    assert ledger_rows(budget) == maintained
+
+
+@pytest.mark.django_db
+def test_create_period_copies_committed_amounts_forward(django_assert_num_queries):
+    budget = build_budget()
+    items = build_items(budget, 3)
+    first = create_period(budget)
+    set_item_amounts(first, {items[0].pk: "10.00", items[1].pk: "20.00"})
+    close(first)
+    second = create_period(budget)
+    set_item_amounts(second, {items[1].pk: "25.00"})
+    close(second)
+    create_period(build_budget(), copy_forward=True)
+
+    with django_assert_num_queries(6):
+        period = create_period(budget, copy_forward=True)
+
+    seeded = dict(BudgetItemAmount.objects.filter(period=period).values_list("budget_item_id", "amount"))
+    assert seeded == {items[0].pk: Decimal("10.00"), items[1].pk: Decimal("25.00")}
+    assert set_item_amounts(period, {items[1].pk: "30.00"}) == 1
+
+
+@pytest.mark.django_db
+def test_transitions_bump_version_and_reject_stale_copies():
+    budget = build_budget()
+    period = create_period(budget)
+    stale = BudgetPeriod.objects.get(pk=period.pk)
+
+    submit_period(period)
+    assert period.version == 1
+
+    with pytest.raises(PeriodConflictError):
+        submit_period(stale)
+
+    accept_period(period)
+    period.refresh_from_db()
+    assert (period.status, period.version) == (period.Status.ACCEPTED, 2)
+
+
+@pytest.mark.django_db
+def test_create_period_fails_fast_while_budget_is_locked():
+    budget = build_budget()
+    other = connections.create_connection("default")
+    try:
+        with other.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s, %s)", [PERIOD_LOCK_NAMESPACE, budget.pk])
+        with pytest.raises(PeriodConflictError):
+            create_period(budget)
+        with other.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [PERIOD_LOCK_NAMESPACE, budget.pk])
+    finally:
+        other.close()
+
+    assert create_period(budget).status == BudgetPeriod.Status.OPEN
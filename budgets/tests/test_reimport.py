@@ -0,0 +1,282 @@
+import json
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from openpyxl import Workbook
+
+from accounts.models import Organization, OrganizationMembership, OrganizationRole
+from budgets.importers import import_budget_from_excel
+from budgets.models import Budget, BudgetHeader, BudgetItem, BudgetItemAmount, BudgetItemMeasurement
+from budgets.reimport import ReimportError, apply_reimport, plan_reimport
+from budgets.services import create_period, set_item_amount
+from budgets.storage import PREVIEW_DIR, hash_file
+from construction.models import Construction, Order
+
+User = get_user_model()
+
+ORIGINAL = [
+    ("Stavba", "", "Stavba A", "", ""),
+    ("Objekt", "", "Objekt 1", "", ""),
+    ("SUB", "K-01", "Item 1", "m2", "10,00"),
+    ("SUB", "K-02", "Item 2", "m2", "20,00"),
+    ("SUB", "K-03", "Item 3", "kus", "30,00"),
+]
+
+REVISED = [
+    ("Stavba", "", "Stavba A", "", ""),
+    ("Objekt", "", "Objekt 1", "", ""),
+    ("SUB", "K-01", "Item 1", "m2", "12,50"),
+    ("SUB", "K-04", "Item 4", "m", "40,00"),
+    ("Objekt", "", "Objekt 2", "", ""),
+    ("SUB", "K-03", "Item 3", "kus", "30,00"),
+]
+
+
+def build_order(organization=None):
+    organization = organization or Organization.objects.create(name="Alpha Build")
+    construction = Construction.objects.create(name="Site A", organization=organization)
+    return Order.objects.create(name="Order A", construction=construction)
+
+
+def build_workbook_bytes(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka"
+    sheet.append(["Typ", "Kód", "Popis", "MJ", "Jedn. Cena"])
+    for row in rows:
+        sheet.append(list(row))
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_imported_budget(order=None):
+    budget = Budget.objects.create(
+        order=order or build_order(),
+        name="Budget A",
+        excel_file=SimpleUploadedFile("budget.xlsx", build_workbook_bytes(ORIGINAL)),
+    )
+    import_budget_from_excel(budget)
+    return budget
+
+
+def plan_revision(budget, tmp_path, rows=REVISED):
+    path = tmp_path / "revised.xlsx"
+    path.write_bytes(build_workbook_bytes(rows))
+    with path.open("rb") as handle:
+        sha256 = hash_file(SimpleUploadedFile("revised.xlsx", handle.read()))
+    return plan_reimport(budget, path, sha256)
+
+
+def items_by_code(budget):
+    return {item.code: item for item in BudgetItem.objects.filter(header__budget=budget).select_related("header")}
+
+
+@pytest.mark.django_db
+def test_reimport_plan_reports_delta(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_imported_budget()
+
+    plan = plan_revision(budget, tmp_path)
+
+    assert [header.title for header in plan.new_headers] == ["Objekt 2"]
+    assert plan.deleted_header_ids == []
+    assert [item.code for item in plan.new_items] == ["K-04"]
+    assert plan.deleted_item_ids == [items_by_code(budget)["K-02"].pk]
+    changes = {change.item.code: change.changes for change in plan.updated_items}
+    assert changes["K-01"] == {"price_for_unit": (Decimal("10.00"), Decimal("12.50"))}
+    assert changes["K-03"] == {"header": ("Stavba A / Objekt 1", "Stavba A / Objekt 2")}
+    assert plan.unchanged_items == 0
+    assert BudgetItem.objects.filter(header__budget=budget).count() == 3
+
+
+@pytest.mark.django_db
+def test_apply_reimport_keeps_item_rows_and_amounts(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_imported_budget()
+    before = items_by_code(budget)
+    period = create_period(budget)
+    set_item_amount(period, before["K-01"], Decimal("5.00"))
+
+    apply_reimport(plan_revision(budget, tmp_path))
+
+    after = items_by_code(budget)
+    assert set(after) == {"K-01", "K-03", "K-04"}
+    assert after["K-01"].pk == before["K-01"].pk
+    assert after["K-01"].price_for_unit == Decimal("12.50")
+    assert after["K-03"].pk == before["K-03"].pk
+    assert after["K-03"].header.title == "Objekt 2"
+    assert after["K-03"].header.parent.title == "Stavba A"
+    assert BudgetItemAmount.objects.get(period=period).budget_item_id == before["K-01"].pk
+    assert not plan_revision(budget, tmp_path).has_changes
+
+
+@pytest.mark.django_db
+def test_reimport_refuses_to_drop_items_with_amounts(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_imported_budget()
+    period = create_period(budget)
+    set_item_amount(period, items_by_code(budget)["K-02"], Decimal("1.00"))
+
+    plan = plan_revision(budget, tmp_path)
+    assert plan.protected_item_ids == [items_by_code(budget)["K-02"].pk]
+    with pytest.raises(ReimportError):
+        apply_reimport(plan)
+    assert "K-02" in items_by_code(budget)
+
+    apply_reimport(plan, force=True)
+    assert "K-02" not in items_by_code(budget)
+    assert not BudgetItemAmount.objects.exists()
+
+
+@pytest.mark.django_db
+def test_reimport_removes_dropped_headers(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_imported_budget()
+
+    apply_reimport(plan_revision(budget, tmp_path, rows=ORIGINAL[:1] + [("SUB", "K-01", "Item 1", "m2", "10,00")]))
+
+    assert list(BudgetHeader.objects.filter(budget=budget).values_list("title", flat=True)) == ["Stavba A"]
+    assert list(items_by_code(budget)) == ["K-01"]
+
+
+@pytest.mark.django_db
+def test_reimport_replaces_changed_measurements_only(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_imported_budget()
+    measured = ORIGINAL[:3] + [("", "Výkaz výměr:", "–", "", ""), ("", "", "2,5", "", "")] + ORIGINAL[3:]
+    apply_reimport(plan_revision(budget, tmp_path, rows=measured))
+    previous = BudgetItemMeasurement.objects.get(budget_item__code="K-01", position=1)
+
+    remeasured = measured[:3] + [("", "Výkaz výměr:", "–", "", ""), ("", "", "4,0", "", "")] + measured[5:]
+    plan = plan_revision(budget, tmp_path, rows=remeasured)
+    assert [change.changes for change in plan.updated_items] == [{"measurements": (2, 2)}]
+    apply_reimport(plan)
+
+    values = BudgetItemMeasurement.objects.filter(budget_item__code="K-01").values_list("value", flat=True)
+    assert list(values) == [None, Decimal("4")]
+    assert not BudgetItemMeasurement.objects.filter(pk=previous.pk).exists()
+    assert not plan_revision(budget, tmp_path, rows=remeasured).has_changes
+
+
+@pytest.mark.django_db
+def test_reimport_command_dry_run(settings, tmp_path, capsys):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_imported_budget()
+    path = tmp_path / "revised.xlsx"
+    path.write_bytes(build_workbook_bytes(REVISED))
+
+    call_command("reimport_budget", str(budget.pk), str(path))
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["applied"] is False
+    assert report["items"] == {"created": 1, "updated": 2, "deleted": 1, "unchanged": 0, "deleted_with_amounts": 0}
+    assert "K-02" in items_by_code(budget)
+
+
+@pytest.mark.django_db
+def test_reimport_view_previews_then_applies(settings, tmp_path, client, django_capture_on_commit_callbacks):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user, organization=organization, role=OrganizationRole.BUDGET_MANAGER
+    )
+    client.login(username="bm@example.com", password="StrongPass123!")
+    budget = build_imported_budget(build_order(organization))
+    url = reverse("budgets:budget-reimport", args=[budget.pk])
+
+    response = client.post(url, {"excel_file": SimpleUploadedFile("revised.xlsx", build_workbook_bytes(REVISED))})
+    assert response.status_code == 200
+    plan = response.context["plan"]
+    assert len(plan.updated_items) == 2
+    assert "K-04" not in items_by_code(budget)
+    assert not Budget.objects.filter(excel_sha256=response.context["confirm_form"].initial["sha256"]).exists()
+
+    confirm = response.context["confirm_form"].initial
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(url, {"apply": "1", "workbook": confirm["workbook"], "sha256": confirm["sha256"]})
+    assert response.status_code == 302
+    budget.refresh_from_db()
+    assert budget.excel_sha256 == confirm["sha256"]
+    assert "K-04" in items_by_code(budget)
+    assert [path.name for path in tmp_path.rglob("*.xlsx")] == [f"{confirm['sha256']}.xlsx"]
+
+    response = client.post(url, {"apply": "1", "workbook": "budgets/excel/../secret.xlsx", "sha256": "0" * 64})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_reimport_view_keeps_the_tree_when_the_workbook_cannot_be_stored(settings, tmp_path, client, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user, organization=organization, role=OrganizationRole.BUDGET_MANAGER
+    )
+    client.login(username="bm@example.com", password="StrongPass123!")
+    budget = build_imported_budget(build_order(organization))
+    url = reverse("budgets:budget-reimport", args=[budget.pk])
+    response = client.post(url, {"excel_file": SimpleUploadedFile("revised.xlsx", build_workbook_bytes(REVISED))})
+    confirm = response.context["confirm_form"].initial
+
+    def failing_replace(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("budgets.storage.replace_budget_workbook", failing_replace)
+    with pytest.raises(OSError):
+        client.post(url, {"apply": "1", "workbook": confirm["workbook"], "sha256": confirm["sha256"]})
+
+    budget.refresh_from_db()
+    assert budget.excel_sha256 != confirm["sha256"]
+    assert "K-04" not in items_by_code(budget)
+    assert (tmp_path / confirm["workbook"]).exists()
+
+
+@pytest.mark.django_db
+def test_unapplied_reimport_previews_expire(settings, tmp_path, client):
+    settings.MEDIA_ROOT = tmp_path
+    settings.WORKBOOK_PREVIEW_MAX_AGE = 0
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="bm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user, organization=organization, role=OrganizationRole.BUDGET_MANAGER
+    )
+    client.login(username="bm@example.com", password="StrongPass123!")
+    budget = build_imported_budget(build_order(organization))
+    url = reverse("budgets:budget-reimport", args=[budget.pk])
+
+    first = client.post(url, {"excel_file": SimpleUploadedFile("revised.xlsx", build_workbook_bytes(REVISED))})
+    abandoned = first.context["confirm_form"].initial
+    client.post(url, {"excel_file": SimpleUploadedFile("revised.xlsx", build_workbook_bytes(ORIGINAL))})
+
+    previews = [path.relative_to(tmp_path).as_posix() for path in (tmp_path / PREVIEW_DIR).iterdir()]
+    assert abandoned["workbook"] not in previews
+    assert len(previews) == 1
+    response = client.post(url, {"apply": "1", "workbook": abandoned["workbook"], "sha256": abandoned["sha256"]})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_reimport_renumbers_headers_after_insert(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    budget = build_imported_budget()
+    objekt = BudgetHeader.objects.get(budget=budget, title="Objekt 1")
+    rows = [ORIGINAL[0], ("Objekt", "", "Objekt 0", "", ""), ("SUB", "K-09", "Item 9", "m", "5,00"), *ORIGINAL[1:]]
+
+    plan = plan_revision(budget, tmp_path, rows=rows)
+    assert plan.moved_headers == {objekt.pk: "0000000001"}
+    apply_reimport(plan)
+
+    headers = list(BudgetHeader.objects.filter(budget=budget))
+    assert [(header.title, header.path) for header in headers] == [
+        ("Stavba A", "00000"),
+        ("Objekt 0", "0000000000"),
+        ("Objekt 1", "0000000001"),
+    ]
+    assert headers[2].pk == objekt.pk
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Organization
+from budgets.models import Budget, BudgetHeader, BudgetItem, BudgetItemAmount
+from budgets.services import accept_period, close_period, create_period, set_item_amounts, submit_period
+from construction.models import Construction, Order
+
+
+def build_budget(organization):
+    construction = Construction.objects.create(organization=organization, name="Site")
+    order = Order.objects.create(construction=construction, name="Order")
+    budget = order.budgets.create(name="Rozpocet")
+    header = BudgetHeader.objects.create(budget=budget, title="Header")
+    item = BudgetItem.objects.create(header=header, description="Item", price_for_unit="10.00")
+    return budget, item
+
+
+def organizations(budget):
+    return {
+        Budget.objects.get(pk=budget.pk).organization_id,
+        *BudgetHeader.objects.filter(budget=budget).values_list("organization_id", flat=True),
+        *BudgetItem.objects.filter(header__budget=budget).values_list("organization_id", flat=True),
+        *BudgetItemAmount.objects.filter(period__budget=budget).values_list("organization_id", flat=True),
+    }
+
+
+@pytest.mark.django_db
+def test_rows_take_the_budget_organization_on_create():
+    organization = Organization.objects.create(name="Org A")
+    budget, item = build_budget(organization)
+    period = create_period(budget)
+    set_item_amounts(period, {item.pk: Decimal("2")})
+    submit_period(period)
+    accept_period(period)
+    close_period(period)
+    create_period(budget, copy_forward=True)
+
+    assert BudgetItemAmount.objects.filter(period__budget=budget).count() == 2
+    assert organizations(budget) == {organization.pk}
+
+
+@pytest.mark.django_db
+def test_moving_construction_order_or_budget_moves_every_row():
+    first = Organization.objects.create(name="Org A")
+    second = Organization.objects.create(name="Org B")
+    budget, item = build_budget(first)
+    set_item_amounts(create_period(budget), {item.pk: Decimal("1")})
+
+    construction = budget.order.construction
+    construction.organization = second
+    construction.save()
+    assert organizations(budget) == {second.pk}
+
+    order = budget.order
+    order.construction = Construction.objects.create(organization=first, name="Other site")
+    order.save()
+    assert organizations(budget) == {first.pk}
+
+    budget.order = Order.objects.create(construction=construction, name="Other order")
+    budget.save()
+    assert budget.organization_id == second.pk
+    assert organizations(budget) == {second.pk}
+
+
+@pytest.mark.django_db
+def test_tenant_filters_do_not_join():
+    organization = Organization.objects.create(name="Org A")
+    other = Organization.objects.create(name="Org B")
+    budget, item = build_budget(organization)
+    build_budget(other)
+    set_item_amounts(create_period(budget), {item.pk: Decimal("1")})
+
+    with CaptureQueriesContext(connection) as queries:
+        assert list(BudgetItemAmount.objects.for_organization(organization).values_list("budget_item", flat=True)) == [
+            item.pk
+        ]
+        assert list(BudgetItem.objects.for_organization(organization)) == [item]
+    assert all("JOIN" not in query["sql"] for query in queries.captured_queries)
@@ -1,3 +1,4 @@
+import json
 from io import BytesIO
 
 import pytest
@@ -7,7 +8,8 @@ from django.urls import reverse
 from openpyxl import Workbook
 
 from accounts.models import Organization, OrganizationMembership, OrganizationRole
-from budgets.models import Budget
+from budgets.models import Budget, BudgetHeader, BudgetItem, BudgetItemAmount
+from budgets.services import create_period
 from construction.models import Construction, Order
 
 User = get_user_model()
@@ -126,3 +128,64 @@ def test_budget_detail_scoped_to_organization(client):
     client.login(username="bm@example.com", password="StrongPass123!")
     response = client.get(reverse("budgets:budget-detail", args=[budget_b.pk]))
     assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_period_amounts_endpoint_accepts_json_and_form(client):
+    organization = Organization.objects.create(name="Alpha Build")
+    user = User.objects.create_user(username="cm@example.com", password="StrongPass123!")
+    OrganizationMembership.objects.create(
+        user=user,
+        organization=organization,
+        role=OrganizationRole.CONSTRUCTION_MANAGER,
+    )
+    budget = Budget.objects.create(order=build_order(organization), name="Budget A")
+    header = BudgetHeader.objects.create(budget=budget, title="Header")
+    first = BudgetItem.objects.create(header=header, code="001", description="Item 1")
+    second = BudgetItem.objects.create(header=header, code="002", description="Item 2")
+    period = create_period(budget)
+    url = reverse("budgets:budget-period-amounts", args=[budget.pk, period.pk])
+    client.login(username="cm@example.com", password="StrongPass123!")
+
+    response = client.post(url, {str(first.pk): "10.00", str(second.pk): "2"}, content_type="application/json")
+    assert response.status_code == 200
+    assert response.json() == {"saved": 2}
+
+    response = client.post(url, {"amounts": json.dumps({str(second.pk): "-5"})})
+    assert response.status_code == 400
+    assert list(response.json()["errors"]) == [str(second.pk)]
+    assert BudgetItemAmount.objects.get(period=period, budget_item=second).amount == 2
+
+    other = Budget.objects.create(order=build_order(Organization.objects.create(name="Beta")), name="Budget B")
+    foreign_period = create_period(other)
+    foreign_url = reverse("budgets:budget-period-amounts", args=[other.pk, foreign_period.pk])
+    assert client.post(foreign_url, {"1": "1"}, content_type="application/json").status_code == 404
+
+
+@pytest.mark.django_db
+def test_period_amounts_endpoint_follows_the_organization_hierarchy(client):
+    parent = Organization.objects.create(name="Alpha Build")
+    subcontractor = Organization.objects.create(name="Sub Build", parent=parent)
+    budget = Budget.objects.create(order=build_order(subcontractor), name="Budget S")
+    item = BudgetItem.objects.create(header=BudgetHeader.objects.create(budget=budget, title="Header"))
+    period = create_period(budget)
+    url = reverse("budgets:budget-period-amounts", args=[budget.pk, period.pk])
+    for username, organization, role in [
+        ("sub@example.com", subcontractor, OrganizationRole.SUB_BUDGET_MANAGER),
+        ("cm@example.com", parent, OrganizationRole.CONSTRUCTION_MANAGER),
+        ("bm@example.com", parent, OrganizationRole.BUDGET_MANAGER),
+    ]:
+        user = User.objects.create_user(username=username, password="StrongPass123!")
+        OrganizationMembership.objects.create(user=user, organization=organization, role=role)
+
+    client.login(username="sub@example.com", password="StrongPass123!")
+    response = client.post(url, {str(item.pk): "1"}, content_type="application/json")
+    assert response.json() == {"saved": 1}
+
+    client.login(username="cm@example.com", password="StrongPass123!")
+    response = client.post(url, {str(item.pk): "2"}, content_type="application/json")
+    assert response.json() == {"saved": 1}
+
+    client.login(username="bm@example.com", password="StrongPass123!")
+    assert client.post(url, {str(item.pk): "3"}, content_type="application/json").status_code == 403
+    assert BudgetItemAmount.objects.get(period=period).amount == 2
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from django.core.management import call_command
+
+from budgets.importers import ParsedHeader, ParsedItem, ParsedMeasurement, find_header_row, iter_budget_records, parse_decimal
+from budgets.workbook_generator import WorkbookSpec, format_dirty_number, generate_budget_workbook
+from budgets.xlsx import FastSheetReader
+
+
+def test_format_dirty_number_uses_nbsp_and_comma():
+    assert format_dirty_number(parse_decimal("1234567.5")) == "1\xa0234\xa0567,50"
+    assert parse_decimal(format_dirty_number(parse_decimal("1234.5"))) == parse_decimal("1234.50")
+
+
+def test_generated_workbook_matches_spec(tmp_path):
+    path = tmp_path / "generated.xlsx"
+    spec = WorkbookSpec(items=200, header_depth=3, items_per_section=10, fanout=2, dirty_ratio=0.5, seed=7)
+
+    generated = generate_budget_workbook(path, spec)
+
+    reader = FastSheetReader(path)
+    rows = reader.iter_rows("Zakázka")
+    _header_row, column_map = find_header_row(rows)
+    records = list(iter_budget_records(rows, column_map))
+    reader.close()
+
+    items = [record for record in records if isinstance(record, ParsedItem)]
+    headers = [record for record in records if isinstance(record, ParsedHeader)]
+    measurements = [record for record in records if isinstance(record, ParsedMeasurement)]
+    assert generated.items == len(items) == 200
+    assert generated.headers == len(headers)
+    assert generated.measurement_lines == len(measurements)
+    assert {header.level for header in headers} == {1, 2, 3}
+    assert all(item.header.level == 3 for item in items)
+    assert generated.measurement_lines > 0
+
+
+def test_generator_rejects_unknown_depth(tmp_path):
+    with pytest.raises(ValueError):
+        generate_budget_workbook(tmp_path / "generated.xlsx", WorkbookSpec(header_depth=6))
+
+
+@pytest.mark.django_db
+def test_benchmark_command_reports_json(tmp_path, capsys):
+    output = tmp_path / "report.json"
+
+    call_command(
+        "benchmark_budget_import",
+        "--items",
+        "300",
+        "--reader",
+        "fast",
+        "--persist",
+        "--output",
+        str(output),
+    )
+
+    report = json.loads(capsys.readouterr().out)
+    assert json.loads(output.read_text(encoding="utf-8")) == report
+    assert report["workbook"]["items"] == 300
+    run = report["runs"][0]
+    assert run["reader"] == "fast"
+    workbook = report["workbook"]
+    assert run["records"] == workbook["items"] + workbook["headers"] + workbook["measurement_lines"]
+    assert run["queries"] > 0
+    assert run["peak_rss_kb"] >= run["baseline_rss_kb"] > 0
+    # Jedn. Cena, Výměra and Cena per item, plus one value per measurement line.
+    assert run["parse_decimal_calls"] == 3 * workbook["items"] + workbook["measurement_lines"]
+    assert {"header", "parse", "parse_decimal", "persist_headers", "persist_items"} <= set(run["phases"])
@@ -0,0 +1,110 @@
+import json
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from openpyxl import Workbook
+
+from accounts.models import Organization
+from budgets import importers
+from budgets.importers import find_header_row, import_budget_from_excel, iter_budget_records
+from budgets.models import Budget, BudgetItem
+from budgets.xlsx import FastSheetReader, OpenpyxlSheetReader, UnsupportedWorkbook
+from construction.models import Construction, Order
+
+SAMPLE_WORKBOOK = Path(django_settings.BASE_DIR) / "ImportExcel" / "APT Kvilda - Rozpočet s VV.xlsx"
+
+
+def build_workbook_bytes():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Zakázka"
+    sheet.append(["Typ", "Kód", "Popis", "MJ", "Jedn. Cena", "Datum"])
+    sheet.append(["Stavba", None, "Stavba A", None, None, None])
+    sheet.append(["SUB", "K-01", "Item 1", "m2", 12.5, datetime(2026, 1, 31)])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def read_records(reader_class, path):
+    reader = reader_class(path)
+    try:
+        rows = reader.iter_rows("Zakázka")
+        _header_row, column_map = find_header_row(rows)
+        reader.select_columns(column_map.indexes)
+        records = []
+        for record in iter_budget_records(rows, column_map):
+            if isinstance(record, importers.ParsedItem):
+                records.append((record.code, record.description, record.measure_unit, record.price_for_unit))
+            elif isinstance(record, importers.ParsedMeasurement):
+                records.append((record.position, record.kind, record.text, record.value))
+            else:
+                records.append((record.level, record.title))
+        return records
+    finally:
+        reader.close()
+
+
+def test_fast_reader_matches_openpyxl_on_sample_workbook():
+    assert read_records(FastSheetReader, SAMPLE_WORKBOOK) == read_records(OpenpyxlSheetReader, SAMPLE_WORKBOOK)
+
+
+def test_fast_reader_decodes_only_selected_columns(tmp_path):
+    path = tmp_path / "budget.xlsx"
+    path.write_bytes(build_workbook_bytes())
+    reader = FastSheetReader(path)
+
+    rows = reader.iter_rows("Zakázka")
+    assert next(rows) == ("Typ", "Kód", "Popis", "MJ", "Jedn. Cena", "Datum")
+    reader.select_columns({0, 4})
+    assert next(rows) == ("Stavba",)
+    assert next(rows) == ("SUB", None, None, None, 12.5)
+    reader.close()
+
+    reader = FastSheetReader(path)
+    rows = list(reader.iter_rows("Zakázka"))
+    assert rows[2][5] == datetime(2026, 1, 31)
+    reader.close()
+
+
+def test_fast_reader_rejects_non_workbook(tmp_path):
+    path = tmp_path / "budget.xlsx"
+    path.write_bytes(b"not a zip archive")
+
+    with pytest.raises(UnsupportedWorkbook):
+        FastSheetReader(path)
+
+
+@pytest.mark.django_db
+def test_import_falls_back_to_openpyxl(settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    organization = Organization.objects.create(name="Alpha Build")
+    construction = Construction.objects.create(name="Site A", organization=organization)
+    order = Order.objects.create(name="Order A", construction=construction)
+    budget = Budget.objects.create(
+        order=order,
+        name="Budget A",
+        excel_file=SimpleUploadedFile("budget.xlsx", build_workbook_bytes()),
+    )
+
+    def unsupported(_file):
+        raise UnsupportedWorkbook("Strict OOXML")
+
+    monkeypatch.setattr("budgets.xlsx.FastSheetReader", unsupported)
+
+    assert import_budget_from_excel(budget) == 1
+    assert BudgetItem.objects.get(header__budget=budget).price_for_unit == 12.5
+
+
+def test_benchmark_command_compares_readers(capsys):
+    call_command("benchmark_budget_import", str(SAMPLE_WORKBOOK))
+
+    report = json.loads(capsys.readouterr().out)
+    runs = {run["reader"]: run for run in report["runs"]}
+    assert set(runs) == {"fast", "openpyxl"}
+    assert runs["fast"]["records"] == runs["openpyxl"]["records"]
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.db.models.functions import Length
+
+from .models import HEADER_PATH_STEP, Budget, BudgetHeader, BudgetItem, BudgetItemLedger
+
+# Header levels rendered with their items per page or fragment; the level below
+# is rendered collapsed and loads from the fragment endpoint when opened.
+TREE_LEVELS = 2
+
+
+@dataclass(eq=False)
+class TreeNode:
+    header: BudgetHeader
+    children: List[TreeNode] = field(default_factory=list)
+    items: List[BudgetItem] = field(default_factory=list)
+    deferred: bool = False
+
+
+@dataclass
+class BudgetTree:
+    budget: Budget
+    roots: List[TreeNode] = field(default_factory=list)
+    items: int = 0
+
+
+def load_budget_tree(
+    budget: Budget,
+    root: Optional[BudgetHeader] = None,
+    levels: int = TREE_LEVELS,
+    with_amounts: bool = True,
+) -> BudgetTree:
+    # One query for headers, one for items and one for their committed amounts
+    # from the ledger, assembled in path order. With ``root`` only its subtree
+    # is read.
+    top_length = len(root.path) if root is not None else HEADER_PATH_STEP
+    deferred_length = top_length + HEADER_PATH_STEP * levels
+    headers = BudgetHeader.objects.filter(budget=budget)
+    if root is not None:
+        headers = headers.filter(path__startswith=root.path)
+    headers = headers.annotate(path_length=Length("path")).filter(path_length__lte=deferred_length).order_by("path")
+
+    tree = BudgetTree(budget=budget)
+    nodes: Dict[str, TreeNode] = {}
+    expanded: Dict[int, TreeNode] = {}
+    for header in headers:
+        node = TreeNode(header=header, deferred=header.path_length == deferred_length)
+        nodes[header.path] = node
+        if not node.deferred:
+            expanded[header.pk] = node
+        parent = nodes.get(header.path[:-HEADER_PATH_STEP])
+        if parent is None:
+            tree.roots.append(node)
+        else:
+            parent.children.append(node)
+
+    if not expanded:
+        return tree
+    items = list(BudgetItem.objects.filter(header_id__in=expanded).order_by("pk"))
+    amounts = latest_item_amounts([item.pk for item in items]) if with_amounts and items else {}
+    for item in items:
+        item.latest_amount = amounts.get(item.pk)
+        expanded[item.header_id].items.append(item)
+    tree.items = len(items)
+    return tree
+
+
+def latest_item_amounts(item_ids: List[int]) -> Dict[int, Decimal]:
+    return dict(BudgetItemLedger.objects.filter(budget_item_id__in=item_ids).values_list("budget_item_id", "amount"))
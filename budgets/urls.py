@@ -7,5 +7,35 @@ app_name = "budgets"
 urlpatterns = [
     path("budgets/", views.BudgetListView.as_view(), name="budget-list"),
     path("budgets/new/", views.BudgetCreateView.as_view(), name="budget-create"),
+    path("budgets/import/", views.BudgetBulkImportView.as_view(), name="budget-bulk-import"),
     path("budgets/<int:pk>/", views.BudgetDetailView.as_view(), name="budget-detail"),
+    path(
+        "budgets/<int:pk>/import-status/",
+        views.BudgetImportStatusView.as_view(),
+        name="budget-import-status",
+    ),
+    path(
+        "budgets/<int:pk>/tree/<int:header_pk>/",
+        views.BudgetTreeFragmentView.as_view(),
+        name="budget-tree",
+    ),
+    path(
+        "budgets/<int:pk>/periods/<int:period_pk>/amounts/",
+        views.BudgetPeriodAmountsView.as_view(),
+        name="budget-period-amounts",
+    ),
+    path("budgets/<int:pk>/periods/", views.BudgetPeriodHistoryView.as_view(), name="budget-period-history"),
+    path(
+        "budgets/<int:pk>/periods/compare/",
+        views.BudgetPeriodComparisonView.as_view(),
+        name="budget-period-comparison",
+    ),
+    path(
+        "budgets/<int:pk>/periods/<int:period_pk>/summary.csv",
+        views.BudgetPeriodSummaryExportView.as_view(),
+        name="budget-period-summary-export",
+    ),
+    path("budgets/<int:pk>/reimport/", views.BudgetReimportView.as_view(), name="budget-reimport"),
+    path("invoices/", views.PeriodInvoiceListView.as_view(), name="period-invoices"),
+    path("invoices/retentions/", views.RetentionScheduleView.as_view(), name="retention-schedule"),
 ]
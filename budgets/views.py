@@ -1,14 +1,39 @@
+import csv
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.views import View
 from django.views.generic import CreateView, DetailView, ListView
 
 from accounts.mixins import OrganizationScopedMixin, RoleRequiredMixin
 from accounts.models import OrganizationRole
+from accounts.services import in_hierarchy
+from construction.models import Construction, Order
 
-from .forms import BudgetForm
-from .importers import ExcelImportError, import_budget_from_excel
-from .models import Budget
+from .bulk_import import OrderResolver, collect_workbooks, queue_budget_workbooks
+from .forms import (
+    BudgetBulkImportForm,
+    BudgetForm,
+    BudgetPeriodAmountsForm,
+    BudgetPeriodComparisonForm,
+    BudgetReimportConfirmForm,
+    BudgetReimportForm,
+)
+from .importers import ExcelImportError
+from .invoicing import period_invoices, upcoming_releases
+from .models import Budget, BudgetHeader, BudgetPeriod, BudgetPeriodSummary
+from .reimport import apply_reimport, plan_reimport
+from .reports import ORDER_PATH, budget_progress, iter_period_item_deltas, period_header_deltas, period_item_deltas
+from .services import enqueue_import, set_item_amounts
+from .storage import apply_preview_workbook, save_preview_workbook
+from .tree import load_budget_tree
 
 
 class BudgetListView(OrganizationScopedMixin, ListView):
@@ -18,8 +43,8 @@ class BudgetListView(OrganizationScopedMixin, ListView):
 
     def get_queryset(self):
         return (
-            Budget.objects.filter(order__construction__organization=self.organization)
-            .select_related("order", "order__construction")
+            Budget.objects.for_hierarchy(self.organization)
+            .select_related("order", "order__construction", "order__construction__organization")
         )
 
 
@@ -30,9 +55,46 @@ class BudgetDetailView(OrganizationScopedMixin, DetailView):
 
     def get_queryset(self):
         return (
-            Budget.objects.filter(order__construction__organization=self.organization)
+            Budget.objects.for_hierarchy(self.organization)
             .select_related("order", "order__construction")
-            .prefetch_related("headers")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["import_job"] = self.object.import_jobs.first()
+        context["tree"] = load_budget_tree(self.object)
+        return context
+
+
+class BudgetTreeFragmentView(OrganizationScopedMixin, View):
+    # Returns the contents of one collapsed header for the budget tree.
+    def get(self, request, pk, header_pk):
+        header = get_object_or_404(
+            BudgetHeader.objects.for_hierarchy(self.organization).select_related("budget"),
+            pk=header_pk,
+            budget_id=pk,
+        )
+        tree = load_budget_tree(header.budget, root=header)
+        return render(
+            request, "budgets/budget_tree_children.html", {"budget": header.budget, "node": tree.roots[0]}
+        )
+
+
+class BudgetImportStatusView(OrganizationScopedMixin, View):
+    def get(self, request, pk):
+        budget = get_object_or_404(Budget.objects.for_organization(self.organization), pk=pk)
+        job = budget.import_jobs.first()
+        if job is None:
+            raise Http404
+        return JsonResponse(
+            {
+                "status": job.status,
+                "finished": job.is_finished,
+                "rows_processed": job.rows_processed,
+                "headers_created": job.headers_created,
+                "items_created": job.items_created,
+                "error": job.error,
+            }
         )
 
 
@@ -51,15 +113,288 @@ class BudgetCreateView(RoleRequiredMixin, CreateView):
         return reverse("budgets:budget-list")
 
     def form_valid(self, form):
-        self.object = None
+        # The workbook structure is validated by the form; the full import runs
+        # in the import worker so large files don't block a web worker.
+        with transaction.atomic():
+            self.object = form.save()
+            if self.object.excel_file:
+                enqueue_import(self.object)
+                return HttpResponseRedirect(reverse("budgets:budget-detail", args=[self.object.pk]))
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class BudgetReimportView(RoleRequiredMixin, View):
+    # Uploading a revised workbook shows a dry-run of the changes; confirming
+    # recomputes the plan from the preview copy and applies only the delta.
+    # The workbook joins the budget's stored files only once it is applied.
+    template_name = "budgets/budget_reimport.html"
+    required_roles = {OrganizationRole.CEO, OrganizationRole.BUDGET_MANAGER}
+
+    def get_budget(self, pk):
+        return get_object_or_404(Budget.objects.for_organization(self.organization), pk=pk)
+
+    def get(self, request, pk):
+        budget = self.get_budget(pk)
+        return render(request, self.template_name, {"budget": budget, "form": BudgetReimportForm()})
+
+    def post(self, request, pk):
+        budget = self.get_budget(pk)
+        if "apply" in request.POST:
+            return self.apply(request, budget)
+
+        form = BudgetReimportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return render(request, self.template_name, {"budget": budget, "form": form})
+        workbook = save_preview_workbook(form.cleaned_data["excel_file"], form.excel_sha256)
+        return self.preview(request, budget, workbook, form.excel_sha256)
+
+    def preview(self, request, budget, workbook, sha256, error=None):
+        storage = budget.excel_file.storage
         try:
+            plan = plan_reimport(budget, storage.path(workbook), sha256)
+        except ExcelImportError as exc:
+            form = BudgetReimportForm()
+            return render(request, self.template_name, {"budget": budget, "form": form, "error": str(exc)})
+        confirm_form = BudgetReimportConfirmForm(initial={"workbook": workbook, "sha256": sha256})
+        context = {"budget": budget, "plan": plan, "confirm_form": confirm_form, "error": error}
+        return render(request, self.template_name, context)
+
+    def apply(self, request, budget):
+        form = BudgetReimportConfirmForm(request.POST)
+        storage = budget.excel_file.storage
+        if not form.is_valid() or not storage.exists(form.cleaned_data["workbook"]):
+            raise Http404
+        workbook = form.cleaned_data["workbook"]
+        sha256 = form.cleaned_data["sha256"]
+        try:
+            plan = plan_reimport(budget, storage.path(workbook), sha256)
+            # The tree and the budget's workbook change together or not at all.
             with transaction.atomic():
-                self.object = form.save()
-                if self.object.excel_file:
-                    import_budget_from_excel(self.object)
+                apply_reimport(plan, force=form.cleaned_data["force"])
+                apply_preview_workbook(budget, workbook, sha256)
         except ExcelImportError as exc:
-            if self.object and self.object.excel_file:
-                self.object.excel_file.delete(save=False)
-            form.add_error("excel_file", str(exc))
-            return self.form_invalid(form)
-        return HttpResponseRedirect(self.get_success_url())
+            return self.preview(request, budget, workbook, sha256, error=str(exc))
+        return HttpResponseRedirect(reverse("budgets:budget-detail", args=[budget.pk]))
+
+
+class BudgetBulkImportView(RoleRequiredMixin, View):
+    # Each workbook in the archive becomes its own budget and ImportJob. Files
+    # are matched to orders by name, falling back to the selected order.
+    template_name = "budgets/budget_bulk_import.html"
+    required_roles = {OrganizationRole.CEO, OrganizationRole.BUDGET_MANAGER}
+
+    def get(self, request):
+        form = BudgetBulkImportForm(organization=self.organization)
+        return render(request, self.template_name, {"form": form})
+
+    def post(self, request):
+        form = BudgetBulkImportForm(request.POST, request.FILES, organization=self.organization)
+        if not form.is_valid():
+            return render(request, self.template_name, {"form": form})
+
+        resolver = OrderResolver(form.fields["order"].queryset, default=form.cleaned_data["order"])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = Path(tmp_dir) / "upload.zip"
+            with archive.open("wb") as output:
+                for chunk in form.cleaned_data["archive"].chunks():
+                    output.write(chunk)
+            extracted = Path(tmp_dir) / "workbooks"
+            extracted.mkdir()
+            try:
+                paths = collect_workbooks(archive, extracted)
+            except ExcelImportError as exc:
+                form.add_error("archive", str(exc))
+                return render(request, self.template_name, {"form": form})
+            summaries = queue_budget_workbooks(paths, resolver)
+        if not summaries:
+            form.add_error("archive", "Archive contains no .xlsx workbooks.")
+        return render(request, self.template_name, {"form": form, "summaries": summaries})
+
+
+class BudgetPeriodAmountsView(RoleRequiredMixin, View):
+    # Saves a batch of item amounts for an open period. Accepts a JSON object
+    # of {item_id: amount} or a form post with the same object in ``amounts``.
+    # Subcontractors fill in the amounts of their own budgets.
+    required_roles = {OrganizationRole.CEO, OrganizationRole.CONSTRUCTION_MANAGER}
+    allow_subcontractors = True
+
+    def post(self, request, pk, period_pk):
+        period = get_object_or_404(
+            BudgetPeriod.objects.filter(in_hierarchy(self.organization, "budget__organization")),
+            pk=period_pk,
+            budget_id=pk,
+        )
+        if request.content_type == "application/json":
+            form = BudgetPeriodAmountsForm({"amounts": request.body.decode()})
+        else:
+            form = BudgetPeriodAmountsForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        try:
+            saved = set_item_amounts(period, form.cleaned_data["amounts"])
+        except ValidationError as exc:
+            errors = exc.message_dict if hasattr(exc, "error_dict") else {"__all__": exc.messages}
+            return JsonResponse({"errors": errors}, status=400)
+        return JsonResponse({"saved": saved})
+
+
+class BudgetPeriodHistoryView(OrganizationScopedMixin, View):
+    # Reads closed-period snapshots only, so the page cost does not depend on
+    # the number of items in the budget.
+    template_name = "budgets/budget_period_history.html"
+
+    def get(self, request, pk):
+        budget = get_object_or_404(Budget.objects.for_organization(self.organization), pk=pk)
+        summaries = BudgetPeriodSummary.objects.filter(budget=budget).order_by("-closed_at")
+        return render(request, self.template_name, {"budget": budget, "summaries": summaries})
+
+
+class BudgetPeriodSummaryExportView(OrganizationScopedMixin, View):
+    def get(self, request, pk, period_pk):
+        summary = get_object_or_404(
+            BudgetPeriodSummary.objects.select_related("budget"),
+            period_id=period_pk,
+            budget_id=pk,
+            budget__organization=self.organization,
+        )
+        response = HttpResponse(content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="budget-{pk}-period-{period_pk}.csv"'
+        writer = csv.writer(response)
+        writer.writerow(["level", "header", "total", "delta"])
+        for header in summary.headers.all():
+            writer.writerow([header.depth, header.title, header.total, header.delta])
+        writer.writerow(["", summary.budget.name, summary.total, summary.delta])
+        for label in ("decline_payment", "decline_penalty", "decline_fee"):
+            value = getattr(summary, label)
+            if value is not None:
+                writer.writerow(["", label, value, ""])
+        return response
+
+
+class EchoBuffer:
+    def write(self, value):
+        return value
+
+
+class BudgetPeriodComparisonView(OrganizationScopedMixin, View):
+    # Deltas, rollups and progress are computed in the database; the page
+    # only holds one page of items.
+    template_name = "budgets/budget_period_comparison.html"
+    header_depth = 1
+
+    def get(self, request, pk):
+        budget = get_object_or_404(Budget.objects.for_organization(self.organization), pk=pk)
+        data = request.GET.copy()
+        if "target" not in data:
+            periods = list(budget.periods.order_by("-pk").values_list("pk", flat=True)[:2])
+            if periods:
+                data["target"] = periods[0]
+            if len(periods) > 1:
+                data["base"] = periods[1]
+        form = BudgetPeriodComparisonForm(data, budget=budget)
+        context = {"budget": budget, "form": form, "progress": budget_progress(budget)}
+        if not form.is_valid():
+            return render(request, self.template_name, context)
+
+        base, target = form.cleaned_data["base"], form.cleaned_data["target"]
+        changed_only = form.cleaned_data["changed_only"]
+        if request.GET.get("format") == "csv":
+            return self.export(budget, base, target, changed_only)
+        page = period_item_deltas(
+            base,
+            target,
+            page=form.cleaned_data["page"] or 1,
+            order=form.cleaned_data["order"] or ORDER_PATH,
+            changed_only=changed_only,
+        )
+        query = data.copy()
+        query.pop("page", None)
+        context.update(
+            base=base,
+            target=target,
+            page=page,
+            query=query.urlencode(),
+            headers=period_header_deltas(base, target, max_depth=self.header_depth),
+        )
+        return render(request, self.template_name, context)
+
+    def export(self, budget, base, target, changed_only):
+        columns = [
+            "path",
+            "header_title",
+            "code",
+            "description",
+            "measure_unit",
+            "quantity",
+            "price_for_unit",
+            "base_amount",
+            "target_amount",
+            "delta_amount",
+            "delta_value",
+            "progress",
+        ]
+        writer = csv.writer(EchoBuffer())
+        rows = (
+            writer.writerow([row[column] for column in columns])
+            for row in iter_period_item_deltas(base, target, changed_only=changed_only)
+        )
+        response = StreamingHttpResponse(
+            (line for chunk in ([writer.writerow(columns)], rows) for line in chunk),
+            content_type="text/csv; charset=utf-8",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="budget-{budget.pk}-periods-{base.pk if base else 0}-{target.pk}.csv"'
+        )
+        return response
+
+
+class PeriodInvoiceListView(RoleRequiredMixin, View):
+    # Payable amounts for accepted periods of every order in the organization,
+    # or of one construction with ``?construction=<pk>``.
+    required_roles = {OrganizationRole.CEO, OrganizationRole.ACCOUNT_MANAGER, OrganizationRole.BUDGET_MANAGER}
+    template_name = "budgets/period_invoices.html"
+
+    def get(self, request):
+        orders = Order.objects.filter(construction__organization=self.organization)
+        construction = None
+        construction_pk = request.GET.get("construction", "")
+        if construction_pk:
+            if not construction_pk.isdigit():
+                raise Http404
+            construction = get_object_or_404(Construction, pk=construction_pk, organization=self.organization)
+            orders = orders.filter(construction=construction)
+        invoices = period_invoices(orders)
+        return render(request, self.template_name, {"construction": construction, "invoices": invoices})
+
+
+class RetentionScheduleView(RoleRequiredMixin, View):
+    # JSON list of retentions released between ``from`` and ``to``
+    # (ISO dates, default: the next 90 days), read from the precomputed
+    # schedule in one query.
+    required_roles = PeriodInvoiceListView.required_roles
+    default_days = 90
+
+    def get(self, request):
+        try:
+            start = date.fromisoformat(request.GET["from"]) if request.GET.get("from") else timezone.localdate()
+            end = (
+                date.fromisoformat(request.GET["to"])
+                if request.GET.get("to")
+                else start + timedelta(days=self.default_days)
+            )
+        except ValueError:
+            return JsonResponse({"errors": {"__all__": ["Dates must be in YYYY-MM-DD format."]}}, status=400)
+        releases = [
+            {
+                "release_date": retention.release_date.isoformat(),
+                "order": retention.invoice.order_id,
+                "order_name": retention.invoice.order.name,
+                "budget": retention.invoice.period.budget_id,
+                "budget_name": retention.invoice.period.budget.name,
+                "period": retention.invoice_id,
+                "percentage": retention.percentage,
+                "amount": str(retention.amount),
+            }
+            for retention in upcoming_releases(self.organization, start, end)
+        ]
+        return JsonResponse({"from": start.isoformat(), "to": end.isoformat(), "releases": releases})
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import random
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+
+from openpyxl import Workbook
+
+from .importers import HEADER_TYPES
+
+COLUMNS = ["Poř.", "Typ", "Kód", "Popis", "MJ", "Výměra", "Jedn. Cena", "Cena"]
+UNITS = ["m2", "m3", "m", "kus", "t", "kpl"]
+
+
+@dataclass(frozen=True)
+class WorkbookSpec:
+    items: int = 5000
+    header_depth: int = 5
+    items_per_section: int = 40
+    fanout: int = 4
+    measurement_density: float = 0.5
+    dirty_ratio: float = 0.2
+    seed: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class GeneratedWorkbook:
+    rows: int = 0
+    headers: int = 0
+    items: int = 0
+    measurement_lines: int = 0
+
+
+def format_dirty_number(value: Decimal) -> str:
+    # Mimics locale-formatted cells: NBSP thousands separator, comma decimals.
+    whole, _, fraction = f"{value:.2f}".partition(".")
+    groups = []
+    while len(whole) > 3:
+        groups.insert(0, whole[-3:])
+        whole = whole[:-3]
+    groups.insert(0, whole)
+    return f"{chr(0xA0).join(groups)},{fraction}"
+
+
+def generate_budget_workbook(path, spec: WorkbookSpec | None = None) -> GeneratedWorkbook:
+    spec = spec or WorkbookSpec()
+    if not 1 <= spec.header_depth <= len(HEADER_TYPES):
+        raise ValueError(f"header_depth must be between 1 and {len(HEADER_TYPES)}.")
+
+    rng = random.Random(spec.seed)
+    header_types = list(HEADER_TYPES)[: spec.header_depth]
+    result = GeneratedWorkbook()
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Zakázka")
+
+    def append(row):
+        sheet.append(row)
+        result.rows += 1
+
+    append(COLUMNS)
+    previous_path = None
+    for index in range(spec.items):
+        if index % spec.items_per_section == 0:
+            # Section N sits under a path derived from N in base ``fanout``; only
+            # the levels that changed since the previous section get a new row.
+            section = index // spec.items_per_section
+            section_path = [
+                section // spec.fanout ** (spec.header_depth - 1 - level)
+                for level in range(spec.header_depth)
+            ]
+            for level, header_type in enumerate(header_types):
+                prefix = section_path[: level + 1]
+                if previous_path is not None and prefix == previous_path[: level + 1]:
+                    continue
+                append([None, header_type, None, f"{header_type} {'.'.join(map(str, prefix))}"])
+                result.headers += 1
+            previous_path = section_path
+
+        quantity = Decimal(rng.randint(1, 500_000)) / 100
+        unit_price = Decimal(rng.randint(100, 2_000_000)) / 100
+        price_cell = format_dirty_number(unit_price) if rng.random() < spec.dirty_ratio else float(unit_price)
+        append(
+            [
+                index + 1,
+                "SUB",
+                f"{rng.randint(100_000_000, 999_999_999)}",
+                f"Položka {index + 1}",
+                rng.choice(UNITS),
+                float(quantity),
+                price_cell,
+                float(quantity * unit_price),
+            ]
+        )
+        result.items += 1
+
+        if rng.random() < spec.measurement_density:
+            append([None, None, "Výkaz výměr:", "–   "])
+            result.measurement_lines += 1
+            for _line in range(rng.randint(1, 3)):
+                append([None, None, None, f" {format_dirty_number(quantity)}"])
+                result.measurement_lines += 1
+
+    workbook.save(path)
+    return result
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import logging
+import posixpath
+import zipfile
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from xml.etree.ElementTree import ParseError, iterparse
+
+from openpyxl import load_workbook
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+logger = logging.getLogger(__name__)
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_REL = f"{REL_NS}/officeDocument"
+SHARED_STRINGS_REL = f"{REL_NS}/sharedStrings"
+STYLES_REL = f"{REL_NS}/styles"
+
+_ROW = f"{{{MAIN_NS}}}row"
+_CELL = f"{{{MAIN_NS}}}c"
+_VALUE = f"{{{MAIN_NS}}}v"
+_TEXT = f"{{{MAIN_NS}}}t"
+_INLINE = f"{{{MAIN_NS}}}is"
+_PHONETIC = f"{{{MAIN_NS}}}rPh"
+_SHEET_DATA = f"{{{MAIN_NS}}}sheetData"
+_STRING_ITEM = f"{{{MAIN_NS}}}si"
+
+
+class UnsupportedWorkbook(Exception):
+    pass
+
+
+class OpenpyxlSheetReader:
+    def __init__(self, file):
+        self.workbook = load_workbook(file, read_only=True, data_only=True)
+        self.sheetnames = self.workbook.sheetnames
+
+    def iter_rows(self, sheet_name: str) -> Iterator[Tuple[object, ...]]:
+        return self.workbook[sheet_name].iter_rows(values_only=True)
+
+    def select_columns(self, columns: Optional[Set[int]]) -> None:
+        pass
+
+    def close(self) -> None:
+        self.workbook.close()
+
+
+class FastSheetReader:
+    # Streams worksheet XML straight out of the .xlsx archive. Values are only
+    # decoded for the selected columns; everything else comes back as ``None``.
+    # Raises UnsupportedWorkbook for packages it cannot read so callers can
+    # fall back to OpenpyxlSheetReader.
+    def __init__(self, file):
+        try:
+            self.archive = zipfile.ZipFile(file)
+        except (zipfile.BadZipFile, OSError) as exc:
+            raise UnsupportedWorkbook("Not a zip package.") from exc
+        try:
+            self._load_workbook_part()
+        except (KeyError, ParseError) as exc:
+            self.archive.close()
+            raise UnsupportedWorkbook(f"Unexpected package layout: {exc}") from exc
+        except UnsupportedWorkbook:
+            self.archive.close()
+            raise
+        self.sheetnames = list(self.sheet_parts)
+        self._columns: Optional[Set[int]] = None
+        self._shared_strings: Optional[List[str]] = None
+
+    def _load_workbook_part(self) -> None:
+        workbook_part = None
+        for rel in self._read_rels("_rels/.rels"):
+            if rel["Type"] == OFFICE_DOCUMENT_REL:
+                workbook_part = rel["Target"].lstrip("/")
+        if workbook_part is None:
+            raise UnsupportedWorkbook("Package has no transitional officeDocument part.")
+
+        base = posixpath.dirname(workbook_part)
+        rels_path = posixpath.join(base, "_rels", posixpath.basename(workbook_part) + ".rels")
+        targets: Dict[str, str] = {}
+        self.shared_strings_part = None
+        self.styles_part = None
+        for rel in self._read_rels(rels_path):
+            target = self._resolve(base, rel["Target"])
+            if rel["Type"] == SHARED_STRINGS_REL:
+                self.shared_strings_part = target
+            elif rel["Type"] == STYLES_REL:
+                self.styles_part = target
+            targets[rel["Id"]] = target
+
+        self.sheet_parts: Dict[str, str] = {}
+        self.epoch = CALENDAR_WINDOWS_1900
+        with self.archive.open(workbook_part) as handle:
+            for _event, elem in iterparse(handle):
+                if elem.tag == f"{{{MAIN_NS}}}workbookPr":
+                    if elem.get("date1904") in {"1", "true"}:
+                        self.epoch = CALENDAR_MAC_1904
+                elif elem.tag == f"{{{MAIN_NS}}}sheet":
+                    target = targets.get(elem.get(f"{{{REL_NS}}}id"))
+                    if target is None or not target.endswith(".xml"):
+                        raise UnsupportedWorkbook(f"Unsupported part for sheet {elem.get('name')}.")
+                    self.sheet_parts[elem.get("name")] = target
+        if not self.sheet_parts:
+            raise UnsupportedWorkbook("Workbook part lists no sheets in the transitional namespace.")
+
+    def _read_rels(self, path: str) -> List[Dict[str, str]]:
+        with self.archive.open(path) as handle:
+            return [
+                dict(elem.attrib)
+                for _event, elem in iterparse(handle)
+                if elem.tag == f"{{{PACKAGE_REL_NS}}}Relationship"
+            ]
+
+    @staticmethod
+    def _resolve(base: str, target: str) -> str:
+        if target.startswith("/"):
+            return target.lstrip("/")
+        return posixpath.normpath(posixpath.join(base, target))
+
+    def select_columns(self, columns: Optional[Set[int]]) -> None:
+        self._columns = set(columns) if columns is not None else None
+
+    def close(self) -> None:
+        self.archive.close()
+
+    def iter_rows(self, sheet_name: str) -> Iterator[Tuple[object, ...]]:
+        shared_strings = self._load_shared_strings()
+        date_styles = self._load_date_styles()
+        next_row = 1
+        with self.archive.open(self.sheet_parts[sheet_name]) as handle:
+            sheet_data = None
+            for event, elem in iterparse(handle, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == _SHEET_DATA:
+                        sheet_data = elem
+                    continue
+                if elem.tag != _ROW:
+                    continue
+                row_number = int(elem.get("r", next_row))
+                while next_row < row_number:
+                    yield ()
+                    next_row += 1
+                yield self._decode_row(elem, shared_strings, date_styles)
+                next_row = row_number + 1
+                if sheet_data is not None:
+                    sheet_data.clear()
+
+    def _decode_row(self, row, shared_strings, date_styles) -> Tuple[object, ...]:
+        columns = self._columns
+        values: Dict[int, object] = {}
+        position = 0
+        for cell in row:
+            if cell.tag != _CELL:
+                continue
+            ref = cell.get("r")
+            if ref:
+                position = column_index(ref)
+            idx = position
+            position += 1
+            if columns is not None and idx not in columns:
+                continue
+            value = self._decode_cell(cell, shared_strings, date_styles)
+            if value is not None:
+                values[idx] = value
+        if not values:
+            return ()
+        row_values: List[object] = [None] * (max(values) + 1)
+        for idx, value in values.items():
+            row_values[idx] = value
+        return tuple(row_values)
+
+    def _decode_cell(self, cell, shared_strings, date_styles) -> object:
+        data_type = cell.get("t", "n")
+        if data_type == "inlineStr":
+            inline = cell.find(_INLINE)
+            return _collect_text(inline) if inline is not None else None
+        raw = cell.findtext(_VALUE)
+        if raw is None:
+            return None
+        if data_type == "s":
+            return shared_strings[int(raw)]
+        if data_type in {"str", "e"}:
+            return raw
+        if data_type == "b":
+            return bool(int(raw))
+        if data_type == "n":
+            number = float(raw) if "." in raw or "E" in raw or "e" in raw else int(raw)
+            if date_styles and int(cell.get("s", 0)) in date_styles:
+                return from_excel(number, self.epoch)
+            return number
+        if data_type == "d":
+            return from_ISO8601(raw)
+        return raw
+
+    def _load_shared_strings(self) -> List[str]:
+        if self._shared_strings is None:
+            strings: List[str] = []
+            if self.shared_strings_part:
+                with self.archive.open(self.shared_strings_part) as handle:
+                    for _event, elem in iterparse(handle):
+                        if elem.tag == _STRING_ITEM:
+                            strings.append(_collect_text(elem))
+                            elem.clear()
+            self._shared_strings = strings
+        return self._shared_strings
+
+    def _load_date_styles(self) -> Set[int]:
+        if not self.styles_part:
+            return set()
+        custom_formats: Dict[int, str] = {}
+        date_styles: Set[int] = set()
+        with self.archive.open(self.styles_part) as handle:
+            in_cell_xfs = False
+            xf_index = 0
+            for event, elem in iterparse(handle, events=("start", "end")):
+                if elem.tag == f"{{{MAIN_NS}}}numFmt" and event == "end":
+                    custom_formats[int(elem.get("numFmtId"))] = elem.get("formatCode", "")
+                elif elem.tag == f"{{{MAIN_NS}}}cellXfs":
+                    in_cell_xfs = event == "start"
+                elif elem.tag == f"{{{MAIN_NS}}}xf" and event == "end" and in_cell_xfs:
+                    format_id = int(elem.get("numFmtId", 0))
+                    format_code = custom_formats.get(format_id, BUILTIN_FORMATS.get(format_id, "General"))
+                    if is_date_format(format_code):
+                        date_styles.add(xf_index)
+                    xf_index += 1
+        return date_styles
+
+
+def _collect_text(elem) -> str:
+    parts = []
+    for child in elem:
+        if child.tag == _TEXT:
+            parts.append(child.text or "")
+        elif child.tag != _PHONETIC:
+            parts.extend(text.text or "" for text in child.iter(_TEXT))
+    return "".join(parts)
+
+
+def column_index(ref: str) -> int:
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + (ord(char.upper()) - 64)
+    return index - 1
+
+
+def open_sheet_reader(file, fast: bool = True):
+    if fast:
+        try:
+            return FastSheetReader(file)
+        except UnsupportedWorkbook as exc:
+            logger.info("Falling back to openpyxl reader: %s", exc)
+            if hasattr(file, "seek"):
+                file.seek(0)
+    return OpenpyxlSheetReader(file)
@@ -41,6 +41,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "accounts.middleware.MembershipMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -78,6 +79,19 @@ DATABASES = {
     }
 }
 
+# Membership lookups are cached only in a cache shared by every process:
+# invalidation has to reach all web workers, so with the per-process default
+# cache each request reads its membership from the database instead.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+MEMBERSHIP_CACHE = "default" if os.environ.get("REDIS_URL") else None
+MEMBERSHIP_CACHE_TIMEOUT = int(os.environ.get("MEMBERSHIP_CACHE_TIMEOUT", "3600"))
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -95,6 +109,34 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
 
+# Uploaded workbooks are read by the import worker as well as the web pods,
+# so in production MEDIA_ROOT must be a volume shared by both.
+MEDIA_URL = "media/"
+MEDIA_ROOT = Path(os.environ.get("MEDIA_ROOT", BASE_DIR / "media"))
+# Django's default handlers, hashing each upload as it is received.
+FILE_UPLOAD_HANDLERS = [
+    "budgets.storage.HashingMemoryFileUploadHandler",
+    "budgets.storage.HashingTemporaryFileUploadHandler",
+]
+
+# A running import job that has not reported progress for this many seconds
+# is treated as abandoned by its worker; it is retried until it has been
+# started IMPORT_JOB_MAX_ATTEMPTS times and then fails.
+IMPORT_JOB_TIMEOUT = int(os.environ.get("IMPORT_JOB_TIMEOUT", "900"))
+IMPORT_JOB_MAX_ATTEMPTS = int(os.environ.get("IMPORT_JOB_MAX_ATTEMPTS", "3"))
+
+# Re-import previews that were not applied within this many seconds are
+# removed from MEDIA_ROOT.
+WORKBOOK_PREVIEW_MAX_AGE = int(os.environ.get("WORKBOOK_PREVIEW_MAX_AGE", "86400"))
+
+# Parses whose compressed records exceed this many bytes are not cached: the
+# recorder holds them in memory until the import ends.
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("PARSE_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+# Limits for zip archives of workbooks, checked before anything is extracted.
+BULK_IMPORT_MAX_FILES = int(os.environ.get("BULK_IMPORT_MAX_FILES", "200"))
+BULK_IMPORT_MAX_BYTES = int(os.environ.get("BULK_IMPORT_MAX_BYTES", str(1024 * 1024 * 1024)))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 LOGIN_URL = "/accounts/login/"
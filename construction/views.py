@@ -5,6 +5,7 @@ from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, DetailView, ListView
 
 from accounts.mixins import OrganizationScopedMixin
+from accounts.services import in_hierarchy
 
 from .forms import ConstructionForm, ContractForWorkForm, OrderForm
 from .models import Construction, ContractForWork, Order
@@ -16,7 +17,7 @@ class ConstructionListView(OrganizationScopedMixin, ListView):
     template_name = "construction/construction_list.html"
 
     def get_queryset(self):
-        return Construction.objects.filter(organization=self.organization)
+        return Construction.objects.filter(in_hierarchy(self.organization)).select_related("organization")
 
 
 class ConstructionDetailView(OrganizationScopedMixin, DetailView):
@@ -25,7 +26,7 @@ class ConstructionDetailView(OrganizationScopedMixin, DetailView):
     template_name = "construction/construction_detail.html"
 
     def get_queryset(self):
-        return Construction.objects.filter(organization=self.organization).prefetch_related("orders")
+        return Construction.objects.filter(in_hierarchy(self.organization)).prefetch_related("orders")
 
 
 class ConstructionCreateView(OrganizationScopedMixin, CreateView):
@@ -44,7 +45,9 @@ class OrderListView(OrganizationScopedMixin, ListView):
     template_name = "construction/order_list.html"
 
     def get_queryset(self):
-        return Order.objects.filter(construction__organization=self.organization).select_related("construction")
+        return Order.objects.filter(in_hierarchy(self.organization, "construction__organization")).select_related(
+            "construction", "construction__organization"
+        )
 
 
 class OrderDetailView(OrganizationScopedMixin, DetailView):
@@ -53,7 +56,9 @@ class OrderDetailView(OrganizationScopedMixin, DetailView):
     template_name = "construction/order_detail.html"
 
     def get_queryset(self):
-        return Order.objects.filter(construction__organization=self.organization).select_related("construction")
+        return Order.objects.filter(in_hierarchy(self.organization, "construction__organization")).select_related(
+            "construction"
+        )
 
 
 class OrderCreateView(OrganizationScopedMixin, CreateView):
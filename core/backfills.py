@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from django.apps import apps
+from django.db import connection, migrations, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import BackfillProgress
+
+# Named data backfills for large tables, run by ``manage.py run_backfills``
+# outside the migrate job. Each backfill is one UPDATE over a primary key
+# range; the runner walks the table in key order, one chunk per transaction,
+# and records the last key so an interrupted run resumes where it stopped.
+# Apps register theirs in a ``backfills`` module.
+#
+# A schema change that needs the data (e.g. a NOT NULL constraint) ships in
+# a later release than the column, with require_backfill(name) before it;
+# the migration adding the column runs restart_backfills(name).
+
+DEFAULT_CHUNK_SIZE = 5000
+
+BACKFILLS: Dict[str, Backfill] = {}
+
+
+class BackfillError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Backfill:
+    name: str
+    model: str
+    # ``{table}`` is the model's table; %(start)s and %(end)s bound the
+    # chunk's primary keys (start exclusive, end inclusive).
+    sql: str
+    description: str = ""
+
+    def table(self) -> Tuple[str, str]:
+        meta = apps.get_model(self.model)._meta
+        return meta.db_table, meta.pk.column
+
+
+def register_backfill(name: str, model: str, sql: str, description: str = "") -> Backfill:
+    if name in BACKFILLS:
+        raise ValueError(f"Backfill {name!r} is already registered.")
+    BACKFILLS[name] = Backfill(name=name, model=model, sql=sql, description=description)
+    return BACKFILLS[name]
+
+
+def registered_backfills() -> Dict[str, Backfill]:
+    autodiscover_modules("backfills")
+    return BACKFILLS
+
+
+def get_backfill(name: str) -> Backfill:
+    try:
+        return registered_backfills()[name]
+    except KeyError:
+        raise BackfillError(f"Unknown backfill {name!r}.") from None
+
+
+def run_backfill(
+    name: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    pause: float = 0.0,
+    max_chunks: Optional[int] = None,
+    on_chunk: Optional[Callable[[BackfillProgress], None]] = None,
+) -> BackfillProgress:
+    # ``pause`` sleeps between chunks to leave room for the application's
+    # own writes; ``max_chunks`` stops early, to be resumed by the next run.
+    backfill = get_backfill(name)
+    table, pk_column = backfill.table()
+    quote = connection.ops.quote_name
+    chunk_sql = (
+        f"SELECT max({quote(pk_column)}), count(*) FROM ("
+        f"SELECT {quote(pk_column)} FROM {quote(table)} WHERE {quote(pk_column)} > %s "
+        f"ORDER BY {quote(pk_column)} LIMIT %s) AS chunk"
+    )
+    progress, _ = BackfillProgress.objects.get_or_create(name=name)
+    chunks = 0
+    while not progress.is_complete and (max_chunks is None or chunks < max_chunks):
+        with transaction.atomic():
+            # The row lock keeps two runners of the same backfill from
+            # processing the same range.
+            progress = BackfillProgress.objects.select_for_update().get(name=name)
+            if progress.is_complete:
+                break
+            with connection.cursor() as cursor:
+                cursor.execute(chunk_sql, [progress.last_pk, chunk_size])
+                end, rows = cursor.fetchone()
+                if end is not None:
+                    cursor.execute(backfill.sql.format(table=quote(table)), {"start": progress.last_pk, "end": end})
+                    progress.rows_updated += max(cursor.rowcount, 0)
+                    progress.last_pk = end
+                    progress.chunks += 1
+            # A short chunk means the end of the table was reached.
+            if rows < chunk_size:
+                progress.completed_at = timezone.now()
+            progress.save()
+        chunks += 1
+        if on_chunk is not None:
+            on_chunk(progress)
+        if pause and not progress.is_complete:
+            time.sleep(pause)
+    return progress
+
+
+def reset_backfill(name: str) -> None:
+    get_backfill(name)
+    BackfillProgress.objects.filter(name=name).delete()
+
+
+def require_backfill(name: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> migrations.RunPython:
+    # Migration operation for a schema change that needs the backfill done.
+    # Empty and small tables are filled inline within one chunk; otherwise the
+    # migration stops until ``manage.py run_backfills`` has finished. The
+    # migration must depend on ("core", "0001_initial").
+    def check(apps, schema_editor):
+        progress = run_backfill(name, chunk_size=chunk_size, max_chunks=1)
+        if not progress.is_complete:
+            raise BackfillError(
+                f"Backfill {name!r} is not complete (at key {progress.last_pk}); "
+                f"run `python manage.py run_backfills {name}` before migrating."
+            )
+
+    return migrations.RunPython(check, migrations.RunPython.noop)
+
+
+def restart_backfills(*names: str) -> migrations.RunPython:
+    # Migration operation for the migration that adds the backfilled column:
+    # progress recorded for an earlier copy of the column (e.g. one removed
+    # by unapplying the migration) no longer counts, in either direction.
+    # The migration must depend on ("core", "0001_initial").
+    def restart(apps, schema_editor):
+        apps.get_model("core", "BackfillProgress").objects.filter(name__in=names).delete()
+
+    return migrations.RunPython(restart, restart)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.backfills import DEFAULT_CHUNK_SIZE, BackfillError, registered_backfills, reset_backfill, run_backfill
+from core.models import BackfillProgress
+
+
+class Command(BaseCommand):
+    help = "Run registered data backfills in resumable chunks; without names, every incomplete one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Backfills to run.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction.")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to wait between chunks.")
+        parser.add_argument("--max-chunks", type=int, help="Stop after this many chunks per backfill.")
+        parser.add_argument("--reset", action="store_true", help="Forget saved progress and start over.")
+        parser.add_argument("--list", action="store_true", help="Show the backfills and their progress.")
+
+    def handle(self, *args, **options):
+        backfills = registered_backfills()
+        names = options["names"] or list(backfills)
+        unknown = [name for name in names if name not in backfills]
+        if unknown:
+            raise CommandError(f"Unknown backfill: {', '.join(unknown)}")
+
+        if options["list"]:
+            progress = BackfillProgress.objects.in_bulk(names)
+            for name in names:
+                state = progress.get(name)
+                if state is None:
+                    status = "pending"
+                elif state.is_complete:
+                    status = f"complete, {state.rows_updated} rows"
+                else:
+                    status = f"at key {state.last_pk}, {state.rows_updated} rows"
+                self.stdout.write(f"{name}: {status}")
+            return
+
+        for name in names:
+            if options["reset"]:
+                reset_backfill(name)
+            try:
+                progress = run_backfill(
+                    name,
+                    chunk_size=options["chunk_size"],
+                    pause=options["pause"],
+                    max_chunks=options["max_chunks"],
+                    on_chunk=self.report_chunk if options["verbosity"] > 1 else None,
+                )
+            except BackfillError as exc:
+                raise CommandError(str(exc)) from exc
+            status = "complete" if progress.is_complete else f"stopped at key {progress.last_pk}"
+            self.stdout.write(f"{name}: {status}, {progress.rows_updated} rows updated.")
+
+    def report_chunk(self, progress):
+        self.stdout.write(f"{progress.name}: at key {progress.last_pk}, {progress.rows_updated} rows")
@@ -0,0 +1,23 @@
+from django.db import models
+
+
+class BackfillProgress(models.Model):
+    # Where a registered backfill (core.backfills) has got to; the runner
+    # resumes after ``last_pk``.
+    name = models.CharField(max_length=100, primary_key=True)
+    last_pk = models.BigIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    rows_updated = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def is_complete(self) -> bool:
+        return self.completed_at is not None
@@ -0,0 +1,54 @@
+import pytest
+from django.core.management import call_command
+
+from accounts.models import Organization
+from budgets.models import BudgetHeader, BudgetItem
+from core.backfills import BackfillError, require_backfill, run_backfill
+from core.models import BackfillProgress
+from construction.models import Construction, Order
+
+
+@pytest.fixture(autouse=True)
+def fresh_progress(db):
+    # Migrating the empty test database completes the budgets backfills.
+    BackfillProgress.objects.all().delete()
+
+
+def build_items(count):
+    organization = Organization.objects.create(name="Org A")
+    construction = Construction.objects.create(organization=organization, name="Site")
+    budget = Order.objects.create(construction=construction, name="Order").budgets.create(name="Rozpocet")
+    header = BudgetHeader.objects.create(budget=budget, title="Header")
+    for index in range(count):
+        BudgetItem.objects.create(header=header, description=f"Item {index}")
+    return organization
+
+
+@pytest.mark.django_db
+def test_backfill_resumes_in_key_order():
+    organization = build_items(5)
+    BudgetItem.objects.update(organization=Organization.objects.create(name="Org B"))
+    items = list(BudgetItem.objects.order_by("pk").values_list("pk", flat=True))
+
+    progress = run_backfill("budgets.item_organization", chunk_size=2, max_chunks=1)
+    assert (progress.last_pk, progress.rows_updated, progress.is_complete) == (items[1], 2, False)
+    assert BudgetItem.objects.filter(organization=organization).count() == 2
+
+    call_command("run_backfills", "budgets.item_organization", chunk_size=2)
+    progress = BackfillProgress.objects.get(name="budgets.item_organization")
+    assert (progress.last_pk, progress.rows_updated, progress.chunks) == (items[-1], 5, 3)
+    assert progress.is_complete
+    assert BudgetItem.objects.filter(organization=organization).count() == 5
+
+
+@pytest.mark.django_db
+def test_migrations_wait_for_large_backfills():
+    build_items(3)
+
+    with pytest.raises(BackfillError):
+        require_backfill("budgets.item_organization", chunk_size=2).code(None, None)
+    require_backfill("budgets.item_organization", chunk_size=2).code(None, None)
+    assert BackfillProgress.objects.get(name="budgets.item_organization").is_complete
+
+    with pytest.raises(BackfillError):
+        run_backfill("budgets.missing")
@@ -0,0 +1,130 @@
+import json
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import OrganizationMembership
+from budgets.models import BudgetHeader, BudgetItem, BudgetItemAmount, BudgetPeriod
+
+# Plans depend on table statistics, so the hot queries are explained against
+# a seeded dataset large enough for a sequential scan or a sort to cost more
+# than the index built for them.
+ORGANIZATIONS = 40
+BUDGETS = 1000
+HEADERS_PER_BUDGET = 10
+ITEMS_PER_HEADER = 5
+PERIODS_PER_BUDGET = 8
+USERS = 5000
+
+SEED_SQL = [
+    f"""
+    INSERT INTO accounts_organization (id, name, created_at)
+    SELECT n, 'Org ' || n, now() FROM generate_series(1, {ORGANIZATIONS}) n
+    """,
+    f"""
+    INSERT INTO construction_construction (id, name, location, created_at, organization_id)
+    SELECT n, 'Site ' || n, '', now(), n FROM generate_series(1, {ORGANIZATIONS}) n
+    """,
+    f"""
+    INSERT INTO construction_order (id, name, created_at, construction_id)
+    SELECT n, 'Order ' || n, now(), n FROM generate_series(1, {ORGANIZATIONS}) n
+    """,
+    f"""
+    INSERT INTO budgets_budget (id, name, created_at, order_id, organization_id, excel_sha256)
+    SELECT n, 'Budget ' || n, now(), (n - 1) % {ORGANIZATIONS} + 1, (n - 1) % {ORGANIZATIONS} + 1, ''
+    FROM generate_series(1, {BUDGETS}) n
+    """,
+    f"""
+    INSERT INTO budgets_budgetheader (id, title, path, budget_id, organization_id, total_price, vat, total_with_vat)
+    SELECT n, 'Header ' || n, lpad(((n - 1) % {HEADERS_PER_BUDGET})::text, 5, '0'), b.id, b.organization_id, 0, 0, 0
+    FROM generate_series(1, {BUDGETS * HEADERS_PER_BUDGET}) n
+    JOIN budgets_budget b ON b.id = (n - 1) / {HEADERS_PER_BUDGET} + 1
+    """,
+    f"""
+    INSERT INTO budgets_budgetitem (id, code, description, measure_unit, price_for_unit, quantity, total_price, vat,
+                                    total_with_vat, header_id, organization_id)
+    SELECT n, lpad((n % 97)::text, 3, '0'), 'Item ' || n, 'm2', 10, 1, 10, 0, 10, h.id, h.organization_id
+    FROM generate_series(1, {BUDGETS * HEADERS_PER_BUDGET * ITEMS_PER_HEADER}) n
+    JOIN budgets_budgetheader h ON h.id = (n - 1) / {ITEMS_PER_HEADER} + 1
+    """,
+    f"""
+    INSERT INTO budgets_budgetperiod (id, budget_id, status, version, created_at)
+    SELECT n, (n - 1) / {PERIODS_PER_BUDGET} + 1,
+           CASE WHEN n % {PERIODS_PER_BUDGET} = 0 THEN 'open' ELSE 'closed' END, 0,
+           now() - ({PERIODS_PER_BUDGET} - (n - 1) % {PERIODS_PER_BUDGET}) * interval '30 days'
+    FROM generate_series(1, {BUDGETS * PERIODS_PER_BUDGET}) n
+    """,
+    # Every item has an amount in the first and the fourth period of its budget.
+    f"""
+    INSERT INTO budgets_budgetitemamount (budget_item_id, period_id, amount, organization_id)
+    SELECT i.id, (h.budget_id - 1) * {PERIODS_PER_BUDGET} + step, step, i.organization_id
+    FROM budgets_budgetitem i
+    JOIN budgets_budgetheader h ON h.id = i.header_id
+    CROSS JOIN (VALUES (1), (4)) AS steps(step)
+    """,
+    f"""
+    INSERT INTO auth_user (id, username, password, first_name, last_name, email, is_superuser, is_staff, is_active,
+                           date_joined)
+    SELECT n, 'user' || n, '', '', '', '', false, false, true, now() FROM generate_series(1, {USERS}) n
+    """,
+    f"""
+    INSERT INTO accounts_organizationmembership (user_id, organization_id, role, created_at)
+    SELECT n, (n - 1) % {ORGANIZATIONS} + 1, 'ceo', now() FROM generate_series(1, {USERS}) n
+    """,
+    "ANALYZE",
+]
+
+AVOIDED_NODES = {"Seq Scan", "Sort", "Incremental Sort"}
+
+
+def seed_large_dataset():
+    with connection.cursor() as cursor:
+        for sql in SEED_SQL:
+            cursor.execute(sql)
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def avoided_nodes(queryset):
+    plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+    return [
+        f"{node['Node Type']} {node.get('Relation Name', '')}".strip()
+        for node in plan_nodes(plan)
+        if node["Node Type"] in AVOIDED_NODES
+    ]
+
+
+def hot_queries():
+    budget, header, item, user, organization = 123, 1231, 6151, 2500, 7
+    period = (budget - 1) * PERIODS_PER_BUDGET + 6
+    return {
+        # create_period / decline_period
+        "open period": BudgetPeriod.objects.filter(budget_id=budget, status=BudgetPeriod.Status.OPEN).order_by(),
+        "periods in default order": BudgetPeriod.objects.filter(budget_id=budget),
+        "previous period": BudgetPeriod.objects.filter(
+            budget_id=budget, created_at__lt=timezone.now() - timedelta(days=90)
+        ).order_by("-created_at")[:1],
+        # Reports and validation: an item's newest amount up to a period.
+        "newest amount": BudgetItemAmount.objects.filter(budget_item_id=item, period_id__lte=period)
+        .order_by("-period_id")
+        .values("amount")[:1],
+        "items in default order": BudgetItem.objects.filter(header_id=header),
+        "headers in default order": BudgetHeader.objects.filter(budget_id=budget),
+        # load_membership, on every request with a cold cache.
+        "membership": OrganizationMembership.objects.filter(user_id=user).order_by("pk")[:1],
+        "organization amounts": BudgetItemAmount.objects.for_organization(organization).values("pk"),
+    }
+
+
+@pytest.mark.django_db
+def test_hot_queries_use_indexes():
+    seed_large_dataset()
+
+    failures = {name: nodes for name, queryset in hot_queries().items() if (nodes := avoided_nodes(queryset))}
+    assert not failures
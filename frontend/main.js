@@ -18,3 +18,53 @@ import "@material/web/textfield/filled-text-field.js";
 import "@material/web/textfield/outlined-text-field.js";
 
 import "./styles.css";
+
+const pollImportStatus = (card) => {
+  const url = card.dataset.importStatusUrl;
+  const progress = card.querySelector("[data-import-progress]");
+  const poll = async () => {
+    const response = await fetch(url, { headers: { Accept: "application/json" } });
+    if (!response.ok) {
+      return;
+    }
+    const job = await response.json();
+    if (job.finished) {
+      window.location.reload();
+      return;
+    }
+    if (progress) {
+      progress.textContent = job.rows_processed;
+    }
+    window.setTimeout(poll, 2000);
+  };
+  window.setTimeout(poll, 2000);
+};
+
+document.querySelectorAll("[data-import-status-url]").forEach((card) => {
+  if (card.dataset.importFinished !== "1") {
+    pollImportStatus(card);
+  }
+});
+
+// Collapsed budget tree nodes load their contents the first time they open.
+const loadTreeNode = async (node) => {
+  const url = node.dataset.treeUrl;
+  delete node.dataset.treeUrl;
+  const response = await fetch(url, { headers: { Accept: "text/html" } });
+  if (!response.ok) {
+    node.dataset.treeUrl = url;
+    return;
+  }
+  node.querySelector(":scope > [data-tree-children]").innerHTML = await response.text();
+};
+
+document.addEventListener(
+  "toggle",
+  (event) => {
+    const node = event.target;
+    if (node.open && node.dataset && node.dataset.treeUrl) {
+      loadTreeNode(node);
+    }
+  },
+  true,
+);